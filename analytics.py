@@ -0,0 +1,144 @@
+# analytics.py
+from collections import namedtuple
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from cache import ALL_KEYS, KeyedCache, invalidate_on_commit
+from extensions import db
+from models import Cow, CowDailyMilkTotal, MilkProduction
+
+DRY_GAP_DAYS = 45 # A break in milk records at least this long ends a lactation
+LACTATION_DAYS = 305
+HISTORY_DAYS = 730 # How far back to read; comfortably longer than one lactation
+RANKING_SORTS = ('avg_30d', 'avg_7d', 'peak_yield', 'yield_305d', 'days_in_milk')
+
+CowMetrics = namedtuple('CowMetrics', [
+    'cow_id', 'lactation_start', 'last_record', 'days_in_milk', 'avg_7d', 'avg_30d',
+    'peak_yield', 'peak_date', 'yield_305d', 'morning_evening_ratio',
+])
+
+
+# CowMetrics per cow id, tagged with the as-of date they were computed for. Entries are dropped when that
+# cow's milk records change in this process, and expire after `ttl` seconds so other workers' writes show up too.
+cow_metrics_cache = KeyedCache()
+
+
+def compute_cow_metrics(cow_ids, as_of):
+    """
+    Computes CowMetrics for cow_ids from the per-cow daily rollup in a few
+    vectorized pandas passes over the whole set (no per-row Python).
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = db.session.execute(
+        select(CowDailyMilkTotal.cow_id, CowDailyMilkTotal.date,
+               CowDailyMilkTotal.morning_qty_liters, CowDailyMilkTotal.evening_qty_liters)
+        .where(CowDailyMilkTotal.cow_id.in_(cow_ids),
+               CowDailyMilkTotal.date > as_of - timedelta(days=HISTORY_DAYS),
+               CowDailyMilkTotal.date <= as_of)
+        .order_by(CowDailyMilkTotal.cow_id, CowDailyMilkTotal.date)
+    ).all()
+    empty = {cow_id: CowMetrics(cow_id, *([None] * 9)) for cow_id in cow_ids}
+    if not rows:
+        return empty
+
+    frame = pd.DataFrame(rows, columns=['cow_id', 'date', 'morning', 'evening'])
+    frame['date'] = pd.to_datetime(frame['date'])
+    frame['total'] = frame['morning'] + frame['evening']
+    by_cow = frame.groupby('cow_id', sort=False)
+
+    # Split each cow's history into lactations at dry gaps and keep the latest one
+    gap_days = by_cow['date'].diff().dt.days
+    new_lactation = (gap_days.isna() | (gap_days >= DRY_GAP_DAYS)).astype(np.int64)
+    frame['lactation'] = new_lactation.groupby(frame['cow_id']).cumsum()
+    current = frame[frame['lactation'] == frame.groupby('cow_id')['lactation'].transform('max')].copy()
+    by_lactation = current.groupby('cow_id')
+    start = by_lactation['date'].transform('min')
+    current['day'] = (current['date'] - start).dt.days
+
+    as_of_ts = pd.Timestamp(as_of)
+    age = (as_of_ts - frame['date']).dt.days
+    last_7 = frame[age < 7].groupby('cow_id')['total'].mean()
+    last_30 = frame[age < 30].groupby('cow_id')
+    peak_index = by_lactation['total'].idxmax()
+
+    summary = pd.DataFrame({
+        'lactation_start': by_lactation['date'].min(),
+        'last_record': by_lactation['date'].max(),
+        'yield_305d': current[current['day'] < LACTATION_DAYS].groupby('cow_id')['total'].sum(),
+        'peak_yield': current.loc[peak_index, ['cow_id', 'total']].set_index('cow_id')['total'],
+        'peak_date': current.loc[peak_index, ['cow_id', 'date']].set_index('cow_id')['date'],
+        'avg_7d': last_7,
+        'avg_30d': last_30['total'].mean(),
+        'morning_30d': last_30['morning'].sum(),
+        'evening_30d': last_30['evening'].sum(),
+    })
+    summary['days_in_milk'] = (summary['last_record'] - summary['lactation_start']).dt.days + 1
+    summary['morning_evening_ratio'] = summary['morning_30d'] / summary['evening_30d'].replace(0, np.nan)
+
+    def value(row, column, digits=None):
+        item = row[column]
+        if pd.isna(item):
+            return None
+        if isinstance(item, pd.Timestamp):
+            return item.date()
+        return round(float(item), digits) if digits is not None else int(item)
+
+    metrics = dict(empty)
+    for cow_id, row in summary.iterrows(): # One row per cow, not per record
+        metrics[int(cow_id)] = CowMetrics(
+            int(cow_id), value(row, 'lactation_start'), value(row, 'last_record'), value(row, 'days_in_milk'),
+            value(row, 'avg_7d', 2), value(row, 'avg_30d', 2), value(row, 'peak_yield', 2),
+            value(row, 'peak_date'), value(row, 'yield_305d', 1), value(row, 'morning_evening_ratio', 2),
+        )
+    return metrics
+
+
+def get_cow_metrics(cow_id, as_of, ttl):
+    return cow_metrics_cache.get_many([cow_id], ttl, lambda ids: compute_cow_metrics(ids, as_of), tag=as_of)[cow_id]
+
+
+def herd_ranking(as_of, ttl, sort='avg_30d', status='active'):
+    """[(cow name, cow tag, CowMetrics)] best first; cows without recent records go last."""
+    if sort not in RANKING_SORTS:
+        sort = 'avg_30d'
+    query = db.session.query(Cow.id, Cow.name, Cow.cow_id)
+    if status:
+        query = query.filter(Cow.status == status)
+    cows = query.all()
+    metrics = cow_metrics_cache.get_many([cow.id for cow in cows], ttl,
+                                         lambda ids: compute_cow_metrics(ids, as_of), tag=as_of)
+    ranking = [(cow.name, cow.cow_id, metrics[cow.id]) for cow in cows]
+    ranking.sort(key=lambda item: (getattr(item[2], sort) is None, -(getattr(item[2], sort) or 0)))
+    return ranking
+
+
+# --- Invalidation: a committed change to a cow's milk records drops only that cow ---
+def _flushed_milk_writes(session):
+    cow_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, MilkProduction):
+            cow_ids.add(obj.cow_id)
+            history = db.inspect(obj).attrs.cow_id.history
+            cow_ids.update(history.deleted or ())
+        elif isinstance(obj, Cow) and obj in session.deleted:
+            cow_ids.add(obj.id)
+    return {cow_id for cow_id in cow_ids if cow_id is not None}
+
+
+def _bulk_milk_writes(orm_execute_state):
+    # Only the source table: rollup writes always accompany a MilkProduction change flagged here or at flush
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, MilkProduction):
+        return None
+    parameters = orm_execute_state.parameters
+    rows = parameters if isinstance(parameters, list) else [parameters] if parameters else []
+    if orm_execute_state.is_insert and rows and all('cow_id' in row for row in rows):
+        # Bulk inserts (imports, batch logging) carry their cow ids
+        return {row['cow_id'] for row in rows}
+    return ALL_KEYS # Criteria-based UPDATE/DELETE: scope unknown
+
+
+invalidate_on_commit(cow_metrics_cache, 'analytics', _flushed_milk_writes, _bulk_milk_writes)
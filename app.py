@@ -1,28 +1,64 @@
 # app.py
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
-from models import Cow, MilkProduction, HealthRecord, Customer, Sale, Payment, Expense, User, Vaccination
+import json
+import uuid
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, send_file, send_from_directory, g
+from models import Cow, MilkProduction, HealthRecord, Customer, Sale, Payment, Expense, User, Vaccination, CowDailyMilkTotal, Job, ApiToken
 from datetime import date, datetime, timedelta
-from sqlalchemy import func, extract
+from sqlalchemy.orm import joinedload
 from config import Config
 import click # Still needed for create-admin-user
-import pandas as pd
-import io
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from extensions import db, login_manager # From extensions.py
+from auth import load_cached_user, login_throttle
+from exports import export_response, write_export
+from backup import BackupError, create_backup, restore_backup
+from syncapi import api_token_required, create_api_token, sync_batch
+from changelog import MAX_CHANGES_PAGE, TRACKED_TABLES, UnknownVersion, changes_since, init_change_log, latest_version
+from jobs import JobRunner, enqueue_job, in_web_worker, init_job_runner, job_handler, job_runner_alive
+from pagination import keyset_paginate
+from querybudget import init_query_budget, query_budget
+from dashboard import get_dashboard_snapshot
+from milkbatch import load_batch_rows, milk_quantities, save_milk_batch
+from fields import FieldError
+from importer import IMPORT_KINDS, run_import
+from ledger import adjust_customer_balance, sale_total, to_money
+from search import SEARCH_SOURCES, search_records
+from reports import (AGING_BUCKETS, profit_loss_summary, profit_loss_transactions, receivables_aging,
+                     receivables_aging_totals, sync_sale_paid_flags)
+from rollups import rebuild_milk_rollups, record_milk_added, record_milk_removed, remove_cow_from_rollups
+from migrations import MIGRATIONS, applied_versions, upgrade
+from queryplans import explain, full_scan_lines, main_route_queries
+from dbpool import engine_options, init_db_pool, pool_status
+from metrics import init_metrics, metrics_response
+from analytics import RANKING_SORTS, get_cow_metrics, herd_ranking
+from timeseries import milk_series
+from sqldates import DATE_BUCKETS
+from statements import STATEMENT_FORMATS, generate_statements, statement_archive_name
+from vaccinations import VACCINATION_STATUSES, init_status_timer, refresh_vaccination_statuses, vaccination_status
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+if app.config['PROXY_FIX_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'], x_proto=app.config['PROXY_FIX_HOPS'])
 
 db.init_app(app)
+init_db_pool(app)
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
+init_query_budget(app)
+init_metrics(app)
+init_status_timer(app)
+init_job_runner(app)
+init_change_log(app) # Last: its bulk-insert listener ends the do_orm_execute chain
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return load_cached_user(int(user_id), app.config['USER_CACHE_TTL'])
 
 # --- Context Processor ---
 @app.context_processor
@@ -33,18 +69,41 @@ def inject_common_variables():
         'current_user': current_user
     }
 
-# --- Database Schema Creation on App Startup (NEW STRATEGY) ---
-# This block runs when the app is created and ensures tables exist.
-# It's put after db.init_app(app) and before routes.
-with app.app_context():
-    # It's safe to call create_all multiple times; SQLAlchemy only creates missing tables.
-    db.create_all()
-    # Adding a print statement here to confirm in Render logs
-    print("Database tables ensured (create_all called during app startup).")
+# --- Database Schema ---
+# The schema is no longer created at import: run `flask --app app db-upgrade` once per deploy
+# (the Procfile's release step does this) to apply pending migrations from migrations.py.
 
 
-# --- Flask CLI Custom Commands (Only create-admin-user remains) ---
-# REMOVE: @app.cli.command("create-db") entire block
+# --- Flask CLI Custom Commands ---
+@app.cli.command("db-upgrade")
+@click.option('--to', 'target', default=None, type=int, help='Stop after this migration version.')
+def db_upgrade_command(target):
+    """Applies pending schema migrations."""
+    with app.app_context():
+        applied = upgrade(target, progress=lambda version, name: click.echo(f"  applied {version}: {name}"))
+    click.echo(f"{len(applied)} migrations applied.")
+
+@app.cli.command("db-status")
+def db_status_command():
+    """Lists schema migrations and whether each has been applied."""
+    with app.app_context():
+        applied = applied_versions()
+    for version, name, _ in MIGRATIONS:
+        click.echo(f"  [{'x' if version in applied else ' '}] {version}: {name}")
+
+@app.cli.command("explain-queries")
+def explain_queries_command():
+    """Prints the query plans behind the main routes and flags full table scans."""
+    with app.app_context():
+        flagged = 0
+        for label, query in main_route_queries(app.config['VACCINATION_DUE_WINDOW_DAYS']):
+            plan = explain(query)
+            scans = full_scan_lines(plan)
+            flagged += bool(scans)
+            click.echo(f"{'!! ' if scans else 'ok '}{label}")
+            for line in plan:
+                click.echo(f"      {line}")
+    click.echo(f"{flagged} queries need a full scan or sort (small tables may legitimately scan on Postgres).")
 
 @app.cli.command("create-admin-user")
 @click.argument('username')
@@ -63,6 +122,125 @@ def create_admin_user_command(username, password):
         db.session.commit()
         click.echo(f"Admin user '{username}' created successfully!")
 
+@app.cli.command("rebuild-milk-rollups")
+def rebuild_milk_rollups_command():
+    """Recomputes the daily milk rollup tables from MilkProduction."""
+    with app.app_context():
+        rebuild_milk_rollups()
+        db.session.commit()
+        click.echo("Daily milk rollups rebuilt.")
+
+@app.cli.command("refresh-vaccination-statuses")
+def refresh_vaccination_statuses_command():
+    """Recomputes Due/Overdue/Scheduled/Completed for every vaccination (run daily)."""
+    with app.app_context():
+        updated = refresh_vaccination_statuses(date.today(), app.config['VACCINATION_DUE_WINDOW_DAYS'])
+        db.session.commit()
+    click.echo("Vaccination statuses refreshed: " + ", ".join(f"{count} -> {status}" for status, count in updated.items()))
+
+@app.cli.command("sync-sale-paid-flags")
+def sync_sale_paid_flags_command():
+    """Marks sales paid/unpaid from FIFO allocation of each customer's payments."""
+    with app.app_context():
+        marked_paid, marked_unpaid = sync_sale_paid_flags()
+        db.session.commit()
+    click.echo(f"{marked_paid} sales marked paid, {marked_unpaid} marked unpaid.")
+
+@app.cli.command("generate-statements")
+@click.option('--start', 'start_str', required=True, help='First day of the period (YYYY-MM-DD).')
+@click.option('--end', 'end_str', required=True, help='Last day of the period (YYYY-MM-DD).')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(STATEMENT_FORMATS),
+              help='Repeat for several formats (default: all).')
+@click.option('--workers', default=None, type=int, help='Render processes (default: STATEMENT_WORKERS).')
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='Archive path (default: STATEMENT_DIR).')
+def generate_statements_command(start_str, end_str, formats, workers, output):
+    """Writes every customer's statement for a period into one zip archive."""
+    try:
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date()
+    except ValueError:
+        raise click.BadParameter("Dates must be YYYY-MM-DD.")
+    output = output or os.path.join(app.config['STATEMENT_DIR'], statement_archive_name(start_date, end_date))
+    with app.app_context():
+        count = generate_statements(start_date, end_date, output, formats=formats or STATEMENT_FORMATS,
+                                    batch_size=app.config['STATEMENT_BATCH_SIZE'],
+                                    workers=workers if workers is not None else app.config['STATEMENT_WORKERS'],
+                                    progress=lambda done, total: click.echo(f"  {done}/{total} statements"))
+    click.echo(f"{count} statements written to {output}")
+
+@app.cli.command("run-jobs")
+@click.option('--once', is_flag=True, help='Exit when the queue is empty instead of polling forever.')
+def run_jobs_command(once):
+    """Runs queued background jobs (exports, statements) with JOB_CONCURRENCY threads."""
+    click.echo(f"Running jobs with concurrency {app.config['JOB_CONCURRENCY']}...")
+    JobRunner(app).run_forever(once=once)
+
+@app.cli.command("backup")
+@click.option('--output', default=None, type=click.Path(dir_okay=False), help='Archive path (default: BACKUP_DIR).')
+def backup_command(output):
+    """Writes every table to one compressed backup archive."""
+    output = output or os.path.join(app.config['BACKUP_DIR'], backup_filename())
+    with app.app_context():
+        counts = create_backup(output, progress=lambda table, rows: click.echo(f"  {table}: {rows} rows"))
+    click.echo(f"{sum(counts.values())} rows backed up to {output}")
+
+@app.cli.command("restore")
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Delete all existing rows first (otherwise the database must be empty).')
+def restore_command(path, replace):
+    """Loads a backup archive into the configured database (migrating it first)."""
+    if replace:
+        click.confirm('This deletes every row in the target database. Continue?', abort=True)
+    with app.app_context():
+        try:
+            counts = restore_backup(path, replace=replace,
+                                    progress=lambda table, rows: click.echo(f"  {table}: {rows} rows"))
+        except BackupError as e:
+            raise click.ClickException(str(e))
+    click.echo(f"{sum(counts.values())} rows restored from {path}")
+
+@app.cli.command("create-api-token")
+@click.argument('name')
+@click.option('--user', 'username', default=None, help='Username the token acts for (informational).')
+def create_api_token_command(name, username):
+    """Issues a sync API token for a tablet/collector. The token is printed once."""
+    with app.app_context():
+        user = User.query.filter_by(username=username).first() if username else None
+        if username and user is None:
+            raise click.ClickException(f"No user '{username}'.")
+        token = create_api_token(name, user.id if user else None)
+        db.session.commit()
+    click.echo(f"API token for '{name}' (store it now, it is not shown again):")
+    click.echo(token)
+
+@app.cli.command("revoke-api-token")
+@click.argument('name')
+def revoke_api_token_command(name):
+    """Revokes every sync API token issued under NAME."""
+    with app.app_context():
+        revoked = ApiToken.query.filter_by(name=name, revoked=False).update({ApiToken.revoked: True})
+        db.session.commit()
+    click.echo(f"{revoked} tokens revoked.")
+
+@app.cli.command("import-data")
+@click.argument('kind', type=click.Choice(IMPORT_KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=None, type=int, help='Rows per bulk insert/commit.')
+@click.option('--create-customers', is_flag=True, help='Create customers that do not exist yet (sales/payments).')
+def import_data_command(kind, path, chunk_size, create_customers):
+    """Bulk-imports historical records from a CSV or XLSX file."""
+    def report_progress(result):
+        click.echo(f"  {result.processed} rows read, {result.imported} imported, {result.error_count} errors")
+
+    with app.app_context(), open(path, 'rb') as fileobj:
+        result = run_import(kind, fileobj, path, chunk_size=chunk_size or app.config['IMPORT_CHUNK_SIZE'],
+                            create_customers=create_customers, progress=report_progress)
+    for line, message in result.errors:
+        click.echo(f"  line {line}: {message}" if line else f"  {message}")
+    if result.error_count > len(result.errors):
+        click.echo(f"  ... and {result.error_count - len(result.errors)} more errors")
+    click.echo(f"{'Aborted' if result.aborted else 'Done'}: {result.imported} {kind} records imported.")
+
 
 # --- Authentication Routes ---
 @app.route('/login', methods=['GET', 'POST'])
@@ -74,12 +252,22 @@ def login():
         username = request.form['username']
         password = request.form['password']
 
+        # Per username *and* address: guessing from elsewhere can't lock the owner out of their account
+        limits = [(f'ip:{request.remote_addr}', app.config['LOGIN_MAX_FAILURES_PER_IP']),
+                  (f'user:{username.strip().lower()}@{request.remote_addr}', app.config['LOGIN_MAX_FAILURES_PER_USER'])]
+        retry_after = login_throttle.retry_after(limits)
+        if retry_after:
+            flash(f'Too many failed logins. Try again in {retry_after} seconds.', 'danger')
+            return render_template('login.html', username=username), 429, {'Retry-After': str(retry_after)}
+
         user = User.query.filter_by(username=username).first()
 
         if user is None or not user.check_password(password):
+            login_throttle.record_failure([key for key, _ in limits], app.config['LOGIN_THROTTLE_WINDOW'])
             flash('Invalid username or password', 'danger')
             return render_template('login.html', username=username)
         
+        login_throttle.clear(limits[1][0])
         login_user(user)
         flash('Logged in successfully!', 'success')
         next_page = request.args.get('next')
@@ -98,72 +286,17 @@ def logout():
 # --- Protected Routes (apply @login_required) ---
 @app.route('/')
 @login_required
+@query_budget(9)
 def index():
-    # ... (existing code for dashboard, now it will run after tables are guaranteed to exist) ...
-    total_cows = Cow.query.count()
-    active_cows = Cow.query.filter_by(status='active').count()
-
-    today_date = date.today()
-    upcoming_vaccinations = []
-    vaccination_reminder_window = today_date + timedelta(days=30)
-    upcoming_vaccinations = Vaccination.query.filter(
-        Vaccination.next_due_date >= today_date,
-        Vaccination.next_due_date <= vaccination_reminder_window
-    ).order_by(Vaccination.next_due_date).all()
-
-    pregnant_cow_reminders = []
-    pregnancy_start_window = today_date
-    pregnancy_end_window = today_date + timedelta(days=4)
-    pregnant_cow_reminders = Cow.query.filter(
-        Cow.is_pregnant == True,
-        Cow.pregnancy_due_date >= pregnancy_start_window,
-        Cow.pregnancy_due_date <= pregnancy_end_window
-    ).order_by(Cow.pregnancy_due_date).all()
-
-    # Need to handle case where no milk records exist yet
-    try:
-        today_milk_records = MilkProduction.query.filter_by(date=today_date).all()
-        total_today_milk = sum(rec.total_daily_quantity() for rec in today_milk_records)
-    except Exception as e:
-        # If MilkProduction table doesn't exist yet (very first run), default to 0
-        total_today_milk = 0.0
-        print(f"Warning: Could not query MilkProduction table: {e}")
-
-    # Need to handle case where no customers exist yet
-    try:
-        total_receivable = db.session.query(func.sum(Customer.balance)).scalar() or 0.0
-    except Exception as e:
-        total_receivable = 0.0
-        print(f"Warning: Could not query Customer table: {e}")
+    # Served from a per-worker snapshot; committed writes to the underlying models invalidate it
+    snapshot = get_dashboard_snapshot(app.config['DASHBOARD_CACHE_TTL'], app.config['VACCINATION_DUE_WINDOW_DAYS'])
+    return render_template('index.html', **snapshot)
 
-    # Need to handle cases where tables for sales/expenses don't exist yet
-    try:
-        recent_sales = Sale.query.order_by(Sale.timestamp.desc()).limit(5).all()
-    except Exception as e:
-        recent_sales = []
-        print(f"Warning: Could not query Sale table: {e}")
-
-    try:
-        recent_expenses = Expense.query.order_by(Expense.timestamp.desc()).limit(5).all()
-    except Exception as e:
-        recent_expenses = []
-        print(f"Warning: Could not query Expense table: {e}")
-
-
-    return render_template('index.html',
-                           total_cows=total_cows,
-                           active_cows=active_cows,
-                           total_today_milk=total_today_milk,
-                           total_receivable=total_receivable,
-                           recent_sales=recent_sales,
-                           recent_expenses=recent_expenses,
-                           upcoming_vaccinations=upcoming_vaccinations,
-                           pregnant_cow_reminders=pregnant_cow_reminders)
-    
 
 # --- Cow Management (UPDATE: add pregnancy fields) ---
 @app.route('/cows')
 @login_required
+@query_budget(2)
 def view_cows():
     cows = Cow.query.all()
     return render_template('view_cows.html', cows=cows)
@@ -268,6 +401,7 @@ def delete_cow(cow_id):
 
     try:
         # Delete related records due to foreign key constraints
+        remove_cow_from_rollups(cow.id)
         MilkProduction.query.filter_by(cow_id=cow.id).delete()
         HealthRecord.query.filter_by(cow_id=cow.id).delete()
         Vaccination.query.filter_by(cow_id=cow.id).delete()
@@ -281,6 +415,59 @@ def delete_cow(cow_id):
     return redirect(url_for('view_cows'))
 
 
+# --- Cow Analytics Routes ---
+@app.route('/cows/<int:cow_id>/analytics')
+@login_required
+@query_budget(4)
+def cow_analytics(cow_id):
+    cow = db.session.get(Cow, cow_id)
+    if cow is None:
+        abort(404)
+    metrics = get_cow_metrics(cow.id, date.today(), app.config['ANALYTICS_CACHE_TTL'])
+    recent_days = CowDailyMilkTotal.query.filter(
+        CowDailyMilkTotal.cow_id == cow.id, CowDailyMilkTotal.date > date.today() - timedelta(days=30)
+    ).order_by(CowDailyMilkTotal.date.desc()).all()
+    return render_template('cow_analytics.html', cow=cow, metrics=metrics, recent_days=recent_days)
+
+@app.route('/analytics/herd')
+@login_required
+@query_budget(3)
+def herd_analytics():
+    sort = request.args.get('sort', 'avg_30d')
+    if sort not in RANKING_SORTS:
+        sort = 'avg_30d'
+    ranking = herd_ranking(date.today(), app.config['ANALYTICS_CACHE_TTL'], sort=sort)
+    return render_template('herd_analytics.html', ranking=ranking, sort=sort)
+
+
+# --- Chart Data API ---
+@app.route('/api/milk/series')
+@login_required
+@query_budget(3)
+def milk_series_api():
+    """?start=&end= (YYYY-MM-DD, default last 90 days), ?bucket=day|week|month, optional ?cow=<id>."""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in DATE_BUCKETS:
+        return jsonify(error=f"bucket must be one of: {', '.join(DATE_BUCKETS)}"), 400
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else date.today()
+        start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') \
+            else end_date - timedelta(days=89)
+    except ValueError:
+        return jsonify(error='start and end must be dates in YYYY-MM-DD format'), 400
+    if start_date > end_date:
+        return jsonify(error='start must not be after end'), 400
+
+    cow_id = request.args.get('cow', type=int)
+    if cow_id is not None and db.session.get(Cow, cow_id) is None:
+        return jsonify(error='cow not found'), 404
+
+    series = milk_series(start_date, end_date, bucket, cow_id)
+    response = jsonify(bucket=bucket, start=start_date.isoformat(), end=end_date.isoformat(), cow=cow_id, **series)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+
+
 # --- Milk Production Routes (Existing) ---
 @app.route('/milk_production/log', methods=['GET', 'POST'])
 @login_required
@@ -289,8 +476,11 @@ def log_milk_production():
     if request.method == 'POST':
         cow_id = request.form['cow_id']
         date_str = request.form['date']
-        morning_qty = float(request.form['morning_qty'])
-        evening_qty = float(request.form['evening_qty'])
+        try:
+            morning_qty, evening_qty = milk_quantities(request.form)
+        except FieldError as e:
+            flash(str(e), 'danger')
+            return render_template('log_milk_production.html', cows=cows, **request.form)
 
         cow = Cow.query.get(cow_id)
         if not cow:
@@ -311,6 +501,7 @@ def log_milk_production():
         )
         try:
             db.session.add(new_log)
+            record_milk_added(cow.id, log_date, morning_qty, evening_qty)
             db.session.commit()
             flash(f'Milk production for {cow.name} on {log_date} logged successfully!', 'success')
             return redirect(url_for('milk_history'))
@@ -319,11 +510,40 @@ def log_milk_production():
             flash(f'Error logging milk production: {str(e)}', 'danger')
     return render_template('log_milk_production.html', cows=cows)
 
+@app.route('/milk_production/log/batch', methods=['GET', 'POST'])
+@login_required
+def log_milk_batch():
+    # Herd-wide grid: one row per active cow, saved in a single transaction
+    date_str = request.values.get('date') or date.today().strftime('%Y-%m-%d')
+    try:
+        log_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
+        return redirect(url_for('log_milk_batch'))
+
+    rows = load_batch_rows(log_date)
+    if request.method == 'POST':
+        try:
+            inserted, updated, error_count = save_milk_batch(log_date, rows, request.form)
+            if error_count:
+                db.session.rollback()
+                flash(f'{error_count} row(s) have errors. Nothing was saved; please correct them and submit again.', 'danger')
+            else:
+                db.session.commit()
+                flash(f'Milk production for {log_date} saved: {inserted} new, {updated} updated.', 'success')
+                return redirect(url_for('milk_history'))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error logging milk production: {str(e)}', 'danger')
+    return render_template('log_milk_batch.html', rows=rows, log_date=log_date)
+
 @app.route('/milk_production/history')
 @login_required
+@query_budget(2)
 def milk_history():
-    milk_records = MilkProduction.query.order_by(MilkProduction.date.desc(), MilkProduction.timestamp.desc()).all()
-    return render_template('milk_history.html', milk_records=milk_records)
+    page = keyset_paginate(MilkProduction.query.options(joinedload(MilkProduction.cow)),
+                           [MilkProduction.date, MilkProduction.timestamp, MilkProduction.id])
+    return render_template('milk_history.html', milk_records=page.items, page=page)
 
 @app.route('/milk_production/edit/<int:record_id>', methods=['GET', 'POST']) # <--- NEW EDIT MILK PRODUCTION
 @login_required
@@ -335,10 +555,18 @@ def edit_milk_production(record_id):
     cows = Cow.query.filter_by(status='active').all()
 
     if request.method == 'POST':
-        record.cow_id = request.form['cow_id']
+        # Snapshot the old values so the rollups can be moved to the new ones
+        old_values = (record.cow_id, record.date, record.morning_qty_liters, record.evening_qty_liters)
+        cow_id = request.form.get('cow_id', type=int) # An int, as the rollup and cache keys expect
+        if cow_id is None:
+            abort(400)
+        record.cow_id = cow_id
         date_str = request.form['date']
-        record.morning_qty_liters = float(request.form['morning_qty'])
-        record.evening_qty_liters = float(request.form['evening_qty'])
+        try:
+            record.morning_qty_liters, record.evening_qty_liters = milk_quantities(request.form)
+        except FieldError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_milk_production.html', record=record, cows=cows, **request.form)
 
         try:
             record.date = datetime.strptime(date_str, '%Y-%m-%d').date()
@@ -347,6 +575,8 @@ def edit_milk_production(record_id):
             return render_template('edit_milk_production.html', record=record, cows=cows, **request.form)
         
         try:
+            record_milk_removed(*old_values)
+            record_milk_added(record.cow_id, record.date, record.morning_qty_liters, record.evening_qty_liters)
             db.session.commit()
             flash(f'Milk production for {record.cow.name} on {record.date} updated successfully!', 'success')
             return redirect(url_for('milk_history'))
@@ -365,6 +595,7 @@ def delete_milk_production(record_id):
         abort(404)
     
     try:
+        record_milk_removed(record.cow_id, record.date, record.morning_qty_liters, record.evening_qty_liters)
         db.session.delete(record)
         db.session.commit()
         flash(f'Milk production record for {record.cow.name} on {record.date} deleted successfully!', 'success')
@@ -416,9 +647,11 @@ def add_health_record():
 
 @app.route('/health_records')
 @login_required
+@query_budget(2)
 def view_health_records():
-    health_records = HealthRecord.query.order_by(HealthRecord.date.desc(), HealthRecord.timestamp.desc()).all()
-    return render_template('view_health_records.html', health_records=health_records)
+    page = keyset_paginate(HealthRecord.query.options(joinedload(HealthRecord.cow)),
+                           [HealthRecord.date, HealthRecord.timestamp, HealthRecord.id])
+    return render_template('view_health_records.html', health_records=page.items, page=page)
 
 @app.route('/health_records/edit/<int:record_id>', methods=['GET', 'POST']) # <--- NEW EDIT HEALTH RECORD
 @login_required
@@ -430,7 +663,10 @@ def edit_health_record(record_id):
     cows = Cow.query.filter_by(status='active').all()
 
     if request.method == 'POST':
-        record.cow_id = request.form['cow_id']
+        cow_id = request.form.get('cow_id', type=int) # A string would count as a change in the change log
+        if cow_id is None:
+            abort(400)
+        record.cow_id = cow_id
         date_str = request.form['date']
         record.description = request.form['description']
         record.treatment = request.form.get('treatment')
@@ -506,6 +742,7 @@ def add_vaccination():
             vaccine_name=vaccine_name,
             vaccination_date=vaccination_date,
             next_due_date=next_due_date,
+            status=vaccination_status(next_due_date, date.today(), app.config['VACCINATION_DUE_WINDOW_DAYS']),
             notes=notes
         )
         try:
@@ -520,9 +757,17 @@ def add_vaccination():
 
 @app.route('/vaccinations')
 @login_required
+@query_budget(2)
 def view_vaccinations():
-    vaccinations = Vaccination.query.order_by(Vaccination.vaccination_date.desc()).all()
-    return render_template('view_vaccinations.html', vaccinations=vaccinations)
+    status = request.args.get('status')
+    query = Vaccination.query.options(joinedload(Vaccination.cow))
+    if status in VACCINATION_STATUSES:
+        query = query.filter(Vaccination.status == status) # Served by the (status, vaccination_date, id) index
+    else:
+        status = None
+    page = keyset_paginate(query, [Vaccination.vaccination_date, Vaccination.id])
+    return render_template('view_vaccinations.html', vaccinations=page.items, page=page,
+                           status=status, statuses=VACCINATION_STATUSES)
 
 @app.route('/vaccinations/delete/<int:id>', methods=['POST'])
 @login_required
@@ -549,6 +794,7 @@ def delete_vaccination(id):
 # --- Customer Management ---
 @app.route('/customers')
 @login_required
+@query_budget(2)
 def view_customers():
     customers = Customer.query.order_by(Customer.name).all()
     return render_template('view_customers.html', customers=customers)
@@ -625,7 +871,7 @@ def record_sale():
         customer_id = request.form['customer_id']
         date_str = request.form['date']
         milk_qty = float(request.form['milk_qty'])
-        price_per_liter = float(request.form['price_per_liter'])
+        price_per_liter = to_money(request.form['price_per_liter'])
 
         customer = Customer.query.get(customer_id)
         if not customer:
@@ -638,7 +884,7 @@ def record_sale():
             flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
             return render_template('record_sale.html', customers=customers, **request.form)
 
-        total_amount = milk_qty * price_per_liter
+        total_amount = sale_total(milk_qty, price_per_liter)
         new_sale = Sale(
             customer_id=customer.id,
             date=sale_date,
@@ -648,7 +894,7 @@ def record_sale():
         )
         try:
             db.session.add(new_sale)
-            customer.balance += total_amount # Update customer's balance
+            adjust_customer_balance(customer.id, total_amount) # Update customer's balance
             db.session.commit()
             flash(f'Sale to {customer.name} recorded successfully! Amount: {total_amount:.2f}', 'success')
             return redirect(url_for('view_sales'))
@@ -659,9 +905,11 @@ def record_sale():
 
 @app.route('/sales')
 @login_required
+@query_budget(2)
 def view_sales():
-    sales = Sale.query.order_by(Sale.date.desc(), Sale.timestamp.desc()).all()
-    return render_template('view_sales.html', sales=sales)
+    page = keyset_paginate(Sale.query.options(joinedload(Sale.customer)),
+                           [Sale.date, Sale.timestamp, Sale.id])
+    return render_template('view_sales.html', sales=page.items, page=page)
 
 @app.route('/sales/edit/<int:sale_id>', methods=['GET', 'POST']) # <--- NEW EDIT SALE
 @login_required
@@ -673,12 +921,16 @@ def edit_sale(sale_id):
     customers = Customer.query.order_by(Customer.name).all()
 
     if request.method == 'POST':
-        old_total_amount = sale.total_amount # Store old amount for balance adjustment
+        # Store old customer/amount for balance adjustment
+        old_customer_id, old_total_amount = sale.customer_id, sale.total_amount
         
-        sale.customer_id = request.form['customer_id']
+        customer_id = request.form.get('customer_id', type=int)
+        if customer_id is None:
+            abort(400)
+        sale.customer_id = customer_id
         date_str = request.form['date']
         milk_qty = float(request.form['milk_qty'])
-        price_per_liter = float(request.form['price_per_liter'])
+        price_per_liter = to_money(request.form['price_per_liter'])
         sale.is_paid = bool(request.form.get('is_paid')) # Checkbox
 
         try:
@@ -689,13 +941,12 @@ def edit_sale(sale_id):
 
         sale.milk_quantity_liters = milk_qty
         sale.price_per_liter = price_per_liter
-        sale.total_amount = milk_qty * price_per_liter # Recalculate total amount
+        sale.total_amount = sale_total(milk_qty, price_per_liter) # Recalculate total amount
 
         try:
-            # Adjust customer balance based on the change in total_amount
-            customer = db.session.get(Customer, sale.customer_id)
-            customer.balance -= old_total_amount # Subtract old amount
-            customer.balance += sale.total_amount # Add new amount
+            # Move the sale's amount between balances (the customer may have changed too)
+            adjust_customer_balance(old_customer_id, -old_total_amount) # Subtract old amount
+            adjust_customer_balance(sale.customer_id, sale.total_amount) # Add new amount
             
             db.session.commit()
             flash(f'Sale record updated successfully! New Amount: {sale.total_amount:.2f}', 'success')
@@ -715,11 +966,8 @@ def delete_sale(sale_id):
         abort(404)
     
     try:
-        # Adjust customer balance before deleting the sale
-        customer = db.session.get(Customer, sale.customer_id)
-        customer.balance -= sale.total_amount # Subtract the amount of the deleted sale
-
         db.session.delete(sale)
+        adjust_customer_balance(sale.customer_id, -sale.total_amount) # Subtract the amount of the deleted sale
         db.session.commit()
         flash(f'Sale record of {sale.total_amount:.2f} deleted successfully!', 'success')
     except Exception as e:
@@ -736,7 +984,7 @@ def record_payment():
     if request.method == 'POST':
         customer_id = request.form['customer_id']
         date_str = request.form['date']
-        amount_received = float(request.form['amount_received'])
+        amount_received = to_money(request.form['amount_received'])
         description = request.form.get('description')
 
         customer = Customer.query.get(customer_id)
@@ -758,7 +1006,7 @@ def record_payment():
         )
         try:
             db.session.add(new_payment)
-            customer.balance -= amount_received # Update customer's balance (payment reduces what they owe)
+            adjust_customer_balance(customer.id, -amount_received) # Update customer's balance (payment reduces what they owe)
             db.session.commit()
             flash(f'Payment from {customer.name} recorded successfully! Amount: {amount_received:.2f}', 'success')
             return redirect(url_for('view_payments'))
@@ -769,9 +1017,11 @@ def record_payment():
 
 @app.route('/payments')
 @login_required
+@query_budget(2)
 def view_payments():
-    payments = Payment.query.order_by(Payment.date.desc(), Payment.timestamp.desc()).all()
-    return render_template('view_payments.html', payments=payments)
+    page = keyset_paginate(Payment.query.options(joinedload(Payment.customer)),
+                           [Payment.date, Payment.timestamp, Payment.id])
+    return render_template('view_payments.html', payments=page.items, page=page)
 
 @app.route('/payments/edit/<int:payment_id>', methods=['GET', 'POST']) # <--- NEW EDIT PAYMENT
 @login_required
@@ -783,11 +1033,15 @@ def edit_payment(payment_id):
     customers = Customer.query.order_by(Customer.name).all()
 
     if request.method == 'POST':
-        old_amount_received = payment.amount_received # Store old amount for balance adjustment
+        # Store old customer/amount for balance adjustment
+        old_customer_id, old_amount_received = payment.customer_id, payment.amount_received
         
-        payment.customer_id = request.form['customer_id']
+        customer_id = request.form.get('customer_id', type=int)
+        if customer_id is None:
+            abort(400)
+        payment.customer_id = customer_id
         date_str = request.form['date']
-        amount_received = float(request.form['amount_received'])
+        amount_received = to_money(request.form['amount_received'])
         payment.description = request.form.get('description')
 
         try:
@@ -799,10 +1053,9 @@ def edit_payment(payment_id):
         payment.amount_received = amount_received
 
         try:
-            # Adjust customer balance based on the change in amount_received
-            customer = db.session.get(Customer, payment.customer_id)
-            customer.balance += old_amount_received # Add old amount back
-            customer.balance -= payment.amount_received # Subtract new amount
+            # Move the payment between balances (the customer may have changed too)
+            adjust_customer_balance(old_customer_id, old_amount_received) # Add old amount back
+            adjust_customer_balance(payment.customer_id, -payment.amount_received) # Subtract new amount
             
             db.session.commit()
             flash(f'Payment record updated successfully! New Amount: {payment.amount_received:.2f}', 'success')
@@ -822,11 +1075,8 @@ def delete_payment(payment_id):
         abort(404)
     
     try:
-        # Adjust customer balance before deleting the payment
-        customer = db.session.get(Customer, payment.customer_id)
-        customer.balance += payment.amount_received # Add amount back to what they owe
-
         db.session.delete(payment)
+        adjust_customer_balance(payment.customer_id, payment.amount_received) # Add amount back to what they owe
         db.session.commit()
         flash(f'Payment record of {payment.amount_received:.2f} deleted successfully!', 'success')
     except Exception as e:
@@ -842,7 +1092,7 @@ def record_expense():
     if request.method == 'POST':
         date_str = request.form['date']
         category = request.form['category']
-        amount = float(request.form['amount'])
+        amount = to_money(request.form['amount'])
         description = request.form.get('description')
 
         try:
@@ -869,9 +1119,10 @@ def record_expense():
 
 @app.route('/expenses')
 @login_required
+@query_budget(2)
 def view_expenses():
-    expenses = Expense.query.order_by(Expense.date.desc(), Expense.timestamp.desc()).all()
-    return render_template('view_expenses.html', expenses=expenses)
+    page = keyset_paginate(Expense.query, [Expense.date, Expense.timestamp, Expense.id])
+    return render_template('view_expenses.html', expenses=page.items, page=page)
 
 @app.route('/expenses/edit/<int:expense_id>', methods=['GET', 'POST']) # <--- NEW EDIT EXPENSE
 @login_required
@@ -884,7 +1135,7 @@ def edit_expense(expense_id):
     if request.method == 'POST':
         date_str = request.form['date']
         expense.category = request.form['category']
-        expense.amount = float(request.form['amount'])
+        expense.amount = to_money(request.form['amount'])
         expense.description = request.form.get('description')
 
         try:
@@ -921,223 +1172,478 @@ def delete_expense(expense_id):
     return redirect(url_for('view_expenses'))
 
 
+# --- Import Routes ---
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_data():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in IMPORT_KINDS or not upload or not upload.filename:
+            flash('Please choose what to import and a CSV or XLSX file.', 'danger')
+            return render_template('import_data.html', kinds=IMPORT_KINDS)
+        refused = no_runner_response()
+        if refused:
+            return refused
+
+        # Imports outlast a web request: save the upload where the job worker can read it (JOB_DIR is shared)
+        upload_dir = os.path.join(app.config['JOB_DIR'], 'uploads')
+        os.makedirs(upload_dir, exist_ok=True)
+        path = os.path.join(upload_dir, uuid.uuid4().hex)
+        upload.save(path)
+        return queue_job('import', {'kind': kind, 'upload': path, 'filename': os.path.basename(upload.filename),
+                                    'create_customers': 'create_customers' in request.form})
+    return render_template('import_data.html', kinds=IMPORT_KINDS)
+
+
 # --- Reports Routes (Existing) ---
 @app.route('/profit_loss', methods=['GET', 'POST'])
 @login_required
-def profit_loss(): # ... (code unchanged) ...
+@query_budget(5)
+def profit_loss():
     start_date = None
     end_date = None
-    total_income = 0.0
-    total_expenses = 0.0
-    net_profit_loss = 0.0
-    transactions = []
-
-    if request.method == 'POST':
-        start_date_str = request.form.get('start_date')
-        end_date_str = request.form.get('end_date')
+    summary = {}
+    page = None
 
-        try:
-            if start_date_str:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-            if end_date_str:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
-            return render_template('profit_loss.html')
-
-        sales_query = db.session.query(func.sum(Sale.total_amount))
-        if start_date:
-            sales_query = sales_query.filter(Sale.date >= start_date)
-        if end_date:
-            sales_query = sales_query.filter(Sale.date <= end_date)
-        total_income = sales_query.scalar() or 0.0
-
-        expenses_query = db.session.query(func.sum(Expense.amount))
-        if start_date:
-            expenses_query = expenses_query.filter(Expense.date >= start_date)
-        if end_date:
-            expenses_query = expenses_query.filter(Expense.date <= end_date)
-        total_expenses = expenses_query.scalar() or 0.0
-
-        net_profit_loss = total_income - total_expenses
-
-        sales_data = Sale.query
-        expenses_data = Expense.query
-
-        if start_date:
-            sales_data = sales_data.filter(Sale.date >= start_date)
-            expenses_data = expenses_data.filter(Expense.date >= start_date)
-        if end_date:
-            sales_data = sales_data.filter(Sale.date <= end_date)
-            expenses_data = expenses_data.filter(Expense.date <= end_date)
-
-        transactions.extend(sales_data.order_by(Sale.date.desc()).all())
-        transactions.extend(expenses_data.order_by(Expense.date.desc()).all())
-        transactions.sort(key=lambda x: x.date, reverse=True)
+    # Accepts the filter form as GET (so paging links work) or POST
+    start_date_str = request.values.get('start_date')
+    end_date_str = request.values.get('end_date')
+    try:
+        if start_date_str:
+            start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
+        return render_template('profit_loss.html')
+
+    if start_date and end_date:
+        summary = profit_loss_summary(start_date, end_date)
+        page = keyset_paginate(*profit_loss_transactions(start_date, end_date))
 
     return render_template('profit_loss.html',
                            start_date=start_date,
                            end_date=end_date,
-                           total_income=total_income,
-                           total_expenses=total_expenses,
-                           net_profit_loss=net_profit_loss,
-                           transactions=transactions)
+                           page=page,
+                           transactions=page.items if page else [],
+                           **summary)
 
 
 @app.route('/amounts_receivable')
 @login_required
+@query_budget(2)
 def amounts_receivable():
     customers_owing = Customer.query.filter(Customer.balance > 0).order_by(Customer.name).all()
     return render_template('amounts_receivable.html', customers_owing=customers_owing)
 
-# --- EXPORT ROUTES (Existing) ---
-@app.route('/export/milk_production')
+@app.route('/receivables/aging')
+@login_required
+@query_budget(3)
+def receivables_aging_report():
+    today = date.today()
+    page = keyset_paginate(*receivables_aging(today))
+    totals = receivables_aging_totals(today)
+    return render_template('receivables_aging.html', customers=page.items, page=page, totals=totals,
+                           buckets=AGING_BUCKETS, today=today)
+
+@app.route('/receivables/sync_paid', methods=['POST'])
 @login_required
-def export_milk_production(): # ... (code unchanged) ...
-    milk_records = MilkProduction.query.all()
-    data = []
-    for record in milk_records:
-        data.append({
-            'Date': record.date.strftime('%Y-%m-%d'),
-            'Cow Name': record.cow.name,
-            'Cow ID': record.cow.cow_id,
-            'Morning Quantity (L)': record.morning_qty_liters,
-            'Evening Quantity (L)': record.evening_qty_liters,
-            'Total Daily Quantity (L)': record.total_daily_quantity(),
-            'Logged At': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Milk Production')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'milk_production_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+def sync_sale_paid():
+    try:
+        marked_paid, marked_unpaid = sync_sale_paid_flags()
+        db.session.commit()
+        flash(f'{marked_paid} sales marked paid and {marked_unpaid} marked unpaid from recorded payments.', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating paid flags: {str(e)}', 'danger')
+    return redirect(url_for('receivables_aging_report'))
 
+@app.route('/statements', methods=['GET', 'POST'])
+@login_required
+def customer_statements():
+    statement_dir = app.config['STATEMENT_DIR']
+    if request.method == 'POST':
+        try:
+            start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
+            return redirect(url_for('customer_statements'))
+        if start_date > end_date:
+            flash("The start date must be on or before the end date.", 'danger')
+            return redirect(url_for('customer_statements'))
+        formats = [fmt for fmt in request.form.getlist('formats') if fmt in STATEMENT_FORMATS] or STATEMENT_FORMATS
+        return queue_job('statements', {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+                                        'formats': list(formats)})
+
+    # Default period: last month
+    first_of_month = date.today().replace(day=1)
+    default_end = first_of_month - timedelta(days=1)
+    archives = []
+    if os.path.isdir(statement_dir):
+        for name in sorted(os.listdir(statement_dir), reverse=True):
+            if name.endswith('.zip'):
+                stat = os.stat(os.path.join(statement_dir, name))
+                archives.append({'name': name, 'size_kb': stat.st_size / 1024,
+                                 'created': datetime.fromtimestamp(stat.st_mtime)})
+    return render_template('statements.html', archives=archives, formats=STATEMENT_FORMATS,
+                           default_start=default_end.replace(day=1), default_end=default_end)
+
+@app.route('/statements/download/<path:filename>')
+@login_required
+def download_statements(filename):
+    return send_from_directory(app.config['STATEMENT_DIR'], filename, as_attachment=True)
+
+# --- EXPORT ROUTES (streamed; add ?format=csv for CSV, ?background=1 to run as a job) ---
+# Each definition returns (query, headers, format_row, sheet name, filename prefix)
+def milk_production_export():
+    query = db.session.query(
+        MilkProduction.date, Cow.name, Cow.cow_id,
+        MilkProduction.morning_qty_liters, MilkProduction.evening_qty_liters, MilkProduction.timestamp
+    ).join(Cow, MilkProduction.cow_id == Cow.id).order_by(MilkProduction.date, MilkProduction.id)
+    headers = ['Date', 'Cow Name', 'Cow ID', 'Morning Quantity (L)', 'Evening Quantity (L)',
+               'Total Daily Quantity (L)', 'Logged At']
+
+    def format_row(row):
+        log_date, cow_name, cow_tag, morning_qty, evening_qty, timestamp = row
+        return [log_date.strftime('%Y-%m-%d'), cow_name, cow_tag, morning_qty, evening_qty,
+                (morning_qty or 0.0) + (evening_qty or 0.0), timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Milk Production', 'milk_production'
+
+def health_records_export():
+    query = db.session.query(
+        HealthRecord.date, Cow.name, Cow.cow_id, HealthRecord.description,
+        HealthRecord.treatment, HealthRecord.veterinarian, HealthRecord.timestamp
+    ).join(Cow, HealthRecord.cow_id == Cow.id).order_by(HealthRecord.date, HealthRecord.id)
+    headers = ['Date', 'Cow Name', 'Cow ID', 'Description', 'Treatment', 'Veterinarian', 'Logged At']
+
+    def format_row(row):
+        record_date, cow_name, cow_tag, description, treatment, veterinarian, timestamp = row
+        return [record_date.strftime('%Y-%m-%d'), cow_name, cow_tag, description, treatment, veterinarian,
+                timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Health Records', 'health_records'
+
+def sales_export():
+    query = db.session.query(
+        Sale.date, Customer.name, Sale.milk_quantity_liters, Sale.price_per_liter,
+        Sale.total_amount, Sale.is_paid, Sale.timestamp
+    ).join(Customer, Sale.customer_id == Customer.id).order_by(Sale.date, Sale.id)
+    headers = ['Date', 'Customer Name', 'Milk Quantity (L)', 'Price Per Liter (RWF)', 'Total Amount (RWF)',
+               'Is Paid', 'Logged At']
+
+    def format_row(row):
+        sale_date, customer_name, milk_qty, price_per_liter, total_amount, is_paid, timestamp = row
+        return [sale_date.strftime('%Y-%m-%d'), customer_name, milk_qty, price_per_liter, total_amount,
+                'Yes' if is_paid else 'No', timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Sales', 'sales_history'
+
+def payments_export():
+    query = db.session.query(
+        Payment.date, Customer.name, Payment.amount_received, Payment.description, Payment.timestamp
+    ).join(Customer, Payment.customer_id == Customer.id).order_by(Payment.date, Payment.id)
+    headers = ['Date', 'Customer Name', 'Amount Received (RWF)', 'Description', 'Logged At']
+
+    def format_row(row):
+        payment_date, customer_name, amount_received, description, timestamp = row
+        return [payment_date.strftime('%Y-%m-%d'), customer_name, amount_received, description,
+                timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Payments', 'payments_history'
+
+def expenses_export():
+    query = db.session.query(
+        Expense.date, Expense.category, Expense.amount, Expense.description, Expense.timestamp
+    ).order_by(Expense.date, Expense.id)
+    headers = ['Date', 'Category', 'Amount (RWF)', 'Description', 'Logged At']
+
+    def format_row(row):
+        expense_date, category, amount, description, timestamp = row
+        return [expense_date.strftime('%Y-%m-%d'), category, amount, description,
+                timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Expenses', 'expenses_history'
+
+def vaccinations_export():
+    query = db.session.query(
+        Cow.name, Cow.cow_id, Vaccination.vaccine_name, Vaccination.vaccination_date,
+        Vaccination.next_due_date, Vaccination.status, Vaccination.notes, Vaccination.timestamp
+    ).join(Cow, Vaccination.cow_id == Cow.id).order_by(Vaccination.vaccination_date, Vaccination.id)
+    headers = ['Cow Name', 'Cow ID', 'Vaccine Name', 'Vaccination Date', 'Next Due Date', 'Status', 'Notes',
+               'Logged At']
+
+    def format_row(row):
+        cow_name, cow_tag, vaccine_name, vaccination_date, next_due_date, status, notes, timestamp = row
+        return [cow_name, cow_tag, vaccine_name, vaccination_date.strftime('%Y-%m-%d'),
+                next_due_date.strftime('%Y-%m-%d') if next_due_date else 'N/A', status, notes,
+                timestamp.strftime('%Y-%m-%d %H:%M:%S')]
+
+    return query, headers, format_row, 'Vaccination History', 'vaccination_history'
+
+EXPORTS = {
+    'milk_production': milk_production_export,
+    'health_records': health_records_export,
+    'sales': sales_export,
+    'payments': payments_export,
+    'expenses': expenses_export,
+    'vaccinations': vaccinations_export,
+}
+
+def export_or_enqueue(name):
+    if request.args.get('background'):
+        return queue_job('export', {'name': name, 'format': request.args.get('format', 'xlsx')})
+    return export_response(*EXPORTS[name]())
+
+@app.route('/export/milk_production')
+@login_required
+@query_budget(2)
+def export_milk_production():
+    return export_or_enqueue('milk_production')
 
 @app.route('/export/health_records')
 @login_required
-def export_health_records(): # ... (code unchanged) ...
-    health_records = HealthRecord.query.all()
-    data = []
-    for record in health_records:
-        data.append({
-            'Date': record.date.strftime('%Y-%m-%d'),
-            'Cow Name': record.cow.name,
-            'Cow ID': record.cow.cow_id,
-            'Description': record.description,
-            'Treatment': record.treatment,
-            'Veterinarian': record.veterinarian,
-            'Logged At': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Health Records')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'health_records_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@query_budget(2)
+def export_health_records():
+    return export_or_enqueue('health_records')
 
 @app.route('/export/sales')
 @login_required
-def export_sales(): # ... (code unchanged) ...
-    sales = Sale.query.all()
-    data = []
-    for record in sales:
-        data.append({
-            'Date': record.date.strftime('%Y-%m-%d'),
-            'Customer Name': record.customer.name,
-            'Milk Quantity (L)': record.milk_quantity_liters,
-            'Price Per Liter (RWF)': record.price_per_liter,
-            'Total Amount (RWF)': record.total_amount,
-            'Is Paid': 'Yes' if record.is_paid else 'No',
-            'Logged At': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Sales')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'sales_history_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@query_budget(2)
+def export_sales():
+    return export_or_enqueue('sales')
 
 @app.route('/export/payments')
 @login_required
-def export_payments(): # ... (code unchanged) ...
-    payments = Payment.query.all()
-    data = []
-    for record in payments:
-        data.append({
-            'Date': record.date.strftime('%Y-%m-%d'),
-            'Customer Name': record.customer.name,
-            'Amount Received (RWF)': record.amount_received,
-            'Description': record.description,
-            'Logged At': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Payments')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'payments_history_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@query_budget(2)
+def export_payments():
+    return export_or_enqueue('payments')
 
 @app.route('/export/expenses')
 @login_required
-def export_expenses(): # ... (code unchanged) ...
-    expenses = Expense.query.all()
-    data = []
-    for record in expenses:
-        data.append({
-            'Date': record.date.strftime('%Y-%m-%m'),
-            'Category': record.category,
-            'Amount (RWF)': record.amount,
-            'Description': record.description,
-            'Logged At': record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Expenses')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'expenses_history_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@query_budget(2)
+def export_expenses():
+    return export_or_enqueue('expenses')
 
 @app.route('/export/vaccinations')
 @login_required
+@query_budget(2)
 def export_vaccinations():
-    vaccinations = Vaccination.query.all()
-    data = []
-    for vac in vaccinations:
-        data.append({
-            'Cow Name': vac.cow.name,
-            'Cow ID': vac.cow.cow_id,
-            'Vaccine Name': vac.vaccine_name,
-            'Vaccination Date': vac.vaccination_date.strftime('%Y-%m-%d'),
-            'Next Due Date': vac.next_due_date.strftime('%Y-%m-%d') if vac.next_due_date else 'N/A',
-            'Status': vac.status,
-            'Notes': vac.notes,
-            'Logged At': vac.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='openpyxl')
-    df.to_excel(writer, index=False, sheet_name='Vaccination History')
-    writer.close()
-    output.seek(0)
-
-    return send_file(output, as_attachment=True, download_name=f'vaccination_history_{date.today().strftime("%Y%m%d")}.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return export_or_enqueue('vaccinations')
+
+
+# --- Background Jobs ---
+@job_handler('export')
+def run_export_job(params, output_dir):
+    return write_export(output_dir, *EXPORTS[params['name']](), file_format=params.get('format'))
+
+@job_handler('backup')
+def run_backup_job(params, output_dir):
+    path = os.path.join(output_dir, backup_filename())
+    create_backup(path)
+    return path
+
+@job_handler('import')
+def run_import_job(params, output_dir):
+    # The upload was saved under JOB_DIR by the web app; the report of skipped rows is the job's result
+    try:
+        with open(params['upload'], 'rb') as fileobj:
+            result = run_import(params['kind'], fileobj, params['filename'], chunk_size=app.config['IMPORT_CHUNK_SIZE'],
+                                create_customers=params.get('create_customers', False))
+    finally:
+        os.remove(params['upload'])
+    path = os.path.join(output_dir, 'import-report.txt')
+    with open(path, 'w', encoding='utf-8') as report:
+        report.write(f"{params['filename']}: {result.imported} of {result.processed} {result.kind} rows imported, "
+                     f"{result.error_count} skipped with errors.{' Aborted.' if result.aborted else ''}\n")
+        for line, message in result.errors:
+            report.write(f"line {line}: {message}\n" if line else f"{message}\n")
+        if result.error_count > len(result.errors):
+            report.write(f"... and {result.error_count - len(result.errors)} more errors\n")
+    return path
+
+@job_handler('statements')
+def run_statements_job(params, output_dir):
+    start_date, end_date = date.fromisoformat(params['start_date']), date.fromisoformat(params['end_date'])
+    path = os.path.join(app.config['STATEMENT_DIR'], statement_archive_name(start_date, end_date))
+    # Never fork a render pool per CPU from inside a (multithreaded) web worker
+    workers = 1 if in_web_worker() else app.config['STATEMENT_WORKERS']
+    generate_statements(start_date, end_date, path, formats=params.get('formats') or STATEMENT_FORMATS,
+                        batch_size=app.config['STATEMENT_BATCH_SIZE'], workers=workers)
+    return path
+
+def job_accepted(job):
+    """202 with the job's URLs for API clients; otherwise on to the job's status page."""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'id': job.id, 'status': job.status,
+                        'status_url': url_for('job_status_api', job_id=job.id),
+                        'download_url': url_for('download_job_result', job_id=job.id)}), 202
+    flash(f'Job #{job.id} queued. This page updates when it is done.', 'info')
+    return redirect(url_for('job_status', job_id=job.id))
+
+NO_JOB_RUNNER = ("No job runner is running, so nothing was queued. Start the worker process "
+                 "(`flask --app app run-jobs`, the Procfile's worker) or set JOB_WORKER_IN_WEB=1.")
+
+def no_runner_response():
+    """The error response when no runner would ever pick up a new job, else None."""
+    if job_runner_alive(app.config['JOB_HEARTBEAT_TIMEOUT']):
+        return None
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'error': NO_JOB_RUNNER}), 503
+    flash(NO_JOB_RUNNER, 'danger')
+    return redirect(request.referrer or url_for('view_jobs'))
+
+def queue_job(kind, params):
+    """Queues a job for the current user (see job_accepted), unless no runner would ever pick it up."""
+    return no_runner_response() or job_accepted(enqueue_job(kind, params, current_user.id))
+
+def job_as_dict(job):
+    return {
+        'id': job.id, 'kind': job.kind, 'status': job.status, 'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': url_for('download_job_result', job_id=job.id) if job.status == 'succeeded' else None,
+    }
+
+@app.route('/jobs')
+@login_required
+@query_budget(3)
+def view_jobs():
+    jobs = Job.query.order_by(Job.created_at.desc(), Job.id.desc()).limit(50).all()
+    runner_alive = job_runner_alive(app.config['JOB_HEARTBEAT_TIMEOUT'])
+    return render_template('jobs.html', jobs=jobs, runner_alive=runner_alive, no_runner_message=NO_JOB_RUNNER)
+
+@app.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    runner_alive = job.status != 'queued' or job_runner_alive(app.config['JOB_HEARTBEAT_TIMEOUT'])
+    return render_template('job_status.html', job=job, params=json.loads(job.params or '{}'),
+                           runner_alive=runner_alive, no_runner_message=NO_JOB_RUNNER)
+
+@app.route('/api/jobs/<int:job_id>')
+@login_required
+def job_status_api(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_as_dict(job))
+
+@app.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job_result(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or job.status != 'succeeded' or not job.result_path:
+        abort(404)
+    if not os.path.isfile(job.result_path):
+        # The worker wrote it on another host (JOB_DIR/STATEMENT_DIR not shared), or it was purged
+        app.logger.warning('Job %s result %s is missing here; JOB_DIR and STATEMENT_DIR must be shared with '
+                           'the job worker', job.id, job.result_path)
+        abort(404)
+    return send_file(job.result_path, as_attachment=True, download_name=os.path.basename(job.result_path))
+
+
+# --- Search ---
+@app.route('/search')
+@login_required
+@query_budget(3)
+def search():
+    q = request.args.get('q', '').strip()
+    cow_id = request.args.get('cow_id', type=int)
+    kind = request.args.get('kind', '')
+    start_date = end_date = None
+    try:
+        if request.args.get('start_date'):
+            start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        if request.args.get('end_date'):
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+    except ValueError:
+        flash("Invalid date format. Please use YYYY-MM-DD.", 'danger')
+    cows = db.session.query(Cow.id, Cow.cow_id, Cow.name).order_by(Cow.name).all()
+
+    page = None
+    if q:
+        page = keyset_paginate(*search_records(q, cow_id, start_date, end_date,
+                                               [kind] if kind in SEARCH_SOURCES else None))
+    return render_template('search.html', q=q, cow_id=cow_id, kind=kind, start_date=start_date,
+                           end_date=end_date, cows=cows, kinds=SEARCH_SOURCES, page=page)
+
+
+# --- Sync API (token auth; for barn tablets) ---
+@app.route('/api/sync/reference')
+@api_token_required
+@query_budget(3)
+def api_sync_reference():
+    # What a tablet caches offline to fill in records: active cows by tag and customers by id
+    cows = db.session.query(Cow.id, Cow.cow_id, Cow.name).filter(Cow.status == 'active').order_by(Cow.name)
+    customers = db.session.query(Customer.id, Customer.name).order_by(Customer.name)
+    return jsonify({
+        'server_date': date.today().isoformat(),
+        'cows': [{'id': pk, 'cow_id': tag, 'name': name} for pk, tag, name in cows],
+        'customers': [{'id': pk, 'name': name} for pk, name in customers],
+    })
+
+@app.route('/api/sync', methods=['POST'])
+@api_token_required
+def api_sync():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object of record lists.'}), 400
+    status, body = sync_batch(payload, g.api_token, date.today(), app.config['VACCINATION_DUE_WINDOW_DAYS'],
+                              app.config['API_SYNC_MAX_RECORDS'])
+    return jsonify(body), status
+
+@app.route('/api/changes')
+@api_token_required
+def api_changes():
+    # Clients pass the `next` of their last page as ?since=; 0 (or none) returns every current row
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', 1000, type=int)
+    tables = [name for name in request.args.get('tables', '').split(',') if name.strip()]
+    unknown = [name for name in tables if name not in TRACKED_TABLES]
+    if since < 0 or limit < 1:
+        return jsonify({'error': "'since' must be 0 or more and 'limit' at least 1."}), 400
+    if unknown:
+        return jsonify({'error': f"Unknown tables: {', '.join(unknown)}. Use: {', '.join(TRACKED_TABLES)}."}), 400
+    try:
+        body = changes_since(since, min(limit, MAX_CHANGES_PAGE), tables)
+    except UnknownVersion as e:
+        return jsonify({'error': str(e)}), 400
+    body['latest'] = latest_version()
+    return jsonify(body)
+
+
+# --- Admin Routes ---
+def backup_filename():
+    return f'dairy_farm_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+
+@app.route('/admin/backup', methods=['GET', 'POST'])
+@login_required
+def admin_backup():
+    if request.method == 'POST':
+        return queue_job('backup', {})
+    jobs = Job.query.filter(Job.kind == 'backup').order_by(Job.created_at.desc(), Job.id.desc()).limit(20).all()
+    return render_template('admin_backup.html', jobs=jobs)
+
+# --- Diagnostics Routes ---
+@app.route('/admin/db_pool')
+@login_required
+def db_pool_status():
+    # Per worker process: poll a few times to see every gunicorn worker's pool
+    return jsonify(pool_status())
+
+@app.route('/metrics')
+def metrics():
+    # Scraped by Prometheus, so no login; set METRICS_TOKEN to require a bearer token
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return metrics_response()
 
 # ... (rest of your app.py code) ...
 
@@ -0,0 +1,96 @@
+# auth.py
+import threading
+import time
+
+from flask_login import UserMixin
+
+from cache import ALL_KEYS, KeyedCache, invalidate_on_commit
+from extensions import db
+from models import User
+
+MAX_THROTTLE_KEYS = 10000 # Past this, expired windows are pruned on the next failure
+
+
+class CachedUser(UserMixin):
+    """current_user as plain values copied from a User row, so it can outlive the session that loaded it."""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def __repr__(self):
+        return f"<CachedUser {self.username}>"
+
+
+# CachedUser (or None) per user id. A committed write to a User in this process drops its entry at once;
+# writes made by other workers show up when the entry expires.
+user_cache = KeyedCache()
+
+
+def _build_user(user_id):
+    row = db.session.query(User.id, User.username).filter(User.id == user_id).first()
+    return CachedUser(*row) if row else None
+
+
+def load_cached_user(user_id, ttl):
+    if ttl <= 0:
+        return _build_user(user_id)
+    return user_cache.get(user_id, ttl, lambda: _build_user(user_id))
+
+
+# --- Invalidation: committed User writes drop their cache entries ---
+def _flushed_user_writes(session):
+    return {obj.id for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+            if isinstance(obj, User)}
+
+
+def _bulk_user_writes(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, User):
+        return ALL_KEYS # Criteria-based: scope unknown
+    return None
+
+
+invalidate_on_commit(user_cache, 'auth', _flushed_user_writes, _bulk_user_writes)
+
+
+# --- Login throttling ---
+class LoginThrottle:
+    """
+    Failed logins per key (client address, username) in fixed windows, per
+    worker process. Checked before the user lookup and the password hash, so
+    a burst of guesses is turned away without spending CPU on either.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = {} # key -> (window_ends_at, count)
+
+    def retry_after(self, limits):
+        """limits: [(key, max failures)]. Seconds until every key is under its limit again (0 = allowed)."""
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, limit in limits:
+                entry = self._failures.get(key)
+                if entry is not None and now < entry[0] and entry[1] >= limit:
+                    wait = max(wait, int(entry[0] - now) + 1)
+        return wait
+
+    def record_failure(self, keys, window):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._failures) >= MAX_THROTTLE_KEYS:
+                self._failures = {key: entry for key, entry in self._failures.items() if now < entry[0]}
+            for key in keys:
+                entry = self._failures.get(key)
+                if entry is None or now >= entry[0]:
+                    entry = (now + window, 0)
+                self._failures[key] = (entry[0], entry[1] + 1)
+
+    def clear(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+login_throttle = LoginThrottle()
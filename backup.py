@@ -0,0 +1,174 @@
+# backup.py
+import json
+import os
+import zipfile
+from datetime import datetime
+
+from sqlalchemy import Integer, func, select, text
+
+from extensions import db
+from migrations import MIGRATIONS, applied_versions, upgrade
+from rowcodec import DECODERS, column_kind, row_decoder, row_encoder
+
+BACKUP_FORMAT = 'dairy-farm-backup'
+BACKUP_FORMAT_VERSION = 1
+BACKUP_CHUNK_ROWS = 50000 # Rows per archive member (rounded up to whole fetches)
+FETCH_SIZE = 5000 # Rows per database round trip (server-side cursor on Postgres)
+COMPRESS_LEVEL = 1 # zlib level: ~5x faster than the default 6 for a ~25% bigger archive
+
+
+class BackupError(ValueError):
+    pass
+
+
+def _begin_snapshot(conn):
+    """Starts one read transaction so every table is read from the same point in time."""
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+    elif conn.dialect.name == 'sqlite':
+        # pysqlite only opens transactions before writes; an explicit BEGIN holds the read snapshot/lock
+        conn.exec_driver_sql('BEGIN')
+
+
+def _write_table(conn, archive, table):
+    """Streams one table into archive members; returns its manifest entry."""
+    kinds = [column_kind(column) for column in table.columns]
+    encode = row_encoder(kinds)
+    to_json = json.JSONEncoder(separators=(',', ':')).encode
+    entry = {'name': table.name, 'columns': [[column.name, kind] for column, kind in zip(table.columns, kinds)],
+             'rows': 0, 'chunks': []}
+    result = conn.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(
+        select(table).order_by(*table.primary_key.columns))
+    member, member_rows = None, 0
+    for partition in result.partitions():
+        if member is None or member_rows >= BACKUP_CHUNK_ROWS:
+            if member is not None:
+                member.close()
+            name = f"tables/{table.name}/{len(entry['chunks']) + 1:05d}.jsonl"
+            entry['chunks'].append(name)
+            member, member_rows = archive.open(name, 'w', force_zip64=True), 0
+        # One JSON array of rows per line: one encode and one compress call per fetch, not per row
+        member.write(to_json([encode(row) for row in partition]).encode() + b'\n')
+        member_rows += len(partition)
+        entry['rows'] += len(partition)
+    if member is not None:
+        member.close()
+    return entry
+
+
+def create_backup(path, progress=None):
+    """
+    Writes every model table to a zip archive at path: one manifest.json
+    (column names and types per table) plus chunks of about BACKUP_CHUNK_ROWS
+    rows, all read from a single transaction and streamed straight into the
+    compressed archive.
+    Returns {table name: row count}.
+    """
+    temp_path = path + '.partial'
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    manifest = {
+        'format': BACKUP_FORMAT, 'format_version': BACKUP_FORMAT_VERSION,
+        'created_at': datetime.utcnow().isoformat(), 'source_dialect': db.engine.dialect.name, 'tables': [],
+    }
+    counts = {}
+    try:
+        with db.engine.connect() as conn, conn.begin():
+            _begin_snapshot(conn)
+            manifest['schema_version'] = max(applied_versions(conn), default=0)
+            with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL,
+                                 allowZip64=True) as archive:
+                for table in db.metadata.sorted_tables: # Parents before children, as restore needs them
+                    entry = _write_table(conn, archive, table)
+                    manifest['tables'].append(entry)
+                    counts[table.name] = entry['rows']
+                    if progress:
+                        progress(table.name, entry['rows'])
+                archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, path)
+    return counts
+
+
+def read_manifest(archive):
+    try:
+        manifest = json.loads(archive.read('manifest.json'))
+    except KeyError:
+        raise BackupError('Not a backup archive (no manifest.json).')
+    if manifest.get('format') != BACKUP_FORMAT or manifest.get('format_version') != BACKUP_FORMAT_VERSION:
+        raise BackupError('Unsupported backup format.')
+    return manifest
+
+
+def _reset_sequences(conn):
+    # Rows were inserted with explicit keys, so Postgres' serial sequences must catch up
+    quote = conn.dialect.identifier_preparer.quote # Unquoted, the table "user" would mean CURRENT_USER
+    for table in db.metadata.sorted_tables:
+        keys = list(table.primary_key.columns)
+        if len(keys) != 1 or not isinstance(keys[0].type, Integer):
+            continue
+        name = keys[0].name
+        # pg_get_serial_sequence parses its table argument as SQL but takes the column name literally
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{quote(table.name)}', '{name}'), "
+            f"COALESCE((SELECT MAX({quote(name)}) FROM {quote(table.name)}), 0) + 1, false)"))
+
+
+def restore_backup(path, replace=False, progress=None):
+    """
+    Migrates the target database, then bulk-loads an archive from create_backup()
+    in one transaction with Core executemany batches (no ORM objects). Refuses
+    a non-empty database unless replace=True, which deletes the existing rows
+    first. Returns {table name: rows restored}.
+    """
+    with zipfile.ZipFile(path) as archive:
+        manifest = read_manifest(archive)
+        latest = MIGRATIONS[-1][0]
+        if manifest.get('schema_version', 0) > latest:
+            raise BackupError(f"Backup is from schema version {manifest['schema_version']}; "
+                              f"this code only knows up to {latest}. Upgrade the app first.")
+        upgrade()
+        backed_up = {entry['name']: entry for entry in manifest['tables']}
+        counts = {}
+        conn = db.session.connection()
+        try:
+            tables = db.metadata.sorted_tables
+            if not replace:
+                for table in tables:
+                    if conn.execute(select(func.count()).select_from(table)).scalar():
+                        raise BackupError(f"Table '{table.name}' is not empty. Restore into a fresh database "
+                                          f"or pass --replace.")
+            else:
+                for table in reversed(tables): # Children before parents
+                    conn.execute(table.delete())
+
+            for table in tables:
+                entry = backed_up.get(table.name)
+                if entry is None:
+                    continue
+                # Columns the archive and the current schema share; new columns fall back to their defaults
+                keep = [(position, name, DECODERS.get(kind)) for position, (name, kind) in
+                        enumerate(entry['columns']) if name in table.c]
+                restored = 0
+                decode_row = row_decoder(keep)
+                for chunk in entry['chunks']:
+                    with archive.open(chunk) as member:
+                        for line in member: # One fetch's worth of rows: one executemany
+                            batch = [decode_row(values) for values in json.loads(line)]
+                            conn.execute(table.insert(), batch)
+                            restored += len(batch)
+                if restored != entry['rows']:
+                    raise BackupError(f"Table '{table.name}': expected {entry['rows']} rows, read {restored}.")
+                counts[table.name] = restored
+                if progress:
+                    progress(table.name, restored)
+
+            if conn.dialect.name == 'postgresql':
+                _reset_sequences(conn)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return counts
@@ -0,0 +1,185 @@
+# benchmarks/seed.py
+"""
+Deterministic synthetic data for benchmarks and local load testing.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/seed.py --scale medium
+
+Wipes the target database, migrates it and fills every table. The same
+--seed always produces the same rows.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCALES = {
+    # cows, years of daily milk logs, customers, sales per customer per year
+    'tiny': {'cows': 5, 'years': 1, 'customers': 10, 'sales_per_customer': 12},
+    'small': {'cows': 25, 'years': 1, 'customers': 200, 'sales_per_customer': 24},
+    'medium': {'cows': 100, 'years': 2, 'customers': 2000, 'sales_per_customer': 24},
+    'large': {'cows': 300, 'years': 5, 'customers': 5000, 'sales_per_customer': 24},
+}
+
+BREEDS = ('Friesian', 'Jersey', 'Ankole', 'Ayrshire', 'Guernsey')
+EXPENSE_CATEGORIES = ('Feed', 'Veterinary', 'Labour', 'Equipment', 'Utilities', 'Transport')
+VACCINES = ('FMD', 'Anthrax', 'Brucellosis', 'Lumpy Skin', 'Black Quarter')
+AILMENTS = ('Mastitis', 'Lameness', 'Bloat', 'Milk fever', 'Tick infestation', 'Cough')
+CHUNK_SIZE = 5000
+
+
+def reset_database():
+    """Drops every table (rollups and the migration log included) and migrates from scratch."""
+    from extensions import db
+    from migrations import schema_migration, upgrade
+    db.drop_all()
+    schema_migration.drop(bind=db.engine, checkfirst=True)
+    upgrade()
+
+
+def _insert(model, rows):
+    from bulk import bulk_insert
+    from extensions import db
+    for start in range(0, len(rows), CHUNK_SIZE):
+        bulk_insert(model, rows[start:start + CHUNK_SIZE], chunk_size=CHUNK_SIZE)
+        db.session.commit()
+
+
+def _stamp(day, rng):
+    return datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randrange(6 * 3600, 20 * 3600))
+
+
+def seed_database(scale='small', seed=42, today=None, progress=None):
+    """Fills an empty, migrated database. Returns {table name: row count}."""
+    from sqlalchemy import func, select
+
+    from extensions import db
+    from models import Cow, Customer, Expense, HealthRecord, MilkProduction, Payment, Sale, Vaccination
+    from rollups import rebuild_milk_rollups
+    from vaccinations import refresh_vaccination_statuses
+
+    params = SCALES[scale] if isinstance(scale, str) else scale
+    rng = random.Random(seed)
+    today = today or date.today()
+    days = [today - timedelta(days=offset) for offset in range(params['years'] * 365)]
+    counts = {}
+
+    def report(name, rows):
+        counts[name] = len(rows)
+        if progress:
+            progress(name, len(rows))
+
+    cows = []
+    for number in range(1, params['cows'] + 1):
+        is_pregnant = rng.random() < 0.3
+        cows.append({
+            'cow_id': f'C{number:05d}', 'name': f'Cow {number}', 'breed': rng.choice(BREEDS),
+            'date_of_birth': today - timedelta(days=rng.randrange(700, 3600)),
+            'status': 'active' if rng.random() < 0.9 else rng.choice(('sold', 'dry', 'deceased')),
+            'is_pregnant': is_pregnant,
+            'pregnancy_due_date': today + timedelta(days=rng.randrange(-2, 280)) if is_pregnant else None,
+        })
+    _insert(Cow, cows)
+    report('cow', cows)
+    cow_ids = list(db.session.scalars(select(Cow.id).order_by(Cow.id)))
+
+    # One row per cow per day, morning and evening milking
+    milk = []
+    for cow_id in cow_ids:
+        base = rng.uniform(4, 14)
+        for day in days:
+            milk.append({'cow_id': cow_id, 'date': day, 'timestamp': _stamp(day, rng),
+                         'morning_qty_liters': round(base * rng.uniform(0.8, 1.2), 1),
+                         'evening_qty_liters': round(base * rng.uniform(0.7, 1.1), 1)})
+        if len(milk) >= CHUNK_SIZE * 4:
+            _insert(MilkProduction, milk)
+            counts['milk_production'] = counts.get('milk_production', 0) + len(milk)
+            milk = []
+    _insert(MilkProduction, milk)
+    counts['milk_production'] = counts.get('milk_production', 0) + len(milk)
+    if progress:
+        progress('milk_production', counts['milk_production'])
+
+    health, vaccinations = [], []
+    for cow_id in cow_ids:
+        for _ in range(params['years'] * 2):
+            day = rng.choice(days)
+            health.append({'cow_id': cow_id, 'date': day, 'timestamp': _stamp(day, rng),
+                           'description': f'{rng.choice(AILMENTS)} observed during milking',
+                           'treatment': rng.choice(('Antibiotics', 'Rest', 'Anti-inflammatory', None)),
+                           'veterinarian': rng.choice(('Dr. Uwase', 'Dr. Habimana', None))})
+        for _ in range(params['years'] * 2):
+            day = rng.choice(days)
+            next_due = day + timedelta(days=rng.choice((90, 180, 365)))
+            vaccinations.append({'cow_id': cow_id, 'vaccine_name': rng.choice(VACCINES), 'vaccination_date': day,
+                                 'next_due_date': next_due, 'timestamp': _stamp(day, rng), 'status': 'Due',
+                                 'notes': rng.choice(('Booster', 'Annual dose', None))})
+    _insert(HealthRecord, health)
+    report('health_record', health)
+    _insert(Vaccination, vaccinations)
+    report('vaccination', vaccinations)
+
+    customers = [{'name': f'Customer {number}', 'contact_info': f'+2507{number:08d}', 'balance': 0}
+                 for number in range(1, params['customers'] + 1)]
+    _insert(Customer, customers)
+    report('customer', customers)
+    customer_ids = list(db.session.scalars(select(Customer.id).order_by(Customer.id)))
+
+    sales, payments = [], []
+    sale_count = params['customers'] * params['sales_per_customer'] * params['years']
+    for _ in range(sale_count):
+        day = rng.choice(days)
+        customer_id = rng.choice(customer_ids)
+        qty = round(rng.uniform(1, 40), 1)
+        price = rng.choice((300, 350, 400, 450))
+        is_paid = rng.random() < 0.7
+        sales.append({'customer_id': customer_id, 'date': day, 'timestamp': _stamp(day, rng),
+                      'milk_quantity_liters': qty, 'price_per_liter': price,
+                      'total_amount': round(qty * price, 2), 'is_paid': is_paid})
+        if is_paid:
+            pay_day = min(today, day + timedelta(days=rng.randrange(0, 30)))
+            payments.append({'customer_id': customer_id, 'date': pay_day, 'timestamp': _stamp(pay_day, rng),
+                             'amount_received': round(qty * price, 2), 'description': 'Milk payment'})
+    _insert(Sale, sales)
+    report('sale', sales)
+    _insert(Payment, payments)
+    report('payment', payments)
+
+    expenses = []
+    for day in days:
+        for _ in range(rng.randrange(1, 5)):
+            expenses.append({'date': day, 'timestamp': _stamp(day, rng), 'category': rng.choice(EXPENSE_CATEGORIES),
+                             'amount': round(rng.uniform(2000, 150000), 2), 'description': 'Synthetic expense'})
+    _insert(Expense, expenses)
+    report('expense', expenses)
+
+    # Derived state: rollups, balances and vaccination statuses, computed in SQL the same way the app maintains them
+    rebuild_milk_rollups()
+    refresh_vaccination_statuses(today, 30)
+    sold = select(func.coalesce(func.sum(Sale.total_amount), 0)).where(Sale.customer_id == Customer.id)
+    paid = select(func.coalesce(func.sum(Payment.amount_received), 0)).where(Payment.customer_id == Customer.id)
+    Customer.query.update({Customer.balance: sold.scalar_subquery() - paid.scalar_subquery()},
+                          synchronize_session=False)
+    db.session.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import app
+    start = time.perf_counter()
+    with app.app_context():
+        reset_database()
+        seed_database(args.scale, args.seed, progress=lambda name, count: print(f'  {name}: {count} rows'))
+    print(f'Seeded {args.scale} data in {time.perf_counter() - start:.1f} s.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/startup.py
+"""
+Measures worker boot cost: the time to import the app in a fresh interpreter
+and the resident memory afterwards, which is what every gunicorn worker pays
+on boot or restart (without --preload).
+
+    python benchmarks/startup.py                     # 5 runs, prints a summary
+    python benchmarks/startup.py --json startup.json # also writes the numbers
+    python benchmarks/startup.py --baseline startup.json --tolerance 0.25
+
+With --baseline, exits non-zero when the median boot time or RSS regresses by
+more than the tolerance, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported at boot; they load on first use
+LAZY_MODULES = ('openpyxl', 'pandas', 'numpy')
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024 # bytes on macOS
+print(json.dumps({
+    'import_seconds': elapsed,
+    'rss_mb': rss_kb / 1024,
+    'eager_heavy_modules': [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def measure_once():
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    env.setdefault('DATABASE_URL', 'sqlite://') # Importing the app never connects; this only picks the driver
+    probe = subprocess.run([sys.executable, '-c', PROBE], cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    if probe.returncode != 0:
+        sys.exit(f'Importing the app failed:\n{probe.stderr}')
+    return json.loads(probe.stdout.strip().splitlines()[-1])
+
+
+def run(runs):
+    measure_once() # Warm the bytecode cache so every timed run is comparable
+    samples = [measure_once() for _ in range(runs)]
+    times = [sample['import_seconds'] for sample in samples]
+    rss = [sample['rss_mb'] for sample in samples]
+    return {
+        'runs': runs,
+        'python': sys.version.split()[0],
+        'import_seconds_median': statistics.median(times),
+        'import_seconds_min': min(times),
+        'import_seconds_max': max(times),
+        'rss_mb_median': statistics.median(rss),
+        'eager_heavy_modules': samples[-1]['eager_heavy_modules'],
+    }
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for key in ('import_seconds_median', 'rss_mb_median'):
+        if baseline.get(key) and result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f'{key}: {result[key]:.3f} vs baseline {baseline[key]:.3f}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', dest='json_path', help='Write the results to this file.')
+    parser.add_argument('--baseline', help='Compare against a previously written results file.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed regression (0.25 = 25%%).')
+    args = parser.parse_args()
+
+    result = run(max(1, args.runs))
+    print(f"app import: median {result['import_seconds_median'] * 1000:.0f} ms "
+          f"(min {result['import_seconds_min'] * 1000:.0f}, max {result['import_seconds_max'] * 1000:.0f}) "
+          f"over {result['runs']} runs")
+    print(f"worker RSS after import: {result['rss_mb_median']:.1f} MB")
+    if result['eager_heavy_modules']:
+        print(f"WARNING: imported at boot: {', '.join(result['eager_heavy_modules'])}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    failed = bool(result['eager_heavy_modules'])
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+# bulk.py
+from sqlalchemy import insert, update
+
+from extensions import db
+
+BULK_CHUNK_SIZE = 1000
+
+
+def bulk_insert(model, rows, chunk_size=BULK_CHUNK_SIZE):
+    """Inserts a list of column dicts with executemany, chunk_size rows per statement batch."""
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(model), rows[start:start + chunk_size])
+
+
+def bulk_update(model, rows, chunk_size=BULK_CHUNK_SIZE):
+    """Updates rows by primary key; each dict must contain 'id' plus the columns to change."""
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(update(model), rows[start:start + chunk_size])
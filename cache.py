@@ -0,0 +1,102 @@
+# cache.py
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+ALL_KEYS = True # Returned by a write scanner when it can't tell which keys a write touched
+
+
+class KeyedCache:
+    """
+    Values per key for up to `ttl` seconds; thread-safe, per worker process.
+    An entry is only served for the `tag` it was built for (e.g. an as-of
+    date). A value whose key was invalidated while it was being built is
+    returned but not cached, so a build that raced with a write can't stick.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {} # key -> (tag, expires_at, value)
+        self._versions = {} # key -> invalidation count
+        self._generation = 0 # bumped by invalidate_all()
+
+    def get_many(self, keys, ttl, build, tag=None):
+        """{key: value} for keys; build(missing keys) returns {key: value} for the misses."""
+        hits, misses = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == tag and now < entry[1]:
+                    hits[key] = entry[2]
+                else:
+                    misses.append(key)
+            versions = {key: self._versions.get(key, 0) for key in misses}
+            generation = self._generation
+
+        if misses:
+            built = build(misses)
+            with self._lock:
+                if generation == self._generation:
+                    for key, value in built.items():
+                        if versions[key] == self._versions.get(key, 0):
+                            self._entries[key] = (tag, now + ttl, value)
+            hits.update(built)
+        return hits
+
+    def get(self, key, ttl, build, tag=None):
+        """The value for key; build() makes it on a miss."""
+        return self.get_many([key], ttl, lambda keys: {key: build()}, tag)[key]
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+def invalidate_on_commit(cache, name, flushed_keys, bulk_keys):
+    """
+    Drops the keys a session's writes touch from `cache` once its transaction
+    commits; a rollback drops nothing. flushed_keys(session) scans a flush and
+    bulk_keys(orm_execute_state) a bulk insert/update/delete statement (those
+    skip the flush); each returns the keys touched, ALL_KEYS, or nothing.
+    Writes made by other processes are only seen when the entries expire.
+    """
+    info_key = f'{name}_dirty'
+
+    def mark(session, keys):
+        if keys is ALL_KEYS:
+            session.info[info_key] = ALL_KEYS
+        elif keys:
+            dirty = session.info.setdefault(info_key, set())
+            if dirty is not ALL_KEYS:
+                dirty.update(keys)
+
+    @event.listens_for(Session, 'after_flush')
+    def _flag_flushed_writes(session, flush_context):
+        mark(session, flushed_keys(session))
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _flag_bulk_writes(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            mark(orm_execute_state.session, bulk_keys(orm_execute_state))
+
+    @event.listens_for(Session, 'after_commit')
+    def _invalidate_on_commit(session):
+        dirty = session.info.pop(info_key, None)
+        if dirty is ALL_KEYS:
+            cache.invalidate_all()
+        elif dirty:
+            cache.invalidate(dirty)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _reset_on_rollback(session):
+        session.info.pop(info_key, None)
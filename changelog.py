@@ -0,0 +1,170 @@
+# changelog.py
+from datetime import datetime
+
+from sqlalchemy import BigInteger, event, literal_column, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import ChangeLog, Cow, Customer, Expense, HealthRecord, MilkProduction, Payment, Sale, Vaccination
+from rowcodec import column_kind, row_encoder
+
+TRACKED_MODELS = (Cow, MilkProduction, HealthRecord, Vaccination, Customer, Sale, Payment, Expense)
+TRACKED_TABLES = {model.__tablename__: model for model in TRACKED_MODELS}
+MAX_CHANGES_PAGE = 5000
+
+
+def _write_changes(session, entries):
+    """Appends (table, row id, op) entries to the change log in the session's transaction."""
+    if not entries:
+        return
+    conn = session.connection()
+    txid = session.info.get('changelog_txid')
+    if txid is None:
+        # Postgres: the writing transaction's id, see changes_since(). SQLite has a single writer, so its
+        # transactions commit in version order and every entry keeps txid 0.
+        txid = 0
+        if conn.dialect.name == 'postgresql':
+            txid = conn.execute(text('SELECT pg_current_xact_id()::text::bigint')).scalar()
+        session.info['changelog_txid'] = txid
+    now = datetime.utcnow()
+    conn.execute(ChangeLog.__table__.insert(), [
+        {'txid': txid, 'table_name': table_name, 'row_id': row_id, 'op': op, 'changed_at': now}
+        for table_name, row_id, op in entries
+    ])
+
+
+def _log_flushed_changes(session, flush_context):
+    entries = []
+    for objects, op in ((session.new, 'I'), (session.dirty, 'U'), (session.deleted, 'D')):
+        for obj in objects:
+            if isinstance(obj, TRACKED_MODELS) and (op != 'U' or session.is_modified(obj)):
+                entries.append((obj.__tablename__, obj.id, op))
+    _write_changes(session, entries)
+
+
+def _log_bulk_changes(orm_execute_state):
+    """
+    Bulk insert()/update()/delete() statements skip the flush. Inserts get
+    their new ids through RETURNING; criteria updates/deletes select the ids
+    they are about to touch. Returning the insert's result ends the
+    do_orm_execute chain, hence init_change_log() registering this last.
+    """
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    mapper = state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, TRACKED_MODELS):
+        return None
+    model, statement = mapper.class_, state.statement
+    table_name = model.__tablename__
+
+    if state.is_insert:
+        # Appending the primary key keeps any RETURNING the caller asked for in front of it
+        frozen = state.invoke_statement(
+            statement=statement.returning(model.id, sort_by_parameter_order=True)).freeze()
+        _write_changes(state.session, [(table_name, row[-1], 'I') for row in frozen.data])
+        return frozen()
+
+    parameters = state.parameters
+    if isinstance(parameters, list) and statement.whereclause is None:
+        # Bulk UPDATE by primary key: the ids are in the parameter rows
+        row_ids = [row['id'] for row in parameters]
+    else:
+        ids = select(model.id)
+        if statement.whereclause is not None:
+            ids = ids.where(statement.whereclause)
+        row_ids = list(state.session.connection().execute(ids).scalars())
+    _write_changes(state.session, [(table_name, row_id, 'U' if state.is_update else 'D') for row_id in row_ids])
+    return None
+
+
+def _reset_changelog_txid(session):
+    session.info.pop('changelog_txid', None)
+
+
+def init_change_log(app):
+    """Call after every other module's Session listeners are registered (see _log_bulk_changes)."""
+    if event.contains(Session, 'after_flush', _log_flushed_changes):
+        return
+    event.listen(Session, 'after_flush', _log_flushed_changes)
+    event.listen(Session, 'do_orm_execute', _log_bulk_changes)
+    event.listen(Session, 'after_commit', _reset_changelog_txid)
+    event.listen(Session, 'after_rollback', _reset_changelog_txid)
+
+
+class UnknownVersion(ValueError):
+    pass
+
+
+def _settled(query):
+    """
+    Limits a change log query to finished transactions. Concurrent Postgres
+    writers are not serialized, so a transaction still in progress may hold
+    lower versions than ones already committed. Every transaction id below
+    the snapshot's xmin has finished, so that part of the log never changes
+    again; reading it in (txid, version) order means a client resuming from
+    its last entry never skips a slower commit.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        query = query.where(ChangeLog.txid < literal_column(
+            'pg_snapshot_xmin(pg_current_snapshot())::text::bigint', BigInteger))
+    return query
+
+
+def latest_version():
+    """The last version a client can currently read up to (0 for an empty log)."""
+    query = select(ChangeLog.version).order_by(ChangeLog.txid.desc(), ChangeLog.version.desc()).limit(1)
+    return db.session.scalar(_settled(query)) or 0
+
+
+def changes_since(since, limit, tables=None):
+    """
+    One page of the change log after version `since`, collapsed to the last
+    change per row: current column values for rows inserted/updated in the
+    page (columnar, one query per table) and ids for deleted ones. Returns the
+    response body; `next` is the version to pass as `since` for the next page.
+    The log is read in (txid, version) order, see _settled(); `since` must be
+    0 or a version this returned before (UnknownVersion otherwise).
+    """
+    limit = max(1, min(limit, MAX_CHANGES_PAGE))
+    query = select(ChangeLog.version, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.op) \
+        .order_by(ChangeLog.txid, ChangeLog.version).limit(limit + 1)
+    if since:
+        position = db.session.execute(
+            select(ChangeLog.txid, ChangeLog.version).where(ChangeLog.version == since)).first()
+        if position is None:
+            raise UnknownVersion(f'Unknown change log version {since}.')
+        query = query.where(tuple_(ChangeLog.txid, ChangeLog.version) > tuple_(*position))
+    query = _settled(query)
+    if tables:
+        query = query.where(ChangeLog.table_name.in_(tables))
+    entries = db.session.execute(query).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    last_op = {} # (table, row id) -> op, later entries win
+    for version, table_name, row_id, op in entries:
+        last_op[(table_name, row_id)] = op
+
+    upserts, deletes = {}, {}
+    by_table = {}
+    for (table_name, row_id), op in last_op.items():
+        if op == 'D':
+            deletes.setdefault(table_name, []).append(row_id)
+        else:
+            by_table.setdefault(table_name, []).append(row_id)
+    for table_name, row_ids in by_table.items():
+        table = TRACKED_TABLES[table_name].__table__
+        columns = list(table.columns)
+        encode = row_encoder([column_kind(column) for column in columns])
+        rows = db.session.execute(select(table).where(table.c.id.in_(row_ids)).order_by(table.c.id)).all()
+        # A row missing here was deleted after this page; its delete comes in a later page
+        upserts[table_name] = {'columns': [column.name for column in columns], 'rows': [encode(row) for row in rows]}
+
+    return {
+        'since': since,
+        'next': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'upserts': upserts,
+        'deletes': deletes,
+    }
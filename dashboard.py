@@ -0,0 +1,109 @@
+# dashboard.py
+from collections import namedtuple
+from datetime import date, timedelta
+
+from sqlalchemy import and_, func, or_
+
+from cache import ALL_KEYS, KeyedCache, invalidate_on_commit
+from extensions import db
+from models import Cow, Customer, Expense, MilkProduction, Sale, Vaccination
+from rollups import herd_milk_total
+
+# Models whose writes change the dashboard figures
+DASHBOARD_MODELS = (Cow, MilkProduction, Sale, Expense, Vaccination, Customer)
+
+VaccinationReminder = namedtuple('VaccinationReminder', 'cow_name cow_tag vaccine_name next_due_date')
+PregnancyReminder = namedtuple('PregnancyReminder', 'name cow_id pregnancy_due_date')
+RecentSale = namedtuple('RecentSale', 'date customer_name milk_quantity_liters total_amount')
+RecentExpense = namedtuple('RecentExpense', 'date category amount description')
+
+
+dashboard_cache = KeyedCache() # One entry: the snapshot, tagged with the day it was built for
+
+
+def invalidate_dashboard():
+    """Call after writes that bypass the ORM session (Core bulk inserts etc.)."""
+    dashboard_cache.invalidate_all()
+
+
+def upcoming_vaccinations_filter(today, due_window_days):
+    # Status is precomputed by vaccinations.refresh_vaccination_statuses() (index on status, next_due_date).
+    # 'Scheduled' doses already inside the window are included, so a late refresh can't hide a reminder.
+    return or_(
+        Vaccination.status == 'Due',
+        and_(Vaccination.status == 'Scheduled', Vaccination.next_due_date <= today + timedelta(days=due_window_days)),
+    )
+
+
+def build_dashboard_snapshot(today, due_window_days):
+    total_cows = Cow.query.count()
+    active_cows = Cow.query.filter_by(status='active').count()
+
+    upcoming_vaccinations = [
+        VaccinationReminder(*row) for row in db.session.query(
+            Cow.name, Cow.cow_id, Vaccination.vaccine_name, Vaccination.next_due_date
+        ).join(Cow, Vaccination.cow_id == Cow.id).filter(
+            upcoming_vaccinations_filter(today, due_window_days)
+        ).order_by(Vaccination.next_due_date)
+    ]
+
+    pregnancy_end_window = today + timedelta(days=4)
+    pregnant_cow_reminders = [
+        PregnancyReminder(*row) for row in db.session.query(
+            Cow.name, Cow.cow_id, Cow.pregnancy_due_date
+        ).filter(
+            Cow.is_pregnant == True,
+            Cow.pregnancy_due_date >= today,
+            Cow.pregnancy_due_date <= pregnancy_end_window
+        ).order_by(Cow.pregnancy_due_date)
+    ]
+
+    total_today_milk = herd_milk_total(today, today)
+
+    total_receivable = db.session.query(func.sum(Customer.balance)).scalar() or 0.0
+
+    recent_sales = [
+        RecentSale(*row) for row in db.session.query(
+            Sale.date, Customer.name, Sale.milk_quantity_liters, Sale.total_amount
+        ).join(Customer, Sale.customer_id == Customer.id).order_by(Sale.timestamp.desc()).limit(5)
+    ]
+    recent_expenses = [
+        RecentExpense(*row) for row in db.session.query(
+            Expense.date, Expense.category, Expense.amount, Expense.description
+        ).order_by(Expense.timestamp.desc()).limit(5)
+    ]
+
+    # Plain values only: the snapshot outlives the request's session
+    return {
+        'total_cows': total_cows,
+        'active_cows': active_cows,
+        'total_today_milk': total_today_milk,
+        'total_receivable': total_receivable,
+        'recent_sales': recent_sales,
+        'recent_expenses': recent_expenses,
+        'upcoming_vaccinations': upcoming_vaccinations,
+        'pregnant_cow_reminders': pregnant_cow_reminders,
+    }
+
+
+def get_dashboard_snapshot(ttl, due_window_days):
+    today = date.today()
+    return dashboard_cache.get('snapshot', ttl, lambda: build_dashboard_snapshot(today, due_window_days), tag=today)
+
+
+# --- Invalidation: any committed write to a dashboard model drops the snapshot ---
+def _flushed_dashboard_writes(session):
+    for objects in (session.new, session.dirty, session.deleted):
+        if any(isinstance(obj, DASHBOARD_MODELS) for obj in objects):
+            return ALL_KEYS
+    return None
+
+
+def _bulk_dashboard_writes(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, DASHBOARD_MODELS):
+        return ALL_KEYS
+    return None
+
+
+invalidate_on_commit(dashboard_cache, 'dashboard', _flushed_dashboard_writes, _bulk_dashboard_writes)
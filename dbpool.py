@@ -0,0 +1,133 @@
+# dbpool.py
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+from extensions import db
+
+POOL_PROFILES = ('default', 'pgbouncer')
+
+
+class PoolStats:
+    """Checkout wait times for this worker's pool; thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+            }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout()
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+def engine_options(config):
+    """Builds SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings in config."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {} # Flask-SQLAlchemy picks the right pool for file/memory databases
+
+    profile = config['DB_POOL_PROFILE']
+    if profile not in POOL_PROFILES:
+        raise ValueError(f"DB_POOL_PROFILE must be one of {', '.join(POOL_PROFILES)}, not '{profile}'.")
+
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if config['DB_POOL_SIZE'] <= 0:
+        options['poolclass'] = NullPool # Connect per checkout; let an external pooler do the pooling
+    else:
+        options.update({
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+        })
+
+    connect_args = {}
+    timeout_ms = config['DB_STATEMENT_TIMEOUT_MS']
+    if url.get_backend_name() == 'postgresql':
+        if profile == 'pgbouncer':
+            # Transaction pooling: no startup options, no session state, no server-side prepared statements
+            if url.get_driver_name() == 'psycopg':
+                connect_args['prepare_threshold'] = None
+        elif timeout_ms > 0:
+            connect_args['options'] = f'-c statement_timeout={timeout_ms}'
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def init_db_pool(app):
+    """Registers the per-transaction statement timeout needed under PgBouncer transaction pooling."""
+    timeout_ms = app.config['DB_STATEMENT_TIMEOUT_MS']
+    if app.config['DB_POOL_PROFILE'] != 'pgbouncer' or timeout_ms <= 0:
+        return
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        return
+
+    @event.listens_for(engine, 'begin')
+    def _set_statement_timeout(conn):
+        # SET LOCAL ends with the transaction, so nothing leaks to the next client of the server connection
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+
+
+def pool_status():
+    """Connection counts for this worker's pool plus checkout wait times."""
+    pool = db.engine.pool
+    status = {'pid': os.getpid(), 'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+    else:
+        status['status'] = pool.status()
+    status.update(pool_stats.as_dict())
+    return status
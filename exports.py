@@ -0,0 +1,97 @@
+# exports.py
+import csv
+import io
+import os
+import tempfile
+from datetime import date
+
+from flask import Response, request, send_file, stream_with_context
+
+EXCEL_MAX_ROWS = 1048576 # Excel's hard per-sheet row limit (header row included)
+EXCEL_MAX_SHEET_TITLE = 31
+EXPORT_CHUNK_SIZE = 1000 # Rows fetched per database round trip
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _sheet_title(sheet_name, index):
+    if index == 1:
+        return sheet_name[:EXCEL_MAX_SHEET_TITLE]
+    suffix = f' ({index})'
+    return sheet_name[:EXCEL_MAX_SHEET_TITLE - len(suffix)] + suffix
+
+
+def write_xlsx(fileobj, sheet_name, headers, rows):
+    """Writes rows to fileobj as XLSX, spilling onto extra sheets past Excel's row limit."""
+    from openpyxl import Workbook # Heavy import, only paid by workers that actually export XLSX
+
+    # Write-only workbooks flush each row to a temp file, so memory stays flat
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_count = 0
+    sheet_rows = EXCEL_MAX_ROWS
+    for row in rows:
+        if sheet_rows >= EXCEL_MAX_ROWS:
+            sheet_count += 1
+            sheet = workbook.create_sheet(_sheet_title(sheet_name, sheet_count))
+            sheet.append(headers)
+            sheet_rows = 1
+        sheet.append(row)
+        sheet_rows += 1
+
+    if sheet is None: # Empty table: still produce a sheet with the header row
+        workbook.create_sheet(_sheet_title(sheet_name, 1)).append(headers)
+    workbook.save(fileobj)
+
+
+def iter_csv(headers, rows):
+    """Yields CSV text in chunks of EXPORT_CHUNK_SIZE rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def iter_export_rows(query, format_row):
+    # yield_per streams results (server-side cursor on Postgres) instead of loading the table
+    for row in query.yield_per(EXPORT_CHUNK_SIZE):
+        yield format_row(row)
+
+
+def write_export(directory, query, headers, format_row, sheet_name, filename_prefix, file_format='xlsx'):
+    """Writes an export to a file in directory (for background jobs). Returns its path."""
+    extension = 'csv' if file_format == 'csv' else 'xlsx'
+    path = os.path.join(directory, f'{filename_prefix}_{date.today().strftime("%Y%m%d")}.{extension}')
+    if extension == 'csv':
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            for chunk in iter_csv(headers, iter_export_rows(query, format_row)):
+                output.write(chunk)
+    else:
+        with open(path, 'wb') as output:
+            write_xlsx(output, sheet_name, headers, iter_export_rows(query, format_row))
+    return path
+
+
+def export_response(query, headers, format_row, sheet_name, filename_prefix):
+    """Streams a column query as XLSX (default) or CSV (?format=csv)."""
+    filename = f'{filename_prefix}_{date.today().strftime("%Y%m%d")}'
+
+    if request.args.get('format') == 'csv':
+        return Response(stream_with_context(iter_csv(headers, iter_export_rows(query, format_row))),
+                        mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}.csv'})
+
+    # XLSX is a zip archive, so it is assembled on disk and then sent in chunks
+    output = tempfile.TemporaryFile()
+    try:
+        write_xlsx(output, sheet_name, headers, iter_export_rows(query, format_row))
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return send_file(output, as_attachment=True, download_name=f'{filename}.xlsx', mimetype=XLSX_MIMETYPE)
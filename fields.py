@@ -0,0 +1,59 @@
+# fields.py
+import math
+from datetime import date, datetime
+
+from ledger import to_money
+
+# Parsers for one field of an incoming record (an import file row or a sync API record),
+# given as {field: value}. Each returns None for a blank optional field or raises FieldError.
+
+
+class FieldError(ValueError):
+    """A record field is missing or malformed; the record is rejected with this message."""
+
+
+def text_field(record, field, required=False):
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise FieldError(f"'{field}' is required.")
+    return value or None
+
+
+def date_field(record, field, required=False):
+    value = record.get(field)
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = text_field(record, field, required)
+    if text is None:
+        return None
+    try:
+        return datetime.strptime(text[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise FieldError(f"'{field}' must be a date in YYYY-MM-DD format.")
+
+
+def number_field(record, field, required=False, default=None):
+    text = text_field(record, field, required)
+    if text is None:
+        return default
+    try:
+        value = float(text)
+    except ValueError:
+        raise FieldError(f"'{field}' must be a number.")
+    if not math.isfinite(value): # float() also accepts 'nan' and 'inf'
+        raise FieldError(f"'{field}' must be a finite number.")
+    if value < 0:
+        raise FieldError(f"'{field}' cannot be negative.")
+    return value
+
+
+def money_field(record, field, required=False):
+    value = number_field(record, field, required)
+    return None if value is None else to_money(record.get(field))
+
+
+def flag_field(record, field):
+    return (text_field(record, field) or '').lower() in ('1', 'yes', 'y', 'true', 'paid')
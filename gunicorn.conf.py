@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` (see Procfile).
+import os
+
+# Import the app once in the master and fork workers from it: restarts and
+# extra workers skip the import entirely and share its memory copy-on-write.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def on_starting(server):
+    # Multi-worker metrics: samples from a previous run must not leak into this one
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            if name.endswith('.db'):
+                os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    # Never share pooled connections the master may have opened across processes
+    from app import app
+    from extensions import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,264 @@
+# importer.py
+import csv
+import io
+import re
+from collections import defaultdict
+
+from bulk import bulk_insert
+from extensions import db
+from fields import FieldError, date_field, flag_field, money_field, number_field, text_field
+from ledger import adjust_customer_balance, sale_total
+from models import Cow, Customer, Expense, MilkProduction, Payment, Sale
+from rollups import apply_milk_deltas
+
+IMPORT_KINDS = ('cows', 'milk', 'sales', 'payments', 'expenses')
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 200
+
+# Accepted (normalised) column headers per field; the export headers are included so exports re-import
+COLUMN_ALIASES = {
+    'date': ('date', 'sale_date', 'payment_date', 'expense_date'),
+    'cow_id': ('cow_id', 'cow', 'cow_tag'),
+    'name': ('name', 'cow_name'),
+    'breed': ('breed',),
+    'date_of_birth': ('date_of_birth', 'dob'),
+    'status': ('status',),
+    'is_pregnant': ('is_pregnant', 'pregnant'),
+    'pregnancy_due_date': ('pregnancy_due_date', 'due_date', 'calving_date'),
+    'morning_qty': ('morning_qty', 'morning', 'morning_quantity_l', 'morning_qty_liters'),
+    'evening_qty': ('evening_qty', 'evening', 'evening_quantity_l', 'evening_qty_liters'),
+    'customer': ('customer', 'customer_name'),
+    'milk_qty': ('milk_qty', 'quantity', 'milk_quantity_l', 'milk_quantity_liters'),
+    'price_per_liter': ('price_per_liter', 'price_per_liter_rwf', 'price'),
+    'total_amount': ('total_amount', 'total_amount_rwf', 'total'),
+    'is_paid': ('is_paid', 'paid'),
+    'amount': ('amount', 'amount_rwf', 'amount_received', 'amount_received_rwf'),
+    'category': ('category',),
+    'description': ('description', 'notes'),
+}
+_ALIAS_LOOKUP = {alias: field for field, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+
+class ImportRowError(FieldError):
+    """A single input row failed validation; the row is skipped and reported."""
+
+
+class ImportResult:
+    def __init__(self, kind):
+        self.kind = kind
+        self.processed = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = [] # (line number, message), capped at MAX_REPORTED_ERRORS
+        self.aborted = False
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+# --- Reading (streamed, one row at a time) ---
+def _normalise_header(header):
+    return re.sub(r'[^a-z0-9]+', '_', str(header or '').strip().lower()).strip('_')
+
+
+def _map_headers(headers):
+    return [_ALIAS_LOOKUP.get(_normalise_header(header)) for header in headers]
+
+
+def iter_csv_records(fileobj):
+    """Yields (line number, {field: value}) from a binary CSV stream."""
+    reader = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    fields = _map_headers(next(reader, []))
+    for line, values in enumerate(reader, start=2):
+        if any(value.strip() for value in values):
+            yield line, {field: value for field, value in zip(fields, values) if field}
+
+
+def iter_xlsx_records(fileobj):
+    """Yields (line number, {field: value}) from the first sheet of an XLSX file."""
+    from openpyxl import load_workbook
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        fields = _map_headers(next(rows, ()))
+        for line, values in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in values):
+                yield line, {field: value for field, value in zip(fields, values) if field}
+    finally:
+        workbook.close()
+
+
+def iter_records(fileobj, filename):
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx_records(fileobj)
+    return iter_csv_records(fileobj)
+
+
+class Importer:
+    """
+    Validates rows against the models and bulk-inserts them chunk by chunk.
+    Each chunk is one transaction: the INSERT, the rollup deltas and the
+    aggregated customer balance changes are committed together.
+    """
+
+    def __init__(self, kind, chunk_size=DEFAULT_CHUNK_SIZE, create_customers=False, progress=None):
+        if kind not in IMPORT_KINDS:
+            raise ValueError(f"Unknown import kind '{kind}'. Use one of: {', '.join(IMPORT_KINDS)}.")
+        self.kind = kind
+        self.chunk_size = max(1, chunk_size)
+        self.create_customers = create_customers
+        self.progress = progress
+        self.model = {'cows': Cow, 'milk': MilkProduction, 'sales': Sale,
+                      'payments': Payment, 'expenses': Expense}[kind]
+        self.build_row = getattr(self, f'_build_{kind}')
+        # In-memory lookup maps, loaded once per import
+        self.cows = {}
+        self.customers = {}
+        if kind in ('cows', 'milk'):
+            self.cows = {tag: pk for pk, tag in db.session.query(Cow.id, Cow.cow_id)}
+        if kind in ('sales', 'payments'):
+            for pk, name in db.session.query(Customer.id, Customer.name).order_by(Customer.id.desc()):
+                self.customers[name.strip().lower()] = pk # Lowest id wins for duplicate names
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self.rows = []
+        self.milk_deltas = defaultdict(lambda: [0.0, 0.0, 0])
+        self.balance_deltas = defaultdict(int)
+
+    # --- Per-kind row builders ---
+    def _build_cows(self, record):
+        tag = text_field(record, 'cow_id', required=True)
+        if tag in self.cows:
+            raise ImportRowError(f"Cow ID '{tag}' already exists.")
+        is_pregnant = flag_field(record, 'is_pregnant')
+        row = {
+            'cow_id': tag,
+            'name': text_field(record, 'name', required=True),
+            'breed': text_field(record, 'breed'),
+            'date_of_birth': date_field(record, 'date_of_birth'),
+            'status': text_field(record, 'status') or 'active',
+            'is_pregnant': is_pregnant,
+            'pregnancy_due_date': date_field(record, 'pregnancy_due_date') if is_pregnant else None,
+        }
+        self.cows[tag] = None # Reserve the tag so duplicates within the file are caught
+        return row
+
+    def _build_milk(self, record):
+        tag = text_field(record, 'cow_id', required=True)
+        cow_id = self.cows.get(tag)
+        if cow_id is None:
+            raise ImportRowError(f"Unknown Cow ID '{tag}'.")
+        row = {
+            'cow_id': cow_id,
+            'date': date_field(record, 'date', required=True),
+            'morning_qty_liters': number_field(record, 'morning_qty', default=0.0),
+            'evening_qty_liters': number_field(record, 'evening_qty', default=0.0),
+        }
+        delta = self.milk_deltas[(cow_id, row['date'])]
+        delta[0] += row['morning_qty_liters']
+        delta[1] += row['evening_qty_liters']
+        delta[2] += 1
+        return row
+
+    def _customer_id(self, record):
+        name = text_field(record, 'customer', required=True)
+        customer_id = self.customers.get(name.lower())
+        if customer_id is None:
+            if not self.create_customers:
+                raise ImportRowError(f"Unknown customer '{name}'.")
+            customer = Customer(name=name, balance=0)
+            db.session.add(customer)
+            db.session.flush()
+            customer_id = self.customers[name.lower()] = customer.id
+        return customer_id
+
+    def _build_sales(self, record):
+        milk_qty = number_field(record, 'milk_qty', required=True)
+        price_per_liter = money_field(record, 'price_per_liter', required=True)
+        total_amount = money_field(record, 'total_amount')
+        row = {
+            'date': date_field(record, 'date', required=True),
+            'milk_quantity_liters': milk_qty,
+            'price_per_liter': price_per_liter,
+            'total_amount': total_amount if total_amount is not None else sale_total(milk_qty, price_per_liter),
+            'is_paid': flag_field(record, 'is_paid'),
+        }
+        row['customer_id'] = self._customer_id(record)
+        self.balance_deltas[row['customer_id']] += row['total_amount']
+        return row
+
+    def _build_payments(self, record):
+        row = {
+            'date': date_field(record, 'date', required=True),
+            'amount_received': money_field(record, 'amount', required=True),
+            'description': text_field(record, 'description'),
+        }
+        row['customer_id'] = self._customer_id(record)
+        self.balance_deltas[row['customer_id']] -= row['amount_received']
+        return row
+
+    def _build_expenses(self, record):
+        return {
+            'date': date_field(record, 'date', required=True),
+            'category': text_field(record, 'category', required=True),
+            'amount': money_field(record, 'amount', required=True),
+            'description': text_field(record, 'description'),
+        }
+
+    # --- Driving the import ---
+    def _flush_chunk(self, result):
+        if not self.rows:
+            return
+        try:
+            bulk_insert(self.model, self.rows, chunk_size=self.chunk_size)
+            if self.milk_deltas:
+                apply_milk_deltas({key: tuple(value) for key, value in self.milk_deltas.items()})
+            for customer_id, delta in self.balance_deltas.items():
+                adjust_customer_balance(customer_id, delta)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        result.imported += len(self.rows)
+        if self.kind == 'cows':
+            # Swap the reserved tags for real ids (keeps later duplicate checks cheap)
+            self.cows.update({tag: pk for pk, tag in db.session.query(Cow.id, Cow.cow_id).filter(
+                Cow.cow_id.in_([row['cow_id'] for row in self.rows]))})
+        self._reset_chunk()
+
+    def run(self, records):
+        result = ImportResult(self.kind)
+        for line, record in records:
+            result.processed += 1
+            try:
+                self.rows.append(self.build_row(record))
+            except FieldError as e:
+                result.add_error(line, str(e))
+
+            if len(self.rows) >= self.chunk_size:
+                try:
+                    self._flush_chunk(result)
+                except Exception as e:
+                    result.aborted = True
+                    result.add_error(line, f'Chunk ending here failed and was rolled back: {e}')
+                    return result
+                if self.progress:
+                    self.progress(result)
+
+        final_chunk = bool(self.rows)
+        try:
+            self._flush_chunk(result)
+        except Exception as e:
+            result.aborted = True
+            result.add_error(None, f'Final chunk failed and was rolled back: {e}')
+        if self.progress and final_chunk:
+            self.progress(result)
+        return result
+
+
+def run_import(kind, fileobj, filename, chunk_size=DEFAULT_CHUNK_SIZE, create_customers=False, progress=None):
+    importer = Importer(kind, chunk_size=chunk_size, create_customers=create_customers, progress=progress)
+    return importer.run(iter_records(fileobj, filename))
@@ -0,0 +1,244 @@
+# jobs.py
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from extensions import db
+from models import Job, JobRunnerHeartbeat
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+CLAIM_LOCK_ID = 7201002 # pg_advisory_xact_lock key: one claimer at a time, so the concurrency cap holds
+CLEANUP_INTERVAL = 3600 # Seconds between purges of old jobs
+HEARTBEAT_RETENTION = timedelta(days=1) # Heartbeats of runners gone this long are deleted
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Registers fn(params, output_dir) as the handler for a job kind. It runs in
+    an app context, writes its result under output_dir and returns the path of
+    the file to offer for download.
+    """
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def job_dir(job_dir_root, job_id):
+    return os.path.join(job_dir_root, str(job_id))
+
+
+def enqueue_job(kind, params, user_id=None):
+    """Adds a queued job and commits. Returns the Job."""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, params=json.dumps(params), created_by=user_id)
+    db.session.add(job)
+    db.session.commit()
+    if _runner is not None:
+        _runner.wake()
+    return job
+
+
+def claim_job(concurrency):
+    """
+    Marks the oldest queued job running and returns its id, or None when the
+    queue is empty or `concurrency` jobs are already running (across every
+    runner sharing the database). Commits.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': CLAIM_LOCK_ID})
+    running = db.session.scalar(select(func.count()).select_from(Job).where(Job.status == 'running'))
+    job_id = None
+    if running < concurrency:
+        job_id = db.session.scalar(select(Job.id).where(Job.status == 'queued')
+                                   .order_by(Job.created_at, Job.id).limit(1))
+    if job_id is not None:
+        # Guarded on status so two claimers on SQLite (no advisory lock) can't both take it
+        claimed = Job.query.filter(Job.id == job_id, Job.status == 'queued').update(
+            {Job.status: 'running', Job.started_at: datetime.utcnow()}, synchronize_session=False)
+        if not claimed:
+            job_id = None
+    db.session.commit()
+    return job_id
+
+
+def run_job(job_id, job_dir_root):
+    """Runs one claimed job and records its outcome. Needs an app context."""
+    job = db.session.get(Job, job_id)
+    output_dir = job_dir(job_dir_root, job_id)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        result_path = JOB_HANDLERS[job.kind](json.loads(job.params or '{}'), output_dir)
+        db.session.rollback() # Drop whatever the handler left open before recording the result
+        job = db.session.get(Job, job_id)
+        job.status, job.result_path = 'succeeded', result_path
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.status, job.error = 'failed', f'{type(e).__name__}: {e}'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def fail_stale_jobs(timeout_seconds):
+    """Fails running jobs older than the timeout (their runner died or hung). Caller commits."""
+    return Job.query.filter(
+        Job.status == 'running', Job.started_at < datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    ).update({Job.status: 'failed', Job.error: 'Timed out (runner stopped or job hung)',
+              Job.finished_at: datetime.utcnow()}, synchronize_session=False)
+
+
+def record_heartbeat(name):
+    """Marks the named runner alive now. Caller commits."""
+    heartbeat = db.session.get(JobRunnerHeartbeat, name)
+    if heartbeat is None:
+        heartbeat = JobRunnerHeartbeat(name=name)
+        db.session.add(heartbeat)
+    heartbeat.heartbeat_at = datetime.utcnow()
+
+
+def job_runner_alive(max_age_seconds):
+    """
+    True when this process runs jobs itself or any runner, on any host, has
+    checked in within max_age_seconds. Without one, queued jobs never start.
+    """
+    if _runner is not None:
+        return True
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    return db.session.scalar(select(func.count()).select_from(JobRunnerHeartbeat)
+                             .where(JobRunnerHeartbeat.heartbeat_at >= cutoff)) > 0
+
+
+def purge_jobs(retention_days, job_dir_root):
+    """Deletes finished jobs older than retention_days with their result folders. Caller commits."""
+    old = Job.query.filter(Job.status.in_(('succeeded', 'failed')),
+                           Job.finished_at < datetime.utcnow() - timedelta(days=retention_days))
+    job_ids = [job_id for job_id, in old.with_entities(Job.id)]
+    for job_id in job_ids:
+        shutil.rmtree(job_dir(job_dir_root, job_id), ignore_errors=True)
+    if job_ids:
+        Job.query.filter(Job.id.in_(job_ids)).delete(synchronize_session=False)
+    return len(job_ids)
+
+
+class JobRunner:
+    """
+    Polls the job table and runs jobs on a thread pool of `concurrency`
+    threads. Each thread takes its own app context and database session.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.concurrency = app.config['JOB_CONCURRENCY']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.name = f'{socket.gethostname()}:{os.getpid()}'[:100]
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._active = 0 # Jobs this runner has submitted and not finished
+        self._last_cleanup = 0
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self, job_id):
+        try:
+            with self.app.app_context():
+                try:
+                    run_job(job_id, self.app.config['JOB_DIR'])
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Job %s could not be recorded', job_id)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._active -= 1
+            self.wake() # A slot is free: look for the next job now
+
+    def _maintenance(self):
+        # Once per dispatch loop, so at least every poll interval
+        record_heartbeat(self.name)
+        fail_stale_jobs(self.app.config['JOB_TIMEOUT'])
+        if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL:
+            purge_jobs(self.app.config['JOB_RETENTION_DAYS'], self.app.config['JOB_DIR'])
+            JobRunnerHeartbeat.query.filter(
+                JobRunnerHeartbeat.heartbeat_at < datetime.utcnow() - HEARTBEAT_RETENTION
+            ).delete(synchronize_session=False)
+            self._last_cleanup = time.monotonic()
+        db.session.commit()
+
+    def run_forever(self, once=False):
+        """Dispatch loop. With once=True, returns when the queue is empty and every job has finished."""
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job') as pool:
+            while True:
+                self._wake.clear()
+                with self.app.app_context():
+                    try:
+                        self._maintenance()
+                        while self._active < self.concurrency:
+                            job_id = claim_job(self.concurrency)
+                            if job_id is None:
+                                break
+                            with self._lock:
+                                self._active += 1
+                            pool.submit(self._run, job_id)
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Job dispatch failed')
+                    finally:
+                        db.session.remove()
+                if once and self._idle():
+                    return
+                self._wake.wait(self.poll_interval)
+
+    def _idle(self):
+        if self._active:
+            return False
+        with self.app.app_context():
+            try:
+                return not db.session.scalar(select(func.count()).select_from(Job).where(Job.status == 'queued'))
+            finally:
+                db.session.remove()
+
+
+_runner = None
+
+
+def in_web_worker():
+    """True in a web worker that runs jobs on its own thread (JOB_WORKER_IN_WEB), where CPU is shared with requests."""
+    return _runner is not None
+
+
+def init_job_runner(app):
+    """
+    Jobs normally run in their own process (`flask run-jobs`, the Procfile's
+    worker). With JOB_WORKER_IN_WEB on, each web worker also runs a JobRunner
+    on a daemon thread, started on its first request (so CLI commands and the
+    preloading gunicorn master never do). JOB_CONCURRENCY caps running jobs
+    across all runners either way.
+    """
+    if not app.config['JOB_WORKER_IN_WEB']:
+        return
+    started = []
+    lock = threading.Lock()
+
+    @app.before_request
+    def _start_job_runner():
+        global _runner
+        if started:
+            return
+        with lock:
+            if not started:
+                started.append(True)
+                _runner = JobRunner(app)
+                threading.Thread(target=_runner.run_forever, name='job-dispatcher', daemon=True).start()
@@ -0,0 +1,31 @@
+# ledger.py
+from decimal import ROUND_HALF_UP, Decimal
+
+from extensions import db
+from models import Customer
+
+CENTS = Decimal('0.01')
+
+
+def to_money(value):
+    """Parses/rounds a form value or number to an exact 2-decimal amount."""
+    return Decimal(str(value)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def sale_total(milk_qty, price_per_liter):
+    return to_money(Decimal(str(milk_qty)) * to_money(price_per_liter))
+
+
+def adjust_customer_balance(customer_id, delta):
+    """
+    Adds delta to a customer's balance with a single in-database increment
+    (UPDATE customer SET balance = balance + :delta), so concurrent sales and
+    payments for the same customer never overwrite each other. Call it as the
+    last statement before commit to keep the row lock as short as possible.
+    """
+    delta = to_money(delta)
+    if not delta:
+        return
+    db.session.query(Customer).filter(Customer.id == int(customer_id)).update(
+        {Customer.balance: Customer.balance + delta}
+    )
@@ -0,0 +1,96 @@
+# metrics.py
+import os
+import time
+
+from flask import Response, before_render_template, g, has_app_context, request, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest,
+                               multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR (an empty, writable directory)
+# so every worker writes its samples there and /metrics aggregates them.
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 500)
+
+REQUEST_LATENCY = Histogram(
+    'dairy_http_request_duration_seconds', 'Time to build the response, per endpoint.',
+    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'dairy_http_response_size_bytes', 'Response body size (responses with a known length).',
+    ['endpoint'], buckets=SIZE_BUCKETS)
+SQL_STATEMENTS = Histogram(
+    'dairy_sql_statements_per_request', 'SQL statements issued per request.',
+    ['endpoint'], buckets=COUNT_BUCKETS)
+SQL_TIME = Histogram(
+    'dairy_sql_duration_seconds_per_request', 'Cumulative SQL execution time per request.',
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+TEMPLATE_RENDER = Histogram(
+    'dairy_template_render_seconds', 'Jinja render time per template.',
+    ['template'], buckets=LATENCY_BUCKETS)
+
+
+# --- SQL timing (per request, on g) ---
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_query_start')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if has_app_context():
+        g.metrics_sql_count = g.get('metrics_sql_count', 0) + 1
+        g.metrics_sql_time = g.get('metrics_sql_time', 0.0) + elapsed
+
+
+# --- Template timing (Flask signals) ---
+def _start_render_timer(sender, template, context, **extra):
+    g.metrics_render_start = time.perf_counter()
+
+
+def _stop_render_timer(sender, template, context, **extra):
+    started = g.pop('metrics_render_start', None)
+    if started is not None:
+        TEMPLATE_RENDER.labels(template.name or 'string').observe(time.perf_counter() - started)
+
+
+def metrics_response():
+    """All metrics in Prometheus text format, aggregated across workers in multiprocess mode."""
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app):
+    before_render_template.connect(_start_render_timer, app)
+    template_rendered.connect(_stop_render_timer, app)
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_request_start = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get('metrics_request_start')
+        if started is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        # Streamed bodies (CSV exports) are still being produced; this covers time to first byte
+        REQUEST_LATENCY.labels(endpoint, request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+        if not response.is_streamed and response.content_length is not None:
+            RESPONSE_SIZE.labels(endpoint).observe(response.content_length)
+        SQL_STATEMENTS.labels(endpoint).observe(g.get('metrics_sql_count', 0))
+        SQL_TIME.labels(endpoint).observe(g.get('metrics_sql_time', 0.0))
+        return response
@@ -0,0 +1,403 @@
+# migrations.py
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import (Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, Numeric, String,
+                        Table, Text, inspect, select, text)
+
+from extensions import db
+
+# Kept out of db.metadata so create_all() never touches it
+schema_migration = Table(
+    'schema_migration', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Arbitrary key for pg_advisory_lock: one migrating process at a time
+MIGRATION_LOCK_ID = 7201001
+
+# Tables as each migration created them. Frozen copies, not the models: a migration must do
+# the same thing on every database however models.py changes later. Never edit these.
+frozen = MetaData()
+
+Table(
+    'user', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('password_hash', String(255), nullable=False),
+)
+Table(
+    'cow', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('cow_id', String(50), unique=True, nullable=False),
+    Column('name', String(100), nullable=False),
+    Column('breed', String(100)),
+    Column('date_of_birth', Date),
+    Column('status', String(50)),
+    Column('is_pregnant', Boolean),
+    Column('pregnancy_due_date', Date),
+)
+Table(
+    'milk_production', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('cow_id', Integer, ForeignKey('cow.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('morning_qty_liters', Float, nullable=False),
+    Column('evening_qty_liters', Float, nullable=False),
+    Column('timestamp', DateTime),
+)
+Table(
+    'daily_milk_total', frozen,
+    Column('date', Date, primary_key=True),
+    Column('morning_qty_liters', Float, nullable=False),
+    Column('evening_qty_liters', Float, nullable=False),
+    Column('record_count', Integer, nullable=False),
+)
+Table(
+    'cow_daily_milk_total', frozen,
+    Column('cow_id', Integer, ForeignKey('cow.id'), primary_key=True),
+    Column('date', Date, primary_key=True),
+    Column('morning_qty_liters', Float, nullable=False),
+    Column('evening_qty_liters', Float, nullable=False),
+    Column('record_count', Integer, nullable=False),
+)
+Table(
+    'health_record', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('cow_id', Integer, ForeignKey('cow.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('description', Text, nullable=False),
+    Column('treatment', Text),
+    Column('veterinarian', String(100)),
+    Column('timestamp', DateTime),
+)
+Table(
+    'vaccination', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('cow_id', Integer, ForeignKey('cow.id'), nullable=False),
+    Column('vaccine_name', String(100), nullable=False),
+    Column('vaccination_date', Date, nullable=False),
+    Column('next_due_date', Date),
+    Column('status', String(50)),
+    Column('notes', Text),
+    Column('timestamp', DateTime),
+)
+Table(
+    'customer', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(150), nullable=False),
+    Column('contact_info', Text),
+    Column('balance', Numeric(12, 2), nullable=False),
+)
+Table(
+    'sale', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('milk_quantity_liters', Float, nullable=False),
+    Column('price_per_liter', Numeric(12, 2), nullable=False),
+    Column('total_amount', Numeric(12, 2), nullable=False),
+    Column('is_paid', Boolean),
+    Column('timestamp', DateTime),
+)
+Table(
+    'payment', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('customer_id', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('amount_received', Numeric(12, 2), nullable=False),
+    Column('description', Text),
+    Column('timestamp', DateTime),
+)
+Table(
+    'expense', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('date', Date, nullable=False),
+    Column('category', String(100), nullable=False),
+    Column('amount', Numeric(12, 2), nullable=False),
+    Column('description', Text),
+    Column('timestamp', DateTime),
+)
+BASE_TABLES = ('user', 'cow', 'milk_production', 'daily_milk_total', 'cow_daily_milk_total', 'health_record',
+               'vaccination', 'customer', 'sale', 'payment', 'expense')
+
+Table(
+    'job', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String(50), nullable=False),
+    Column('params', Text, nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('result_path', String(500)),
+    Column('error', Text),
+    Column('created_by', Integer, ForeignKey('user.id'), nullable=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime),
+    Column('finished_at', DateTime),
+    Index('ix_job_status_created_at', 'status', 'created_at'),
+)
+Table(
+    'api_token', frozen,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('token_hash', String(64), unique=True, nullable=False),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('last_used_at', DateTime),
+    Column('revoked', Boolean, nullable=False),
+)
+Table(
+    'sync_record', frozen,
+    Column('key', String(100), primary_key=True),
+    Column('kind', String(20), nullable=False),
+    Column('record_id', Integer, nullable=False),
+    Column('token_id', Integer, ForeignKey('api_token.id'), nullable=True),
+    Column('created_at', DateTime, nullable=False),
+)
+Table(
+    'job_runner', frozen,
+    Column('name', String(100), primary_key=True),
+    Column('heartbeat_at', DateTime, nullable=False),
+)
+Table(
+    'change_log', frozen,
+    Column('version', Integer, primary_key=True),
+    Column('table_name', String(50), nullable=False),
+    Column('row_id', Integer, nullable=False),
+    Column('op', String(1), nullable=False),
+    Column('changed_at', DateTime, nullable=False),
+    Index('ix_change_log_table_name_version', 'table_name', 'version'),
+)
+
+
+def _connection():
+    return db.session.connection()
+
+
+def _create_tables(*names):
+    frozen.create_all(bind=_connection(), tables=[frozen.tables[name] for name in names], checkfirst=True)
+
+
+def _create_indexes(*indexes):
+    """indexes: (name, table, columns). Skips the ones that already exist."""
+    conn = _connection()
+    for name, table, columns in indexes:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+# --- Migrations: append new ones, never edit or reorder applied ones ---
+def _create_base_tables():
+    # Only creates missing tables, so databases from the old create_all() era pass straight through
+    _create_tables(*BASE_TABLES)
+
+
+def _add_cow_pregnancy_columns():
+    # Added to the model after the first deployments; create_all() never altered existing tables
+    conn = _connection()
+    existing = {col['name'] for col in inspect(conn).get_columns('cow')}
+    if 'is_pregnant' not in existing:
+        conn.execute(text('ALTER TABLE cow ADD COLUMN is_pregnant BOOLEAN DEFAULT false'))
+    if 'pregnancy_due_date' not in existing:
+        conn.execute(text('ALTER TABLE cow ADD COLUMN pregnancy_due_date DATE'))
+
+
+def _add_query_indexes():
+    _create_indexes(
+        ('ix_cow_status', 'cow', ('status',)),
+        ('ix_cow_pregnancy', 'cow', ('is_pregnant', 'pregnancy_due_date')),
+        ('ix_milk_production_date_timestamp_id', 'milk_production', ('date', 'timestamp', 'id')),
+        ('ix_milk_production_cow_id_date', 'milk_production', ('cow_id', 'date')),
+        ('ix_health_record_date_timestamp_id', 'health_record', ('date', 'timestamp', 'id')),
+        ('ix_health_record_cow_id', 'health_record', ('cow_id',)),
+        ('ix_vaccination_next_due_date', 'vaccination', ('next_due_date',)),
+        ('ix_vaccination_vaccination_date_id', 'vaccination', ('vaccination_date', 'id')),
+        ('ix_vaccination_cow_id', 'vaccination', ('cow_id',)),
+        ('ix_customer_name', 'customer', ('name',)),
+        ('ix_customer_balance', 'customer', ('balance',)),
+        ('ix_sale_date_timestamp_id', 'sale', ('date', 'timestamp', 'id')),
+        ('ix_sale_customer_id_date', 'sale', ('customer_id', 'date')),
+        ('ix_sale_timestamp', 'sale', ('timestamp',)),
+        ('ix_payment_date_timestamp_id', 'payment', ('date', 'timestamp', 'id')),
+        ('ix_payment_customer_id_date', 'payment', ('customer_id', 'date')),
+        ('ix_expense_date_timestamp_id', 'expense', ('date', 'timestamp', 'id')),
+        ('ix_expense_timestamp', 'expense', ('timestamp',)),
+    )
+
+
+def _money_columns_to_numeric():
+    # SQLite stores these with numeric affinity already; Postgres tables from before
+    # the Numeric(12, 2) change still hold double precision columns
+    conn = _connection()
+    if conn.dialect.name != 'postgresql':
+        return
+    for table, column in (('customer', 'balance'), ('sale', 'price_per_liter'), ('sale', 'total_amount'),
+                          ('payment', 'amount_received'), ('expense', 'amount')):
+        current = {col['name']: col['type'] for col in inspect(conn).get_columns(table)}
+        if current[column].python_type is not float:
+            continue
+        conn.execute(text(
+            f'ALTER TABLE "{table}" ALTER COLUMN {column} TYPE NUMERIC(12, 2) USING round({column}::numeric, 2)'
+        ))
+
+
+def _backfill_milk_rollups():
+    # Same result as rollups.rebuild_milk_rollups() at the time
+    conn = _connection()
+    conn.execute(text('DELETE FROM cow_daily_milk_total'))
+    conn.execute(text('DELETE FROM daily_milk_total'))
+    conn.execute(text(
+        'INSERT INTO cow_daily_milk_total (cow_id, date, morning_qty_liters, evening_qty_liters, record_count) '
+        'SELECT cow_id, date, sum(morning_qty_liters), sum(evening_qty_liters), count(id) '
+        'FROM milk_production GROUP BY cow_id, date'
+    ))
+    conn.execute(text(
+        'INSERT INTO daily_milk_total (date, morning_qty_liters, evening_qty_liters, record_count) '
+        'SELECT date, sum(morning_qty_liters), sum(evening_qty_liters), count(id) '
+        'FROM milk_production GROUP BY date'
+    ))
+
+
+def _vaccination_status_maintenance():
+    # Older deployments created the table from the status-less duplicate model
+    conn = _connection()
+    if 'status' not in {col['name'] for col in inspect(conn).get_columns('vaccination')}:
+        conn.execute(text("ALTER TABLE vaccination ADD COLUMN status VARCHAR(50) DEFAULT 'Due'"))
+    _create_indexes(
+        ('ix_vaccination_status_next_due_date', 'vaccination', ('status', 'next_due_date')),
+        ('ix_vaccination_status_vaccination_date_id', 'vaccination', ('status', 'vaccination_date', 'id')),
+    )
+
+    # Same rules as vaccinations.refresh_vaccination_statuses() at the time
+    today = date.today()
+    window_end = today + timedelta(days=current_app.config['VACCINATION_DUE_WINDOW_DAYS'])
+    conn.execute(text(
+        "UPDATE vaccination SET status = 'Completed' "
+        "WHERE (status IS NULL OR status != 'Completed') AND (next_due_date IS NULL OR EXISTS ("
+        "SELECT 1 FROM vaccination AS later WHERE later.cow_id = vaccination.cow_id "
+        "AND later.vaccine_name = vaccination.vaccine_name "
+        "AND later.vaccination_date > vaccination.vaccination_date))"
+    ))
+    for status, in_range in (
+        ('Overdue', 'next_due_date < :today'),
+        ('Due', 'next_due_date >= :today AND next_due_date <= :window_end'),
+        ('Scheduled', 'next_due_date > :window_end'),
+    ):
+        conn.execute(text(
+            f"UPDATE vaccination SET status = :status "
+            f"WHERE {in_range} AND (status IS NULL OR status NOT IN ('Completed', :status))"
+        ), {'status': status, 'today': today, 'window_end': window_end})
+
+
+def _create_change_log():
+    _create_tables('change_log')
+    # Existing rows enter the log as inserts, so clients can start from version 0
+    conn = _connection()
+    for table in ('cow', 'milk_production', 'health_record', 'vaccination', 'customer', 'sale', 'payment', 'expense'):
+        conn.execute(text(
+            f"INSERT INTO change_log (table_name, row_id, op, changed_at) "
+            f"SELECT '{table}', id, 'I', CURRENT_TIMESTAMP FROM {table} ORDER BY id"
+        ))
+
+
+def _create_search_indexes():
+    # SQLite: an external-content FTS5 table per source, kept in step by triggers.
+    # Postgres: a GIN index on the to_tsvector() expression search.py repeats.
+    conn = _connection()
+    for table, columns in (('health_record', ('description', 'treatment')), ('vaccination', ('notes',)),
+                           ('payment', ('description',)), ('expense', ('description',))):
+        if conn.dialect.name == 'postgresql':
+            document = " || ' ' || ".join(f"coalesce({name}, '')" for name in columns)
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} "
+                              f"USING gin (to_tsvector('english', {document}))"))
+            continue
+        fts = f'{table}_search'
+        names = ', '.join(columns)
+        new_values = ', '.join(f'new.{name}' for name in columns)
+        old_values = ', '.join(f'old.{name}' for name in columns)
+        conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names}, content='{table}', "
+                          f"content_rowid='id', tokenize='porter unicode61')"))
+        conn.execute(text(f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN '
+                          f'INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END'))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+                          f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN "
+                          f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+                          f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END"))
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")) # Index the rows already there
+
+
+def _change_log_transaction_ids():
+    conn = _connection()
+    if 'txid' not in {col['name'] for col in inspect(conn).get_columns('change_log')}:
+        conn.execute(text('ALTER TABLE change_log ADD COLUMN txid BIGINT NOT NULL DEFAULT 0'))
+    conn.execute(text('DROP INDEX IF EXISTS ix_change_log_table_name_version'))
+    _create_indexes(
+        ('ix_change_log_txid_version', 'change_log', ('txid', 'version')),
+        ('ix_change_log_table_name_txid_version', 'change_log', ('table_name', 'txid', 'version')),
+    )
+
+
+MIGRATIONS = [
+    (1, 'create base tables', _create_base_tables),
+    (2, 'add cow pregnancy columns', _add_cow_pregnancy_columns),
+    (3, 'add query indexes', _add_query_indexes),
+    (4, 'money columns to numeric(12, 2)', _money_columns_to_numeric),
+    (5, 'backfill daily milk rollups', _backfill_milk_rollups),
+    (6, 'vaccination status column, indexes and backfill', _vaccination_status_maintenance),
+    (7, 'background job table', lambda: _create_tables('job')),
+    (8, 'sync API token and idempotency key tables', lambda: _create_tables('api_token', 'sync_record')),
+    (9, 'change log table and backfill', _create_change_log),
+    (10, 'full-text search indexes', _create_search_indexes),
+    (11, 'change log transaction ids', _change_log_transaction_ids),
+    (12, 'job runner heartbeats', lambda: _create_tables('job_runner')),
+]
+
+
+# --- Runner ---
+def applied_versions(conn=None):
+    conn = conn if conn is not None else _connection()
+    if not inspect(conn).has_table(schema_migration.name):
+        return set()
+    return set(conn.execute(select(schema_migration.c.version)).scalars())
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def upgrade(target=None, progress=None):
+    """
+    Applies pending migrations in order, each in its own transaction together
+    with its schema_migration row. Returns the list of versions applied.
+    """
+    lock = None
+    if db.engine.dialect.name == 'postgresql':
+        # Session-level lock on a separate connection, so concurrent deploys wait instead of racing
+        lock = db.engine.connect()
+        lock.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+    try:
+        schema_migration.create(bind=_connection(), checkfirst=True)
+        db.session.commit()
+
+        applied = []
+        for version, name, migrate in pending_migrations():
+            if target is not None and version > target:
+                break
+            try:
+                migrate()
+                db.session.execute(schema_migration.insert().values(
+                    version=version, name=name, applied_at=datetime.utcnow()))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            applied.append(version)
+            if progress:
+                progress(version, name)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+            lock.close()
@@ -0,0 +1,96 @@
+# milkbatch.py
+from collections import defaultdict
+
+from bulk import bulk_insert, bulk_update
+from fields import number_field
+from models import Cow, MilkProduction
+from rollups import apply_milk_deltas
+
+
+class MilkBatchRow:
+    """One cow's line in the herd-wide milk entry grid."""
+
+    def __init__(self, cow, record=None):
+        self.cow = cow
+        self.record = record # Existing MilkProduction for the date, if any
+        self.morning = '' if record is None else f'{record.morning_qty_liters:g}'
+        self.evening = '' if record is None else f'{record.evening_qty_liters:g}'
+        self.error = None
+
+
+def _parse_quantity(raw):
+    # None for a blank field; FieldError (a ValueError) for text, negatives, nan and inf
+    return number_field({'quantity': raw}, 'quantity')
+
+
+def milk_quantities(form):
+    """(morning, evening) litres from a single-record milk form; raises FieldError."""
+    return (number_field(form, 'morning_qty', required=True),
+            number_field(form, 'evening_qty', required=True))
+
+
+def load_batch_rows(log_date):
+    """Active cows plus whatever was already logged for log_date (two queries)."""
+    cows = Cow.query.filter_by(status='active').order_by(Cow.name).all()
+    existing = defaultdict(list)
+    for record in MilkProduction.query.filter(MilkProduction.date == log_date).order_by(MilkProduction.id):
+        existing[record.cow_id].append(record)
+
+    rows = []
+    for cow in cows:
+        records = existing.get(cow.id, [])
+        row = MilkBatchRow(cow, records[0] if len(records) == 1 else None)
+        if len(records) > 1:
+            row.error = 'Several records already exist for this date; edit them individually.'
+        rows.append(row)
+    return rows
+
+
+def save_milk_batch(log_date, rows, form):
+    """
+    Validates every row of the grid against form, then writes the whole batch
+    (bulk INSERT for new records, bulk UPDATE for cows already logged that day)
+    in the caller's transaction. Returns (inserted, updated, error_count);
+    nothing is written when any row has an error.
+    """
+    new_rows, changed_rows, deltas = [], [], {}
+    error_count = 0
+
+    for row in rows:
+        row.morning = form.get(f'morning_qty_{row.cow.id}', '')
+        row.evening = form.get(f'evening_qty_{row.cow.id}', '')
+        if row.error:
+            if row.morning.strip() or row.evening.strip():
+                error_count += 1
+            continue
+        try:
+            morning, evening = _parse_quantity(row.morning), _parse_quantity(row.evening)
+        except ValueError:
+            row.error = 'Quantities must be numbers of 0 or more.'
+            error_count += 1
+            continue
+
+        if row.record is None:
+            if morning is None and evening is None:
+                continue # Cow not milked / left blank
+            morning, evening = morning or 0.0, evening or 0.0
+            new_rows.append({'cow_id': row.cow.id, 'date': log_date,
+                             'morning_qty_liters': morning, 'evening_qty_liters': evening})
+            deltas[(row.cow.id, log_date)] = (morning, evening, 1)
+        else:
+            # Blank fields keep what was logged earlier (e.g. morning entered, evening added now)
+            old_morning, old_evening = row.record.morning_qty_liters, row.record.evening_qty_liters
+            morning = old_morning if morning is None else morning
+            evening = old_evening if evening is None else evening
+            if (morning, evening) == (old_morning, old_evening):
+                continue
+            changed_rows.append({'id': row.record.id, 'morning_qty_liters': morning, 'evening_qty_liters': evening})
+            deltas[(row.cow.id, log_date)] = (morning - old_morning, evening - old_evening, 0)
+
+    if error_count:
+        return 0, 0, error_count
+
+    bulk_insert(MilkProduction, new_rows)
+    bulk_update(MilkProduction, changed_rows)
+    apply_milk_deltas(deltas)
+    return len(new_rows), len(changed_rows), 0
@@ -34,6 +34,11 @@ class Cow(db.Model):
     is_pregnant = db.Column(db.Boolean, default=False)
     pregnancy_due_date = db.Column(db.Date)
 
+    __table_args__ = (
+        db.Index('ix_cow_status', 'status'),
+        db.Index('ix_cow_pregnancy', 'is_pregnant', 'pregnancy_due_date'),
+    )
+
     milk_productions = db.relationship('MilkProduction', backref='cow', lazy=True)
     health_records = db.relationship('HealthRecord', backref='cow', lazy=True)
     vaccinations = db.relationship('Vaccination', backref='cow', lazy=True, cascade="all, delete-orphan")
@@ -43,20 +48,51 @@ class Cow(db.Model):
         return f"<Cow {self.name} ({self.cow_id})>"
 
 
-# --- NEW Vaccination Model ---
-class Vaccination(db.Model):
+class MilkProduction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     cow_id = db.Column(db.Integer, db.ForeignKey('cow.id'), nullable=False)
-    vaccine_name = db.Column(db.String(100), nullable=False)
-    vaccination_date = db.Column(db.Date, nullable=False, default=date.today)
-    next_due_date = db.Column(db.Date)
-    notes = db.Column(db.Text)
+    date = db.Column(db.Date, nullable=False, default=date.today)
+    morning_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
+    evening_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_milk_production_date_timestamp_id', 'date', 'timestamp', 'id'),
+        db.Index('ix_milk_production_cow_id_date', 'cow_id', 'date'),
+    )
+
+    def total_daily_quantity(self):
+        return (self.morning_qty_liters or 0.0) + (self.evening_qty_liters or 0.0)
+
     def __repr__(self):
-        # Update __repr__ to avoid potential lazy load issues during app initialization on Render
-        return f"<Vaccination {self.vaccine_name} for Cow ID {self.cow_id} due {self.next_due_date}>"
-        
+        return f"<MilkProduction Cow ID {self.cow_id} on {self.date}: {self.total_daily_quantity():.2f}L>"
+
+# --- Milk Rollups (kept in step with MilkProduction by rollups.py) ---
+class DailyMilkTotal(db.Model):
+    date = db.Column(db.Date, primary_key=True)
+    morning_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
+    evening_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def total_daily_quantity(self):
+        return self.morning_qty_liters + self.evening_qty_liters
+
+    def __repr__(self):
+        return f"<DailyMilkTotal {self.date}: {self.total_daily_quantity():.2f}L>"
+
+class CowDailyMilkTotal(db.Model):
+    cow_id = db.Column(db.Integer, db.ForeignKey('cow.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    morning_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
+    evening_qty_liters = db.Column(db.Float, nullable=False, default=0.0)
+    record_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def total_daily_quantity(self):
+        return self.morning_qty_liters + self.evening_qty_liters
+
+    def __repr__(self):
+        return f"<CowDailyMilkTotal Cow ID {self.cow_id} on {self.date}: {self.total_daily_quantity():.2f}L>"
+
 class HealthRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     cow_id = db.Column(db.Integer, db.ForeignKey('cow.id'), nullable=False)
@@ -66,6 +102,11 @@ class HealthRecord(db.Model):
     veterinarian = db.Column(db.String(100))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_health_record_date_timestamp_id', 'date', 'timestamp', 'id'),
+        db.Index('ix_health_record_cow_id', 'cow_id'),
+    )
+
     def __repr__(self):
         return f"<HealthRecord {self.cow.name} on {self.date}: {self.description[:30]}...>"
 
@@ -76,19 +117,33 @@ class Vaccination(db.Model):
     vaccine_name = db.Column(db.String(100), nullable=False)
     vaccination_date = db.Column(db.Date, nullable=False, default=date.today)
     next_due_date = db.Column(db.Date) # When the next dose is due
-    status = db.Column(db.String(50), default='Due') # 'Due', 'Completed', 'Overdue'
+    status = db.Column(db.String(50), default='Due') # 'Due', 'Overdue', 'Scheduled', 'Completed' (see vaccinations.py)
     notes = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_vaccination_next_due_date', 'next_due_date'),
+        db.Index('ix_vaccination_vaccination_date_id', 'vaccination_date', 'id'),
+        db.Index('ix_vaccination_cow_id', 'cow_id'),
+        db.Index('ix_vaccination_status_next_due_date', 'status', 'next_due_date'),
+        db.Index('ix_vaccination_status_vaccination_date_id', 'status', 'vaccination_date', 'id'),
+    )
+
     def __repr__(self):
-        return f"<Vaccination {self.vaccine_name} for {self.cow.name} due {self.next_due_date}>"
+        # Avoid lazy-loading the cow from __repr__
+        return f"<Vaccination {self.vaccine_name} for Cow ID {self.cow_id} due {self.next_due_date}>"
 # -----------------------------
 
 class Customer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     contact_info = db.Column(db.Text)
-    balance = db.Column(db.Float, default=0.0)
+    balance = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_customer_name', 'name'),
+        db.Index('ix_customer_balance', 'balance'),
+    )
 
     sales = db.relationship('Sale', backref='customer', lazy=True)
     payments = db.relationship('Payment', backref='customer', lazy=True)
@@ -101,11 +156,17 @@ class Sale(db.Model):
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=date.today)
     milk_quantity_liters = db.Column(db.Float, nullable=False)
-    price_per_liter = db.Column(db.Float, nullable=False)
-    total_amount = db.Column(db.Float, nullable=False)
+    price_per_liter = db.Column(db.Numeric(12, 2), nullable=False)
+    total_amount = db.Column(db.Numeric(12, 2), nullable=False)
     is_paid = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_sale_date_timestamp_id', 'date', 'timestamp', 'id'),
+        db.Index('ix_sale_customer_id_date', 'customer_id', 'date'),
+        db.Index('ix_sale_timestamp', 'timestamp'),
+    )
+
     def __repr__(self):
         return f"<Sale {self.customer.name} on {self.date}: {self.total_amount:.2f}>"
 
@@ -113,10 +174,15 @@ class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=date.today)
-    amount_received = db.Column(db.Float, nullable=False)
+    amount_received = db.Column(db.Numeric(12, 2), nullable=False)
     description = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_payment_date_timestamp_id', 'date', 'timestamp', 'id'),
+        db.Index('ix_payment_customer_id_date', 'customer_id', 'date'),
+    )
+
     def __repr__(self):
         return f"<Payment {self.customer.name} on {self.date}: {self.amount_received:.2f}>"
 
@@ -124,11 +190,87 @@ class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, default=date.today)
     category = db.Column(db.String(100), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
     description = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_expense_date_timestamp_id', 'date', 'timestamp', 'id'),
+        db.Index('ix_expense_timestamp', 'timestamp'),
+    )
+
     def __repr__(self):
         return f"<Expense {self.category} on {self.date}: {self.amount:.2f}>"
 
+# --- Background Jobs (queued by the web app, run by jobs.JobRunner) ---
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}') # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, succeeded, failed
+    result_path = db.Column(db.String(500)) # Absolute path of the finished file
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.kind}: {self.status}>"
+
+
+class JobRunnerHeartbeat(db.Model):
+    __tablename__ = 'job_runner'
+    name = db.Column(db.String(100), primary_key=True) # host:pid of a running JobRunner
+    heartbeat_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<JobRunnerHeartbeat {self.name} at {self.heartbeat_at}>"
+
+# --- Change Log (one row per insert/update/delete of a synced model; see changelog.py) ---
+class ChangeLog(db.Model):
+    version = db.Column(db.Integer, primary_key=True) # Clients resume from the last one they saw
+    # Writing transaction's id on Postgres (0 on SQLite); the feed reads in (txid, version) order, see changelog.py
+    txid = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(1), nullable=False) # I, U or D
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_change_log_txid_version', 'txid', 'version'),
+        db.Index('ix_change_log_table_name_txid_version', 'table_name', 'txid', 'version'), # ?tables= filtered pages
+    )
+
+    def __repr__(self):
+        return f"<ChangeLog {self.version} {self.op} {self.table_name} {self.row_id}>"
+
+# --- Sync API (barn tablets post batches of records; see syncapi.py) ---
+class ApiToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False) # e.g. the tablet or collector it was issued to
+    token_hash = db.Column(db.String(64), unique=True, nullable=False) # sha256 hex; the token itself is never stored
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime)
+    revoked = db.Column(db.Boolean, nullable=False, default=False)
+
+    def __repr__(self):
+        return f"<ApiToken {self.name}>"
+
+class SyncRecord(db.Model):
+    """Client idempotency key -> the record it created, so a retried batch never inserts twice."""
+    key = db.Column(db.String(100), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False) # milk, health, vaccinations, sales, payments
+    record_id = db.Column(db.Integer, nullable=False)
+    token_id = db.Column(db.Integer, db.ForeignKey('api_token.id'), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SyncRecord {self.key} -> {self.kind} {self.record_id}>"
+
 
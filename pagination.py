@@ -0,0 +1,108 @@
+# pagination.py
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import abort, current_app, request
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query, plus cursors for its neighbours."""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _column_name(column):
+    return getattr(column, 'key', None) or column.name
+
+
+def encode_cursor(values):
+    encoded = [value.isoformat() if isinstance(value, (date, datetime))
+               else str(value) if isinstance(value, Decimal) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(encoded, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_columns):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError):
+        abort(400)
+    if not isinstance(raw, list) or len(raw) != len(sort_columns):
+        abort(400)
+
+    values = []
+    for column, value in zip(sort_columns, raw):
+        python_type = column.type.python_type
+        try:
+            if value is not None and python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif value is not None and python_type is date:
+                value = date.fromisoformat(value)
+            elif value is not None and python_type is Decimal:
+                value = Decimal(value)
+        except (TypeError, ValueError, InvalidOperation):
+            abort(400)
+        values.append(value)
+    return values
+
+
+def _row_key(item, sort_columns):
+    return [getattr(item, _column_name(column)) for column in sort_columns]
+
+
+def get_per_page():
+    default = current_app.config.get('PER_PAGE', 50)
+    maximum = current_app.config.get('MAX_PER_PAGE', 500)
+    per_page = request.args.get('per_page', default, type=int)
+    return max(1, min(per_page, maximum))
+
+
+def keyset_paginate(query, sort_columns, per_page=None):
+    """
+    Pages query newest-first on sort_columns (which must end in a unique column).
+
+    Reads the ?after= / ?before= cursors and ?per_page= from the request, so
+    every page costs one index range scan no matter how deep it is.
+    """
+    per_page = per_page or get_per_page()
+    after = request.args.get('after')
+    before = request.args.get('before')
+    key = tuple_(*sort_columns)
+
+    if before:
+        # Walk back towards newer rows in ascending order, then flip for display
+        query = query.filter(key > tuple_(*decode_cursor(before, sort_columns)))
+        rows = query.order_by(*[column.asc() for column in sort_columns]).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next, has_prev = True, has_more
+    else:
+        if after:
+            query = query.filter(key < tuple_(*decode_cursor(after, sort_columns)))
+        rows = query.order_by(*[column.desc() for column in sort_columns]).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_next, has_prev = len(rows) > per_page, bool(after)
+
+    if not items:
+        return KeysetPage(items, per_page)
+    return KeysetPage(
+        items,
+        per_page,
+        next_cursor=encode_cursor(_row_key(items[-1], sort_columns)) if has_next else None,
+        prev_cursor=encode_cursor(_row_key(items[0], sort_columns)) if has_prev else None,
+    )
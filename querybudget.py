@@ -0,0 +1,65 @@
+# querybudget.py
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised (in testing) when a view issues more SQL statements than its budget allows."""
+
+
+def query_budget(max_queries):
+    """
+    Caps the number of SQL statements a view may issue per request,
+    including the Flask-Login user lookup. Enforced when QUERY_BUDGET_ENABLED is set.
+    """
+    def decorator(view):
+        # Stored on the function; functools.wraps (login_required) carries it to the outer view
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_query_count():
+    return g.get('sql_query_count', 0)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+
+
+@contextmanager
+def count_queries():
+    """Counts statements issued inside the block: `with count_queries() as counter: ...; counter['count']`."""
+    counter = {'count': 0}
+
+    def _increment(conn, cursor, statement, parameters, context, executemany):
+        counter['count'] += 1
+
+    event.listen(Engine, 'before_cursor_execute', _increment)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, 'before_cursor_execute', _increment)
+
+
+def init_query_budget(app):
+    @app.after_request
+    def _check_query_budget(response):
+        if not app.config.get('QUERY_BUDGET_ENABLED'):
+            return response
+
+        count = get_query_count()
+        response.headers['X-Query-Count'] = str(count)
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+        if budget is not None and count > budget:
+            message = f'{request.endpoint} issued {count} SQL statements (budget {budget})'
+            if app.testing:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
@@ -0,0 +1,80 @@
+# queryplans.py
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from dashboard import upcoming_vaccinations_filter
+from extensions import db
+from models import (Cow, CowDailyMilkTotal, Customer, DailyMilkTotal, Expense, HealthRecord, MilkProduction,
+                    Payment, Sale, Vaccination)
+from reports import profit_loss_transactions
+
+PAGE_SIZE = 51 # PER_PAGE + 1, as keyset_paginate fetches it
+
+
+def _newest_first(query, *columns):
+    return query.order_by(*[column.desc() for column in columns]).limit(PAGE_SIZE)
+
+
+def main_route_queries(due_window_days=30):
+    """(label, query) pairs mirroring the hot queries behind the main routes."""
+    today = date.today()
+    month_start = today.replace(day=1)
+    cow_id = db.session.query(func.min(Cow.id)).scalar() or 1
+    customer_id = db.session.query(func.min(Customer.id)).scalar() or 1
+    ledger, ledger_order = profit_loss_transactions(month_start, today)
+
+    return [
+        ('dashboard: upcoming vaccinations', Vaccination.query.join(Cow, Vaccination.cow_id == Cow.id).filter(
+            upcoming_vaccinations_filter(today, due_window_days)).order_by(Vaccination.next_due_date)),
+        ('dashboard: pregnancy reminders', Cow.query.filter(
+            Cow.is_pregnant == True, Cow.pregnancy_due_date >= today,
+            Cow.pregnancy_due_date <= today + timedelta(days=4)
+        ).order_by(Cow.pregnancy_due_date)),
+        ('dashboard: today\'s milk', db.session.query(func.sum(DailyMilkTotal.morning_qty_liters)).filter(
+            DailyMilkTotal.date >= today, DailyMilkTotal.date <= today)),
+        ('dashboard: recent sales', Sale.query.order_by(Sale.timestamp.desc()).limit(5)),
+        ('dashboard: recent expenses', Expense.query.order_by(Expense.timestamp.desc()).limit(5)),
+        ('milk history page', _newest_first(
+            MilkProduction.query, MilkProduction.date, MilkProduction.timestamp, MilkProduction.id)),
+        ('milk for one cow', MilkProduction.query.filter(
+            MilkProduction.cow_id == cow_id, MilkProduction.date >= month_start)),
+        ('cow milk rollup', db.session.query(func.sum(CowDailyMilkTotal.morning_qty_liters)).filter(
+            CowDailyMilkTotal.cow_id == cow_id, CowDailyMilkTotal.date >= month_start)),
+        ('health records page', _newest_first(
+            HealthRecord.query, HealthRecord.date, HealthRecord.timestamp, HealthRecord.id)),
+        ('health records for one cow', HealthRecord.query.filter(HealthRecord.cow_id == cow_id)),
+        ('vaccinations page', _newest_first(Vaccination.query, Vaccination.vaccination_date, Vaccination.id)),
+        ('overdue vaccinations page', _newest_first(
+            Vaccination.query.filter(Vaccination.status == 'Overdue'), Vaccination.vaccination_date, Vaccination.id)),
+        ('sales page', _newest_first(Sale.query, Sale.date, Sale.timestamp, Sale.id)),
+        ('sales for one customer', Sale.query.filter(Sale.customer_id == customer_id, Sale.date >= month_start)),
+        ('payments page', _newest_first(Payment.query, Payment.date, Payment.timestamp, Payment.id)),
+        ('payments for one customer', Payment.query.filter(
+            Payment.customer_id == customer_id, Payment.date >= month_start)),
+        ('expenses page', _newest_first(Expense.query, Expense.date, Expense.timestamp, Expense.id)),
+        ('amounts receivable', Customer.query.filter(Customer.balance > 0).order_by(Customer.name)),
+        ('profit & loss ledger page', _newest_first(ledger, *ledger_order)),
+    ]
+
+
+def explain(query):
+    """Returns the database's plan for query as a list of text lines."""
+    statement = query.statement if hasattr(query, 'statement') else query
+    conn = db.session.connection()
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+    return [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + sql)]
+
+
+def full_scan_lines(plan):
+    """Plan lines that read a whole table (or sort it) instead of using an index."""
+    flagged = []
+    for line in plan:
+        detail = line.strip()
+        if detail.startswith('SCAN ') and 'USING' not in detail and 'SUBQUERY' not in detail:
+            flagged.append(detail)
+        elif 'USE TEMP B-TREE FOR ORDER BY' in detail or 'Seq Scan on' in detail:
+            flagged.append(detail)
+    return flagged
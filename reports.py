@@ -0,0 +1,176 @@
+# reports.py
+from datetime import timedelta
+
+from sqlalchemy import Float, Numeric, String, and_, case, cast, func, literal, null, or_, select, type_coerce, union_all
+
+from extensions import db
+from models import Customer, Expense, Payment, Sale
+from sqldates import date_bucket
+
+
+def _in_range(column, start_date, end_date):
+    conditions = []
+    if start_date:
+        conditions.append(column >= start_date)
+    if end_date:
+        conditions.append(column <= end_date)
+    return conditions
+
+
+def profit_loss_transactions(start_date, end_date):
+    """
+    Sales and expenses as one UNION ALL query (no ORM objects), newest first.
+    Returns (query, sort_columns) ready for keyset_paginate.
+    """
+    sales = select(
+        Sale.date.label('date'),
+        literal('Sale', String).label('kind'),
+        Sale.id.label('id'),
+        Customer.name.label('party'),
+        cast(null(), String).label('description'),
+        Sale.milk_quantity_liters.label('quantity'),
+        Sale.total_amount.label('amount'),
+    ).join(Customer, Sale.customer_id == Customer.id).where(*_in_range(Sale.date, start_date, end_date))
+    expenses = select(
+        Expense.date.label('date'),
+        literal('Expense', String).label('kind'),
+        Expense.id.label('id'),
+        Expense.category.label('party'),
+        Expense.description.label('description'),
+        cast(null(), Float).label('quantity'),
+        Expense.amount.label('amount'),
+    ).where(*_in_range(Expense.date, start_date, end_date))
+
+    ledger = union_all(sales, expenses).subquery('ledger')
+    return db.session.query(ledger), [ledger.c.date, ledger.c.kind, ledger.c.id]
+
+
+def profit_loss_summary(start_date, end_date):
+    """Totals plus monthly and per-category breakdowns, all aggregated in the database."""
+    total_income, total_expenses = db.session.execute(select(
+        select(func.coalesce(func.sum(Sale.total_amount), 0))
+        .where(*_in_range(Sale.date, start_date, end_date)).scalar_subquery(),
+        select(func.coalesce(func.sum(Expense.amount), 0))
+        .where(*_in_range(Expense.date, start_date, end_date)).scalar_subquery(),
+    )).one()
+
+    sale_months = select(
+        date_bucket(Sale.date, 'month').label('month'),
+        Sale.total_amount.label('income'),
+        literal(0, Numeric(12, 2)).label('expense'),
+    ).where(*_in_range(Sale.date, start_date, end_date))
+    expense_months = select(
+        date_bucket(Expense.date, 'month').label('month'),
+        literal(0, Numeric(12, 2)).label('income'),
+        Expense.amount.label('expense'),
+    ).where(*_in_range(Expense.date, start_date, end_date))
+    months = union_all(sale_months, expense_months).subquery('months')
+    monthly = db.session.execute(
+        select(months.c.month, func.sum(months.c.income).label('income'), func.sum(months.c.expense).label('expense'))
+        .group_by(months.c.month).order_by(months.c.month)
+    ).all()
+
+    by_category = db.session.execute(
+        select(Expense.category, func.count(Expense.id).label('count'), func.sum(Expense.amount).label('amount'))
+        .where(*_in_range(Expense.date, start_date, end_date))
+        .group_by(Expense.category).order_by(func.sum(Expense.amount).desc())
+    ).all()
+
+    return {
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'net_profit_loss': total_income - total_expenses,
+        'monthly_breakdown': monthly,
+        'category_breakdown': by_category,
+    }
+
+
+# --- Receivables aging ---
+AGING_BUCKETS = (('current', '0-30 days'), ('days_31_60', '31-60 days'), ('days_61_90', '61-90 days'),
+                 ('days_90_plus', '90+ days'))
+
+
+def sale_allocations():
+    """
+    Each sale with the part still unpaid after allocating the customer's
+    payments to their sales oldest-first (FIFO). One pass with a running SUM()
+    window per customer; no per-customer Python.
+    """
+    paid = select(
+        Payment.customer_id, func.sum(Payment.amount_received).label('paid')
+    ).group_by(Payment.customer_id).subquery('paid')
+    running = select(
+        Sale.id, Sale.customer_id, Sale.date, Sale.total_amount,
+        func.sum(Sale.total_amount).over(
+            partition_by=Sale.customer_id, order_by=(Sale.date, Sale.id)
+        ).label('cumulative'),
+    ).subquery('running')
+
+    # What this sale and every earlier one still owe once all payments are used up
+    uncovered = running.c.cumulative - func.coalesce(paid.c.paid, 0)
+    outstanding = case(
+        (uncovered <= 0, 0),
+        (uncovered >= running.c.total_amount, running.c.total_amount),
+        else_=uncovered,
+    )
+    return select(
+        running.c.id, running.c.customer_id, running.c.date,
+        type_coerce(outstanding, Numeric(12, 2)).label('outstanding'),
+    ).outerjoin(paid, paid.c.customer_id == running.c.customer_id).subquery('allocation')
+
+
+def _aging_columns(allocation, today):
+    age_30, age_60, age_90 = (today - timedelta(days=days) for days in (30, 60, 90))
+
+    def owed(condition):
+        return type_coerce(func.sum(case((condition, allocation.c.outstanding), else_=0)), Numeric(12, 2))
+
+    return [
+        owed(allocation.c.date >= age_30).label('current'),
+        owed(and_(allocation.c.date < age_30, allocation.c.date >= age_60)).label('days_31_60'),
+        owed(and_(allocation.c.date < age_60, allocation.c.date >= age_90)).label('days_61_90'),
+        owed(allocation.c.date < age_90).label('days_90_plus'),
+        type_coerce(func.sum(allocation.c.outstanding), Numeric(12, 2)).label('total'),
+    ]
+
+
+def receivables_aging(today):
+    """
+    Unpaid amounts per customer in 0-30 / 31-60 / 61-90 / 90+ day buckets by
+    sale date, largest debt first. Returns (query, sort_columns) ready for keyset_paginate.
+    """
+    allocation = sale_allocations()
+    aging = select(
+        allocation.c.customer_id, Customer.name, Customer.contact_info,
+        *_aging_columns(allocation, today),
+        func.min(allocation.c.date).label('oldest_unpaid'),
+        func.count().label('unpaid_sales'),
+    ).join(Customer, Customer.id == allocation.c.customer_id).where(
+        allocation.c.outstanding > 0
+    ).group_by(allocation.c.customer_id, Customer.name, Customer.contact_info).subquery('aging')
+    return db.session.query(aging), [aging.c.total, aging.c.customer_id]
+
+
+def receivables_aging_totals(today):
+    allocation = sale_allocations()
+    return db.session.execute(
+        select(*_aging_columns(allocation, today)).where(allocation.c.outstanding > 0)
+    ).one()
+
+
+def sync_sale_paid_flags():
+    """
+    Sets Sale.is_paid from the FIFO allocation with two set-based UPDATEs:
+    fully covered sales become paid, the rest unpaid. Returns (marked paid,
+    marked unpaid). The caller commits.
+    """
+    allocation = sale_allocations()
+    marked_paid = Sale.query.filter(
+        Sale.id.in_(select(allocation.c.id).where(allocation.c.outstanding <= 0)),
+        or_(Sale.is_paid.is_(None), Sale.is_paid == False),
+    ).update({Sale.is_paid: True}, synchronize_session=False)
+    marked_unpaid = Sale.query.filter(
+        Sale.id.in_(select(allocation.c.id).where(allocation.c.outstanding > 0)),
+        Sale.is_paid == True,
+    ).update({Sale.is_paid: False}, synchronize_session=False)
+    return marked_paid, marked_unpaid
@@ -0,0 +1,135 @@
+# rollups.py
+from collections import defaultdict
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+from models import CowDailyMilkTotal, DailyMilkTotal, MilkProduction
+
+_UPSERT_INSERTS = {'postgresql': pg_insert, 'sqlite': sqlite_insert}
+
+
+def _increment_rows(model, key_columns, rows):
+    """Adds each row's quantities/count onto the matching rollup row, creating it if missing."""
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    insert = _UPSERT_INSERTS.get(dialect)
+    if insert is not None:
+        stmt = insert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_={
+            'morning_qty_liters': model.morning_qty_liters + stmt.excluded.morning_qty_liters,
+            'evening_qty_liters': model.evening_qty_liters + stmt.excluded.evening_qty_liters,
+            'record_count': model.record_count + stmt.excluded.record_count,
+        })
+        db.session.execute(stmt, rows)
+        return
+
+    # Other backends: UPDATE first, INSERT the keys that did not exist yet
+    for row in rows:
+        keys = {column: row[column] for column in key_columns}
+        updated = db.session.query(model).filter_by(**keys).update({
+            model.morning_qty_liters: model.morning_qty_liters + row['morning_qty_liters'],
+            model.evening_qty_liters: model.evening_qty_liters + row['evening_qty_liters'],
+            model.record_count: model.record_count + row['record_count'],
+        }, synchronize_session=False)
+        if not updated:
+            db.session.execute(model.__table__.insert(), [row])
+
+
+def apply_milk_deltas(deltas):
+    """
+    Applies {(cow_id, date): (morning, evening, record_count)} changes to both
+    rollup tables in the current transaction. Negative values undo records.
+    """
+    daily = defaultdict(lambda: [0.0, 0.0, 0])
+    cow_rows = []
+    for (cow_id, log_date), (morning, evening, count) in deltas.items():
+        cow_rows.append({'cow_id': cow_id, 'date': log_date, 'morning_qty_liters': morning,
+                         'evening_qty_liters': evening, 'record_count': count})
+        totals = daily[log_date]
+        totals[0] += morning
+        totals[1] += evening
+        totals[2] += count
+
+    _increment_rows(CowDailyMilkTotal, ['cow_id', 'date'], cow_rows)
+    _increment_rows(DailyMilkTotal, ['date'], [
+        {'date': log_date, 'morning_qty_liters': morning, 'evening_qty_liters': evening, 'record_count': count}
+        for log_date, (morning, evening, count) in daily.items()
+    ])
+
+    if any(count < 0 for _, _, count in deltas.values()):
+        # Drop the touched days that no longer have any records
+        cow_ids = {cow_id for cow_id, _ in deltas}
+        CowDailyMilkTotal.query.filter(
+            CowDailyMilkTotal.cow_id.in_(cow_ids), CowDailyMilkTotal.date.in_(list(daily)),
+            CowDailyMilkTotal.record_count <= 0
+        ).delete(synchronize_session=False)
+        DailyMilkTotal.query.filter(
+            DailyMilkTotal.date.in_(list(daily)), DailyMilkTotal.record_count <= 0
+        ).delete(synchronize_session=False)
+
+
+def record_milk_added(cow_id, log_date, morning_qty, evening_qty):
+    apply_milk_deltas({(int(cow_id), log_date): (morning_qty or 0.0, evening_qty or 0.0, 1)})
+
+
+def record_milk_removed(cow_id, log_date, morning_qty, evening_qty):
+    apply_milk_deltas({(int(cow_id), log_date): (-(morning_qty or 0.0), -(evening_qty or 0.0), -1)})
+
+
+def remove_cow_from_rollups(cow_id):
+    """Subtracts a cow's history from the herd totals and drops its per-cow rows."""
+    cow_days = db.session.query(
+        CowDailyMilkTotal.date, CowDailyMilkTotal.morning_qty_liters,
+        CowDailyMilkTotal.evening_qty_liters, CowDailyMilkTotal.record_count
+    ).filter(CowDailyMilkTotal.cow_id == cow_id).all()
+    _increment_rows(DailyMilkTotal, ['date'], [
+        {'date': log_date, 'morning_qty_liters': -morning, 'evening_qty_liters': -evening, 'record_count': -count}
+        for log_date, morning, evening, count in cow_days
+    ])
+    CowDailyMilkTotal.query.filter_by(cow_id=cow_id).delete(synchronize_session=False)
+    if cow_days:
+        DailyMilkTotal.query.filter(
+            DailyMilkTotal.date.in_([row[0] for row in cow_days]), DailyMilkTotal.record_count <= 0
+        ).delete(synchronize_session=False)
+
+
+def rebuild_milk_rollups():
+    """Recomputes both rollup tables from MilkProduction with two INSERT ... SELECT statements."""
+    CowDailyMilkTotal.query.delete(synchronize_session=False)
+    DailyMilkTotal.query.delete(synchronize_session=False)
+
+    columns = ['morning_qty_liters', 'evening_qty_liters', 'record_count']
+    sums = (func.sum(MilkProduction.morning_qty_liters), func.sum(MilkProduction.evening_qty_liters),
+            func.count(MilkProduction.id))
+    db.session.execute(CowDailyMilkTotal.__table__.insert().from_select(
+        ['cow_id', 'date'] + columns,
+        select(MilkProduction.cow_id, MilkProduction.date, *sums).group_by(MilkProduction.cow_id, MilkProduction.date)
+    ))
+    db.session.execute(DailyMilkTotal.__table__.insert().from_select(
+        ['date'] + columns,
+        select(MilkProduction.date, *sums).group_by(MilkProduction.date)
+    ))
+
+
+# --- Lookups (primary-key range scans on the rollup tables) ---
+def herd_milk_total(start_date, end_date):
+    return db.session.query(
+        func.sum(DailyMilkTotal.morning_qty_liters + DailyMilkTotal.evening_qty_liters)
+    ).filter(DailyMilkTotal.date >= start_date, DailyMilkTotal.date <= end_date).scalar() or 0.0
+
+
+def cow_milk_total(cow_id, start_date, end_date):
+    return db.session.query(
+        func.sum(CowDailyMilkTotal.morning_qty_liters + CowDailyMilkTotal.evening_qty_liters)
+    ).filter(CowDailyMilkTotal.cow_id == cow_id,
+             CowDailyMilkTotal.date >= start_date, CowDailyMilkTotal.date <= end_date).scalar() or 0.0
+
+
+def daily_herd_totals(start_date, end_date):
+    return DailyMilkTotal.query.filter(
+        DailyMilkTotal.date >= start_date, DailyMilkTotal.date <= end_date
+    ).order_by(DailyMilkTotal.date).all()
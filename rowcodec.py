@@ -0,0 +1,60 @@
+# rowcodec.py
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric
+
+# Row values <-> JSON-safe lists, by column kind (used by backup archives and the change feed)
+
+
+def column_kind(column):
+    kind = column.type
+    if isinstance(kind, Boolean):
+        return 'boolean'
+    if isinstance(kind, Integer):
+        return 'integer'
+    if isinstance(kind, Float): # Before Numeric: Float subclasses it
+        return 'float'
+    if isinstance(kind, Numeric):
+        return 'numeric'
+    if isinstance(kind, DateTime):
+        return 'datetime'
+    if isinstance(kind, Date):
+        return 'date'
+    return 'string'
+
+
+# JSON has no dates or decimals: they are written as ISO strings / exact decimal strings
+ENCODERS = {
+    'date': lambda value: value.isoformat(),
+    'datetime': lambda value: value.isoformat(),
+    'numeric': str,
+}
+DECODERS = {
+    'boolean': bool,
+    'date': date.fromisoformat,
+    'datetime': datetime.fromisoformat,
+    'numeric': Decimal,
+}
+
+
+def row_encoder(kinds):
+    encoders = [ENCODERS.get(kind) for kind in kinds]
+    if not any(encoders):
+        return list
+    return lambda row: [value if value is None or encode is None else encode(value)
+                        for value, encode in zip(row, encoders)]
+
+
+def row_decoder(columns):
+    """columns: [(position in the encoded row, column name, decoder or None)] -> row list to column dict."""
+    plain = [(position, name) for position, name, decode in columns if decode is None]
+    typed = [column for column in columns if column[2] is not None]
+
+    def decode_row(values):
+        row = {name: values[position] for position, name in plain}
+        for position, name, decode in typed:
+            value = values[position]
+            row[name] = None if value is None else decode(value)
+        return row
+    return decode_row
@@ -0,0 +1,108 @@
+# search.py
+import re
+from collections import namedtuple
+
+from sqlalchemy import Float, String, cast, column, func, literal, literal_column, null, select, table, union_all
+
+from extensions import db
+from models import Cow, Customer, Expense, HealthRecord, Payment, Vaccination
+
+# One full-text index per source table over its free-text columns, created by migration 10:
+# SQLite: an external-content FTS5 table kept in step by triggers;
+# PostgreSQL: a GIN index on the to_tsvector() expression the search query repeats.
+# Both live in the database, so bulk inserts, imports and restores are indexed too.
+SearchSource = namedtuple('SearchSource', 'model columns date_column')
+
+SEARCH_SOURCES = {
+    'health': SearchSource(HealthRecord, ('description', 'treatment'), HealthRecord.date),
+    'vaccination': SearchSource(Vaccination, ('notes',), Vaccination.vaccination_date),
+    'payment': SearchSource(Payment, ('description',), Payment.date),
+    'expense': SearchSource(Expense, ('description',), Expense.date),
+}
+SEARCH_LANGUAGE = 'english' # Postgres text search config; the SQLite index uses the porter stemmer to match
+
+
+def _fts_table(source):
+    return f'{source.model.__tablename__}_search'
+
+
+def _pg_document(source, prefix=''):
+    # The GIN index only serves queries that repeat this exact expression (see migrations.py)
+    parts = " || ' ' || ".join(f"coalesce({prefix}{name}, '')" for name in source.columns)
+    return f"to_tsvector('{SEARCH_LANGUAGE}', {parts})"
+
+
+def search_terms(query_text):
+    """The words of a search box entry (every one must match); punctuation and operators are dropped."""
+    return re.findall(r'\w+', query_text or '')
+
+
+def _match(source, terms, dialect):
+    """(FROM clause, WHERE condition, score) for one source; higher scores rank first."""
+    model = source.model
+    if dialect == 'postgresql':
+        query = func.plainto_tsquery(SEARCH_LANGUAGE, ' '.join(terms))
+        document = literal_column(_pg_document(source, f'{model.__tablename__}.'))
+        return model.__table__, document.op('@@')(query), func.ts_rank(document, query)
+    fts_name = _fts_table(source)
+    fts = table(fts_name, column('rowid'))
+    fts_column = literal_column(fts_name)
+    # Quoted terms are matched as plain words, never as FTS5 query syntax
+    match = fts_column.op('MATCH')(' '.join(f'"{term}"' for term in terms))
+    return fts.join(model.__table__, model.id == fts.c.rowid), match, -func.bm25(fts_column)
+
+
+def search_records(query_text, cow_id=None, start_date=None, end_date=None, kinds=None):
+    """
+    Full-text search over the free-text columns of health records,
+    vaccinations, payments and expenses, as one UNION ALL query (no ORM
+    objects), best match first. Cow filtering leaves out payments and
+    expenses. Returns (query, sort_columns) ready for keyset_paginate.
+    """
+    terms = search_terms(query_text)
+    dialect = db.session.get_bind().dialect.name
+    selects = []
+    for kind, source in SEARCH_SOURCES.items():
+        if (kinds and kind not in kinds) or (cow_id and not hasattr(source.model, 'cow_id')):
+            continue
+        model, date_column = source.model, source.date_column
+        from_clause, match, score = _match(source, terms, dialect)
+        conditions = [match]
+        if cow_id:
+            conditions.append(model.cow_id == cow_id)
+        if start_date:
+            conditions.append(date_column >= start_date)
+        if end_date:
+            conditions.append(date_column <= end_date)
+
+        if model is HealthRecord:
+            from_clause = from_clause.join(Cow, HealthRecord.cow_id == Cow.id)
+            subject, body, detail = Cow.name, HealthRecord.description, HealthRecord.treatment
+        elif model is Vaccination:
+            from_clause = from_clause.join(Cow, Vaccination.cow_id == Cow.id)
+            subject, body, detail = Cow.name, Vaccination.notes, Vaccination.vaccine_name
+        elif model is Payment:
+            from_clause = from_clause.join(Customer, Payment.customer_id == Customer.id)
+            subject, body, detail = Customer.name, Payment.description, cast(null(), String)
+        else:
+            subject, body, detail = Expense.category, Expense.description, cast(null(), String)
+        selects.append(select(
+            cast(score, Float).label('score'),
+            date_column.label('date'),
+            literal(kind, String).label('kind'),
+            model.id.label('id'),
+            cast(subject, String).label('subject'),
+            cast(body, String).label('body'),
+            cast(detail, String).label('detail'),
+        ).select_from(from_clause).where(*conditions))
+
+    if not terms or not selects:
+        # Nothing to look for: an empty result with the same columns
+        results = select(
+            cast(null(), Float).label('score'), HealthRecord.date.label('date'), literal('', String).label('kind'),
+            HealthRecord.id.label('id'), cast(null(), String).label('subject'), cast(null(), String).label('body'),
+            cast(null(), String).label('detail'),
+        ).where(literal(False)).subquery('results')
+    else:
+        results = union_all(*selects).subquery('results')
+    return db.session.query(results), [results.c.score, results.c.date, results.c.kind, results.c.id]
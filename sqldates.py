@@ -0,0 +1,22 @@
+# sqldates.py
+from sqlalchemy import Date, cast, func
+
+from extensions import db
+
+DATE_BUCKETS = ('day', 'week', 'month')
+
+# SQLite date() modifiers that move a date to the start of its bucket (weeks start on Monday)
+_SQLITE_BUCKET_MODIFIERS = {
+    'day': (),
+    'week': ('-6 days', 'weekday 1'),
+    'month': ('start of month',),
+}
+
+
+def date_bucket(column, bucket):
+    """SQL expression for the first day of the day/week/month containing `column`."""
+    if bucket not in DATE_BUCKETS:
+        raise ValueError(f"Unknown date bucket '{bucket}'. Use one of: {', '.join(DATE_BUCKETS)}.")
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.date(column, *_SQLITE_BUCKET_MODIFIERS[bucket], type_=Date)
+    return cast(func.date_trunc(bucket, column), Date)
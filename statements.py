@@ -0,0 +1,202 @@
+# statements.py
+import csv
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import Integer, Numeric, String, case, func, literal, select, type_coerce, union_all
+
+from extensions import db
+from models import Customer, Payment, Sale
+
+STATEMENT_FORMATS = ('html', 'csv')
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+StatementLine = namedtuple('StatementLine', 'date kind reference description quantity debit credit balance')
+Statement = namedtuple('Statement', 'customer_id name contact_info start end opening lines closing '
+                                    'total_sales total_payments')
+
+
+def _ledger(end_date):
+    """Sales (+) and payments (-) up to end_date as one UNION ALL subquery."""
+    sales = select(
+        Sale.customer_id.label('customer_id'), Sale.date.label('date'), Sale.timestamp.label('timestamp'),
+        literal(0, Integer).label('kind'), Sale.id.label('id'),
+        Sale.milk_quantity_liters.label('quantity'), Sale.price_per_liter.label('price'),
+        literal(None, String).label('description'),
+        Sale.total_amount.label('amount'),
+    ).where(Sale.date <= end_date)
+    payments = select(
+        Payment.customer_id, Payment.date, Payment.timestamp,
+        literal(1, Integer), Payment.id,
+        literal(None, Numeric(12, 2)), literal(None, Numeric(12, 2)),
+        Payment.description,
+        -Payment.amount_received,
+    ).where(Payment.date <= end_date)
+    return union_all(sales, payments).subquery('ledger')
+
+
+def statement_customer_ids(start_date, end_date):
+    """Customers with activity in the period or a non-zero balance carried into it."""
+    ledger = _ledger(end_date)
+    return list(db.session.scalars(
+        select(ledger.c.customer_id).group_by(ledger.c.customer_id).having(
+            (func.max(case((ledger.c.date >= start_date, 1), else_=0)) == 1)
+            | (func.sum(ledger.c.amount) != 0)
+        ).order_by(ledger.c.customer_id)
+    ))
+
+
+def load_statements(customer_ids, start_date, end_date):
+    """
+    Statements for a batch of customers from one query: the running balance
+    is a SUM() window over each customer's whole ledger, so lines before the
+    period only feed the opening balance.
+    """
+    ledger = _ledger(end_date)
+    order = (ledger.c.date, ledger.c.kind, ledger.c.timestamp, ledger.c.id)
+    running = select(
+        ledger,
+        type_coerce(func.sum(ledger.c.amount).over(partition_by=ledger.c.customer_id, order_by=order),
+                    Numeric(12, 2)).label('balance'),
+    ).where(ledger.c.customer_id.in_(customer_ids)).subquery('running')
+    rows = db.session.execute(
+        select(running, Customer.name, Customer.contact_info)
+        .join(Customer, Customer.id == running.c.customer_id)
+        .order_by(running.c.customer_id, running.c.date, running.c.kind, running.c.timestamp, running.c.id)
+    ).all()
+
+    by_customer = {}
+    for row in rows:
+        entry = by_customer.setdefault(row.customer_id, {'name': row.name, 'contact_info': row.contact_info,
+                                                         'opening': Decimal('0.00'), 'lines': []})
+        if row.date < start_date:
+            entry['opening'] = row.balance
+            continue
+        amount = row.amount or Decimal('0.00')
+        if row.kind == 0:
+            line = StatementLine(row.date, 'Sale', f'S-{row.id}',
+                                 f'{row.quantity:g} L @ {row.price:,.2f}', row.quantity, amount, None, row.balance)
+        else:
+            line = StatementLine(row.date, 'Payment', f'P-{row.id}', row.description or 'Payment received',
+                                 None, None, -amount, row.balance)
+        entry['lines'].append(line)
+
+    statements = []
+    for customer_id in customer_ids:
+        entry = by_customer.get(customer_id)
+        if entry is None:
+            continue
+        lines = entry['lines']
+        statements.append(Statement(
+            customer_id, entry['name'], entry['contact_info'], start_date, end_date, entry['opening'], lines,
+            lines[-1].balance if lines else entry['opening'],
+            sum((line.debit for line in lines if line.debit), Decimal('0.00')),
+            sum((line.credit for line in lines if line.credit), Decimal('0.00')),
+        ))
+    return statements
+
+
+# --- Rendering (runs in worker processes; no app context or database) ---
+_jinja_env = None
+
+
+def _template():
+    global _jinja_env
+    if _jinja_env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+        _jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+    return _jinja_env.get_template('statement.html')
+
+
+def statement_filename(statement, extension):
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', statement.name).strip('_')[:40] or 'customer'
+    return f'{statement.customer_id:06d}_{slug}.{extension}'
+
+
+def render_statement_csv(statement):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['Statement for', statement.name, 'Period', statement.start.isoformat(), statement.end.isoformat()])
+    writer.writerow(['Date', 'Type', 'Reference', 'Description', 'Charges (RWF)', 'Payments (RWF)', 'Balance (RWF)'])
+    writer.writerow([statement.start.isoformat(), 'Opening balance', '', '', '', '', f'{statement.opening:.2f}'])
+    for line in statement.lines:
+        writer.writerow([line.date.isoformat(), line.kind, line.reference, line.description,
+                         f'{line.debit:.2f}' if line.debit is not None else '',
+                         f'{line.credit:.2f}' if line.credit is not None else '', f'{line.balance:.2f}'])
+    writer.writerow([statement.end.isoformat(), 'Closing balance', '', '',
+                     f'{statement.total_sales:.2f}', f'{statement.total_payments:.2f}', f'{statement.closing:.2f}'])
+    return buffer.getvalue()
+
+
+def render_batch(statements, formats, directory, generated_at):
+    """Writes each statement in each format into directory; returns the number of files written."""
+    written = 0
+    template = _template() if 'html' in formats else None
+    for statement in statements:
+        if 'html' in formats:
+            with open(os.path.join(directory, statement_filename(statement, 'html')), 'w', encoding='utf-8') as f:
+                f.write(template.render(statement=statement, generated_at=generated_at))
+            written += 1
+        if 'csv' in formats:
+            with open(os.path.join(directory, statement_filename(statement, 'csv')), 'w', encoding='utf-8',
+                      newline='') as f:
+                f.write(render_statement_csv(statement))
+            written += 1
+    return written
+
+
+def statement_archive_name(start_date, end_date):
+    return f'statements_{start_date.isoformat()}_{end_date.isoformat()}.zip'
+
+
+def generate_statements(start_date, end_date, archive_path, formats=STATEMENT_FORMATS,
+                        batch_size=200, workers=None, progress=None):
+    """
+    Builds statements for every customer with activity or a balance in the
+    period and zips them into archive_path. The database work (one query per
+    batch) stays in this process; rendering and file writes go to a process
+    pool while the next batch is being queried. workers=1 renders in this
+    process instead (no pool). Returns the number of statements.
+    """
+    formats = [fmt for fmt in STATEMENT_FORMATS if fmt in formats] or list(STATEMENT_FORMATS)
+    customer_ids = statement_customer_ids(start_date, end_date)
+    generated_at = datetime.now().strftime('%Y-%m-%d %H:%M')
+    work_dir = tempfile.mkdtemp(prefix='statements_')
+    try:
+        done = 0
+        if workers == 1:
+            for offset in range(0, len(customer_ids), batch_size):
+                statements = load_statements(customer_ids[offset:offset + batch_size], start_date, end_date)
+                render_batch(statements, formats, work_dir, generated_at)
+                done += len(statements)
+                if progress:
+                    progress(done, len(customer_ids))
+        else:
+            with ProcessPoolExecutor(max_workers=workers or None) as pool:
+                pending = []
+                for offset in range(0, len(customer_ids), batch_size):
+                    statements = load_statements(customer_ids[offset:offset + batch_size], start_date, end_date)
+                    pending.append((len(statements), pool.submit(render_batch, statements, formats, work_dir,
+                                                                 generated_at)))
+                for count, future in pending:
+                    future.result()
+                    done += count
+                    if progress:
+                        progress(done, len(customer_ids))
+
+        os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+        folder = statement_archive_name(start_date, end_date)[:-len('.zip')]
+        with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(os.listdir(work_dir)):
+                archive.write(os.path.join(work_dir, name), arcname=f'{folder}/{name}')
+        return len(customer_ids)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
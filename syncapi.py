@@ -0,0 +1,251 @@
+# syncapi.py
+import hashlib
+import secrets
+from collections import defaultdict
+from datetime import datetime
+from functools import wraps
+
+from flask import g, jsonify, request
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from fields import FieldError, date_field, money_field, number_field, text_field
+from ledger import adjust_customer_balance, sale_total
+from models import ApiToken, Cow, Customer, HealthRecord, MilkProduction, Payment, Sale, SyncRecord, Vaccination
+from rollups import apply_milk_deltas
+from vaccinations import vaccination_status
+
+SYNC_KINDS = ('milk', 'health', 'vaccinations', 'sales', 'payments')
+SYNC_MODELS = {'milk': MilkProduction, 'health': HealthRecord, 'vaccinations': Vaccination,
+               'sales': Sale, 'payments': Payment}
+MAX_KEY_LENGTH = 100
+
+
+# --- Tokens ---
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_api_token(name, user_id=None):
+    """Adds a token and returns its plain value (shown once; only the hash is kept). Caller commits."""
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(name=name, token_hash=hash_token(token), user_id=user_id))
+    return token
+
+
+def api_token_required(view):
+    """Requires `Authorization: Bearer <token>` for a non-revoked ApiToken, stored as g.api_token."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        api_token = None
+        if scheme.lower() == 'bearer' and token.strip():
+            api_token = ApiToken.query.filter_by(token_hash=hash_token(token.strip()), revoked=False).first()
+        if api_token is None:
+            return jsonify({'error': 'Missing or invalid API token.'}), 401
+        g.api_token = api_token
+        return view(*args, **kwargs)
+    return wrapped
+
+
+# --- Batches ---
+class SyncBatch:
+    """
+    One client sync: every record in every kind is validated first, and only
+    a fully valid batch is written, with one bulk INSERT per kind plus the
+    rollup and balance updates, in a single transaction. Each record carries a
+    client-generated `key`; keys already stored in SyncRecord are reported as
+    duplicates and skipped, so resending a batch after a lost response is safe.
+    """
+
+    def __init__(self, payload, today, due_window_days):
+        self.payload = payload
+        self.today = today
+        self.due_window_days = due_window_days
+        self.errors = []
+        self.rows = {kind: [] for kind in SYNC_KINDS} # (key, column dict) per kind
+        self.duplicates = [] # (key, kind, record id)
+        self.milk_deltas = defaultdict(lambda: [0.0, 0.0, 0])
+        self.balance_deltas = defaultdict(int)
+
+    def _error(self, kind, index, key, message):
+        self.errors.append({'kind': kind, 'index': index, 'key': key, 'error': message})
+
+    def record_count(self):
+        return sum(len(records) for kind, records in self.payload.items() if isinstance(records, list))
+
+    def validate(self):
+        """Fills self.rows/self.duplicates, or self.errors. Returns True when the batch can be written."""
+        for kind in self.payload:
+            if kind not in SYNC_KINDS:
+                self._error(kind, None, None, f"Unknown record type. Use: {', '.join(SYNC_KINDS)}.")
+            elif not isinstance(self.payload[kind], list):
+                self._error(kind, None, None, 'Expected a list of records.')
+        if self.errors:
+            return False
+
+        records = [(kind, index, record) for kind in SYNC_KINDS
+                   for index, record in enumerate(self.payload.get(kind, []))]
+        seen = set()
+        for kind, index, record in records:
+            key = record.get('key') if isinstance(record, dict) else None
+            if not isinstance(key, str) or not key.strip() or len(key) > MAX_KEY_LENGTH:
+                self._error(kind, index, None,
+                            f"Each record needs a 'key' string of 1-{MAX_KEY_LENGTH} characters.")
+            elif key in seen:
+                self._error(kind, index, key, 'Key repeated within the batch.')
+            seen.add(key)
+        if self.errors:
+            return False
+
+        # Three lookups for the whole batch: stored keys, referenced cows, referenced customers
+        stored = {key: (kind, record_id) for key, kind, record_id in db.session.query(
+            SyncRecord.key, SyncRecord.kind, SyncRecord.record_id).filter(SyncRecord.key.in_(seen))} if seen else {}
+        tags = {str(record.get('cow_id', '')).strip() for kind, _, record in records
+                if kind in ('milk', 'health', 'vaccinations')}
+        self.cows = {tag: pk for pk, tag in db.session.query(Cow.id, Cow.cow_id).filter(Cow.cow_id.in_(tags))} \
+            if tags else {}
+        customer_ids = set()
+        for kind, _, record in records:
+            if kind in ('sales', 'payments'):
+                try:
+                    customer_ids.add(int(record.get('customer_id')))
+                except (TypeError, ValueError):
+                    pass
+        self.customers = {pk for pk, in db.session.query(Customer.id).filter(Customer.id.in_(customer_ids))} \
+            if customer_ids else set()
+
+        for kind, index, record in records:
+            key = record['key']
+            if key in stored:
+                self.duplicates.append((key, *stored[key]))
+                continue
+            try:
+                self.rows[kind].append((key, getattr(self, f'_build_{kind}')(record)))
+            except FieldError as e:
+                self._error(kind, index, key, str(e))
+        return not self.errors
+
+    # --- Per-kind row builders (same field names as the import files) ---
+    def _cow_id(self, record):
+        tag = text_field(record, 'cow_id', required=True)
+        cow_id = self.cows.get(tag)
+        if cow_id is None:
+            raise FieldError(f"Unknown Cow ID '{tag}'.")
+        return cow_id
+
+    def _customer_id(self, record):
+        try:
+            customer_id = int(record.get('customer_id'))
+        except (TypeError, ValueError):
+            raise FieldError("'customer_id' is required.")
+        if customer_id not in self.customers:
+            raise FieldError(f"Unknown customer {customer_id}.")
+        return customer_id
+
+    def _build_milk(self, record):
+        row = {
+            'cow_id': self._cow_id(record),
+            'date': date_field(record, 'date', required=True),
+            'morning_qty_liters': number_field(record, 'morning_qty', default=0.0),
+            'evening_qty_liters': number_field(record, 'evening_qty', default=0.0),
+        }
+        delta = self.milk_deltas[(row['cow_id'], row['date'])]
+        delta[0] += row['morning_qty_liters']
+        delta[1] += row['evening_qty_liters']
+        delta[2] += 1
+        return row
+
+    def _build_health(self, record):
+        return {
+            'cow_id': self._cow_id(record),
+            'date': date_field(record, 'date', required=True),
+            'description': text_field(record, 'description', required=True),
+            'treatment': text_field(record, 'treatment'),
+            'veterinarian': text_field(record, 'veterinarian'),
+        }
+
+    def _build_vaccinations(self, record):
+        next_due_date = date_field(record, 'next_due_date')
+        return {
+            'cow_id': self._cow_id(record),
+            'vaccine_name': text_field(record, 'vaccine_name', required=True),
+            'vaccination_date': date_field(record, 'vaccination_date', required=True),
+            'next_due_date': next_due_date,
+            'status': vaccination_status(next_due_date, self.today, self.due_window_days),
+            'notes': text_field(record, 'notes'),
+        }
+
+    def _build_sales(self, record):
+        milk_qty = number_field(record, 'milk_qty', required=True)
+        price_per_liter = money_field(record, 'price_per_liter', required=True)
+        row = {
+            'customer_id': self._customer_id(record),
+            'date': date_field(record, 'date', required=True),
+            'milk_quantity_liters': milk_qty,
+            'price_per_liter': price_per_liter,
+            'total_amount': sale_total(milk_qty, price_per_liter),
+            'is_paid': False,
+        }
+        self.balance_deltas[row['customer_id']] += row['total_amount']
+        return row
+
+    def _build_payments(self, record):
+        row = {
+            'customer_id': self._customer_id(record),
+            'date': date_field(record, 'date', required=True),
+            'amount_received': money_field(record, 'amount', required=True),
+            'description': text_field(record, 'description'),
+        }
+        self.balance_deltas[row['customer_id']] -= row['amount_received']
+        return row
+
+    def write(self, token_id):
+        """Inserts the validated rows and their keys in the current transaction. Returns per-record results."""
+        results, sync_rows = [], []
+        for kind in SYNC_KINDS:
+            if not self.rows[kind]:
+                continue
+            model = SYNC_MODELS[kind]
+            ids = db.session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True),
+                                     [row for _, row in self.rows[kind]]).all()
+            for (key, _), record_id in zip(self.rows[kind], ids):
+                sync_rows.append({'key': key, 'kind': kind, 'record_id': record_id, 'token_id': token_id})
+                results.append({'key': key, 'kind': kind, 'id': record_id, 'status': 'created'})
+        if sync_rows:
+            # Primary key on key: a concurrent retry of the same batch fails here and rolls back whole
+            db.session.execute(insert(SyncRecord), sync_rows)
+        if self.milk_deltas:
+            apply_milk_deltas({key: tuple(value) for key, value in self.milk_deltas.items()})
+        for customer_id, delta in self.balance_deltas.items():
+            adjust_customer_balance(customer_id, delta)
+        results.extend({'key': key, 'kind': kind, 'id': record_id, 'status': 'duplicate'}
+                       for key, kind, record_id in self.duplicates)
+        return results
+
+
+def sync_batch(payload, api_token, today, due_window_days, max_records):
+    """Validates and writes one batch. Returns (HTTP status, response body)."""
+    for attempt in (1, 2):
+        batch = SyncBatch(payload, today, due_window_days)
+        if batch.record_count() > max_records:
+            return 413, {'error': f'At most {max_records} records per batch.'}
+        if not batch.validate():
+            db.session.rollback()
+            return 422, {'errors': batch.errors}
+        try:
+            results = batch.write(api_token.id)
+            api_token.last_used_at = datetime.utcnow()
+            db.session.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent copy of this batch: on the retry its keys show up as duplicates
+            db.session.rollback()
+            if attempt == 2:
+                raise
+            continue
+        created = defaultdict(int)
+        for result in results:
+            if result['status'] == 'created':
+                created[result['kind']] += 1
+        return 200, {'created': dict(created), 'duplicates': len(batch.duplicates), 'results': results}
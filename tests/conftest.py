@@ -0,0 +1,97 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+# The app reads its configuration at import, so point it at a scratch SQLite database first
+_scratch_dir = tempfile.mkdtemp(prefix='dairy-farm-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_scratch_dir, 'test.db')
+os.environ['VACCINATION_STATUS_INTERVAL'] = '0' # No background status timer
+os.environ['JOB_WORKER_IN_WEB'] = ''
+for name in ('JOB_DIR', 'BACKUP_DIR', 'STATEMENT_DIR'):
+    os.environ[name] = os.path.join(_scratch_dir, name.lower())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app # noqa: E402
+from auth import user_cache # noqa: E402
+from extensions import db # noqa: E402
+from migrations import upgrade # noqa: E402
+from models import Cow, Customer, Expense, HealthRecord, MilkProduction, Payment, Sale, User, Vaccination # noqa: E402
+
+TEST_USER = ('farmer', 'farmer-password')
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        upgrade()
+    return flask_app
+
+
+@pytest.fixture
+def database(app):
+    """An empty database; every row is deleted again after the test."""
+    yield db
+    with app.app_context():
+        db.session.remove()
+        with db.engine.begin() as conn:
+            for table in reversed(db.metadata.sorted_tables):
+                conn.execute(table.delete())
+    user_cache.invalidate_all()
+
+
+@pytest.fixture
+def app_context(app, database):
+    # Not used by the client tests: a request reuses an active app context, and with it g's query count
+    with app.app_context():
+        yield
+        db.session.rollback()
+
+
+@pytest.fixture
+def seed(app, database):
+    """A few rows in every table: ids of the user, cows and customers."""
+    with app.app_context():
+        return _seed_rows()
+
+
+def _seed_rows():
+    today = date.today()
+    user = User(username=TEST_USER[0])
+    user.set_password(TEST_USER[1])
+    cows = [Cow(cow_id=f'C{n}', name=name, breed='Jersey') for n, name in enumerate(('Bella', 'Daisy', 'Rosie'), 1)]
+    customers = [Customer(name='Joe', balance=Decimal('0.00')), Customer(name='Mary', balance=Decimal('0.00'))]
+    db.session.add_all([user] + cows + customers)
+    db.session.flush()
+
+    for days_ago in range(3):
+        day = today - timedelta(days=days_ago)
+        for cow in cows:
+            db.session.add(MilkProduction(cow_id=cow.id, date=day, morning_qty_liters=5.0, evening_qty_liters=4.0))
+            db.session.add(HealthRecord(cow_id=cow.id, date=day, description=f'cough check {days_ago}',
+                                        treatment='rest'))
+            db.session.add(Vaccination(cow_id=cow.id, vaccine_name=f'FMD {days_ago}', vaccination_date=day,
+                                       next_due_date=day + timedelta(days=10 * days_ago), status='Due',
+                                       notes='booster'))
+        for customer in customers:
+            db.session.add(Sale(customer_id=customer.id, date=day, milk_quantity_liters=2.0,
+                                price_per_liter=Decimal('60.00'), total_amount=Decimal('120.00')))
+            db.session.add(Payment(customer_id=customer.id, date=day, amount_received=Decimal('50.00'),
+                                   description='cash'))
+        db.session.add(Expense(date=day, category='Feed', amount=Decimal('100.00'), description='hay bales'))
+    db.session.commit()
+    return {'user_id': user.id, 'cow_ids': [cow.id for cow in cows], 'customer_ids': [c.id for c in customers]}
+
+
+@pytest.fixture
+def client(app, seed):
+    """A test client logged in as the seeded user."""
+    test_client = app.test_client()
+    response = test_client.post('/login', data={'username': TEST_USER[0], 'password': TEST_USER[1]})
+    assert response.status_code == 302
+    return test_client
@@ -0,0 +1,99 @@
+# tests/test_auth.py
+from sqlalchemy import update
+
+import app as app_module
+import auth
+from auth import LoginThrottle, load_cached_user, user_cache
+from extensions import db
+from models import User
+
+USERNAME, PASSWORD = 'farmer', 'farmer-password' # The seeded user
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_throttle_counts_failures_per_key_within_a_window(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(auth, 'time', clock)
+    throttle = LoginThrottle()
+    limits = [('ip:a', 3), ('user:x@a', 2)]
+    throttle.record_failure(['ip:a', 'user:x@a'], window=60)
+    assert throttle.retry_after(limits) == 0
+    throttle.record_failure(['ip:a', 'user:x@a'], window=60)
+    clock.now += 20
+    assert throttle.retry_after(limits) == 41 # The user key is at its limit until its window ends
+    assert throttle.retry_after([('ip:a', 3), ('user:y@a', 2)]) == 0
+
+    throttle.clear('user:x@a')
+    assert throttle.retry_after(limits) == 0
+    clock.now += 41
+    throttle.record_failure(['ip:a'], window=60) # The old window is over: counting starts again
+    assert throttle.retry_after([('ip:a', 2)]) == 0
+
+
+def _login(client, password, address):
+    return client.post('/login', data={'username': USERNAME, 'password': password},
+                       headers={'X-Forwarded-For': address})
+
+
+def test_login_is_throttled_per_user_and_address(app, seed, monkeypatch):
+    monkeypatch.setattr(app_module, 'login_throttle', LoginThrottle())
+    client = app.test_client()
+    for _ in range(app.config['LOGIN_MAX_FAILURES_PER_USER']):
+        assert _login(client, 'guess', '203.0.113.5').status_code == 200
+    response = _login(client, PASSWORD, '203.0.113.5')
+    assert response.status_code == 429 and int(response.headers['Retry-After']) > 0
+
+    # Guessing from elsewhere doesn't lock the owner out
+    assert _login(app.test_client(), PASSWORD, '198.51.100.7').status_code == 302
+
+
+def test_too_many_failures_from_one_address(app, seed, monkeypatch):
+    monkeypatch.setattr(app_module, 'login_throttle', LoginThrottle())
+    monkeypatch.setitem(app.config, 'LOGIN_MAX_FAILURES_PER_IP', 3)
+    client = app.test_client()
+    for username in ('a', 'b', 'c'):
+        client.post('/login', data={'username': username, 'password': 'x'}, headers={'X-Forwarded-For': '192.0.2.1'})
+    assert _login(client, PASSWORD, '192.0.2.1').status_code == 429
+
+
+def test_user_cache_drops_committed_user_writes(app_context, seed):
+    user_cache.invalidate_all()
+    user_id = seed['user_id']
+    assert load_cached_user(user_id, ttl=60).username == 'farmer'
+
+    # Written behind the session's back: the cached copy is still served
+    with db.engine.begin() as conn:
+        conn.execute(update(User.__table__).where(User.__table__.c.id == user_id).values(username='renamed'))
+    assert load_cached_user(user_id, ttl=60).username == 'farmer'
+    assert load_cached_user(user_id, ttl=0).username == 'renamed'
+
+    user = db.session.get(User, user_id)
+    user.username = 'farmhand'
+    db.session.flush()
+    db.session.rollback() # Rolled back: nothing to drop
+    assert load_cached_user(user_id, ttl=60).username == 'farmer'
+
+    user = db.session.get(User, user_id)
+    user.username = 'farmhand'
+    db.session.commit()
+    assert load_cached_user(user_id, ttl=60).username == 'farmhand'
+
+    db.session.execute(update(User).values(username='bulk'))
+    db.session.commit()
+    assert load_cached_user(user_id, ttl=60).username == 'bulk'
+
+
+def test_deleted_user_is_not_served_from_cache(app_context, seed):
+    user_cache.invalidate_all()
+    user_id = seed['user_id']
+    assert load_cached_user(user_id, ttl=60) is not None
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+    assert load_cached_user(user_id, ttl=60) is None
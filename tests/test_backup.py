@@ -0,0 +1,113 @@
+# tests/test_backup.py
+import json
+import zipfile
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+import backup
+from backup import BackupError, create_backup, read_manifest, restore_backup
+from extensions import db
+from models import Cow, Customer, HealthRecord
+from search import search_records
+
+
+def _contents():
+    with db.engine.connect() as conn:
+        return {table.name: conn.execute(select(table).order_by(*table.primary_key.columns)).all()
+                for table in db.metadata.sorted_tables}
+
+
+def _empty_database():
+    db.session.remove()
+    with db.engine.begin() as conn:
+        for table in reversed(db.metadata.sorted_tables):
+            conn.execute(table.delete())
+
+
+def test_round_trip_into_an_empty_database(app_context, seed, tmp_path, monkeypatch):
+    # Tiny chunks and fetches, so tables span several archive members
+    monkeypatch.setattr(backup, 'BACKUP_CHUNK_ROWS', 4)
+    monkeypatch.setattr(backup, 'FETCH_SIZE', 2)
+    path = str(tmp_path / 'farm.zip')
+    original = _contents()
+
+    counts = create_backup(path)
+    assert counts == {name: len(rows) for name, rows in original.items()}
+    with zipfile.ZipFile(path) as archive:
+        manifest = read_manifest(archive)
+    health = next(entry for entry in manifest['tables'] if entry['name'] == 'health_record')
+    assert len(health['chunks']) == 3 and health['rows'] == 9
+
+    _empty_database()
+    assert restore_backup(path) == counts
+    assert _contents() == original # Same ids, decimals, dates and flags
+    query, _ = search_records('cough')
+    assert query.count() == 9 # The full-text index follows the restored rows
+
+
+def test_restore_refuses_a_database_with_data(app_context, seed, tmp_path):
+    path = str(tmp_path / 'farm.zip')
+    create_backup(path)
+    with pytest.raises(BackupError, match='not empty'):
+        restore_backup(path)
+
+
+def test_replace_swaps_in_the_backed_up_rows(app_context, seed, tmp_path):
+    path = str(tmp_path / 'farm.zip')
+    create_backup(path)
+    original = _contents()
+
+    db.session.get(Customer, seed['customer_ids'][0]).name = 'Renamed'
+    db.session.add(Cow(cow_id='C9', name='Extra'))
+    db.session.delete(HealthRecord.query.first())
+    db.session.commit()
+
+    restore_backup(path, replace=True)
+    assert _contents() == original
+
+
+def test_foreign_archives_are_rejected(app_context, tmp_path):
+    path = str(tmp_path / 'other.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('readme.txt', 'hello')
+    with pytest.raises(BackupError, match='no manifest'):
+        restore_backup(path)
+
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps({'format': 'something-else', 'format_version': 1}))
+    with pytest.raises(BackupError, match='Unsupported'):
+        restore_backup(path)
+
+
+def test_backup_from_newer_schema_is_rejected(app_context, database, tmp_path):
+    path = str(tmp_path / 'future.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('manifest.json', json.dumps({
+            'format': backup.BACKUP_FORMAT, 'format_version': backup.BACKUP_FORMAT_VERSION,
+            'schema_version': 10 ** 6, 'tables': [],
+        }))
+    with pytest.raises(BackupError, match='Upgrade the app'):
+        restore_backup(path)
+
+
+class _RecordingConnection:
+    dialect = postgresql.dialect()
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement))
+
+
+def test_postgres_sequence_reset_quotes_table_names(app_context):
+    conn = _RecordingConnection()
+    backup._reset_sequences(conn)
+    by_table = {statement.split(' FROM ')[-1].split(')')[0]: statement for statement in conn.statements}
+    assert by_table['"user"'] == ("SELECT setval(pg_get_serial_sequence('\"user\"', 'id'), "
+                                  'COALESCE((SELECT MAX(id) FROM "user"), 0) + 1, false)')
+    assert 'milk_production' in by_table
+    assert 'sync_record' not in by_table # String key: no sequence
+    assert 'cow_daily_milk_total' not in by_table # Composite key
@@ -0,0 +1,36 @@
+# tests/test_cache.py
+from cache import KeyedCache
+
+
+def test_entries_are_served_for_their_tag_until_they_expire():
+    cache, builds = KeyedCache(), []
+
+    def build(keys):
+        builds.append(sorted(keys))
+        return {key: f'{key}-v{len(builds)}' for key in keys}
+
+    assert cache.get_many(['a', 'b'], 60, build, tag=1) == {'a': 'a-v1', 'b': 'b-v1'}
+    assert cache.get_many(['a', 'b', 'c'], 60, build, tag=1) == {'a': 'a-v1', 'b': 'b-v1', 'c': 'c-v2'}
+    assert cache.get('a', 60, lambda: 'fresh', tag=2) == 'fresh' # Another as-of: rebuilt
+    assert builds == [['a', 'b'], ['c']]
+
+    cache.invalidate(['b'])
+    assert cache.get_many(['b', 'c'], 60, build, tag=1) == {'b': 'b-v3', 'c': 'c-v2'}
+    cache.invalidate_all()
+    assert cache.get('c', 0, lambda: 'rebuilt', tag=1) == 'rebuilt'
+    assert cache.get('c', 60, lambda: 'again', tag=1) == 'again' # A ttl of 0 expires at once
+
+
+def test_a_build_racing_an_invalidation_is_not_cached():
+    cache = KeyedCache()
+
+    def build_then_write(keys):
+        cache.invalidate(['a']) # A commit lands while the old rows are being read
+        return {key: 'stale' for key in keys}
+
+    assert cache.get_many(['a', 'b'], 60, build_then_write) == {'a': 'stale', 'b': 'stale'}
+    assert cache.get('a', 60, lambda: 'fresh') == 'fresh'
+    assert cache.get('b', 60, lambda: 'unused') == 'stale'
+
+    assert cache.get('c', 60, lambda: cache.invalidate_all() or 'stale') == 'stale'
+    assert cache.get('c', 60, lambda: 'fresh') == 'fresh'
@@ -0,0 +1,120 @@
+# tests/test_changelog.py
+from datetime import date
+
+import pytest
+from sqlalchemy import delete, insert, update
+
+from changelog import UnknownVersion, changes_since, latest_version
+from extensions import db
+from models import ChangeLog, Cow, Expense, HealthRecord, User
+from syncapi import create_api_token
+
+
+def _entries(since):
+    return [(entry.table_name, entry.row_id, entry.op)
+            for entry in ChangeLog.query.filter(ChangeLog.version > since).order_by(ChangeLog.version)]
+
+
+def test_session_writes_are_logged(app_context, seed):
+    start = latest_version()
+    cow = Cow(cow_id='C9', name='Luna')
+    db.session.add(cow)
+    db.session.commit()
+    cow.name = 'Luna II'
+    db.session.commit()
+    db.session.get(Cow, seed['cow_ids'][0]).breed = 'Jersey' # Unchanged value: no entry
+    db.session.commit()
+    db.session.delete(cow)
+    db.session.commit()
+    assert _entries(start) == [('cow', cow.id, 'I'), ('cow', cow.id, 'U'), ('cow', cow.id, 'D')]
+
+
+def test_bulk_statements_are_logged(app_context, seed):
+    start = latest_version()
+    new_ids = db.session.scalars(insert(Expense).returning(Expense.id), [
+        {'date': date(2020, 1, 1), 'category': 'Feed', 'amount': 5},
+        {'date': date(2020, 1, 2), 'category': 'Vet', 'amount': 7},
+    ]).all()
+    db.session.execute(update(Expense).where(Expense.category == 'Vet').values(amount=8))
+    db.session.execute(delete(Expense).where(Expense.id == new_ids[0]))
+    db.session.commit()
+    assert _entries(start) == [('expense', new_ids[0], 'I'), ('expense', new_ids[1], 'I'),
+                               ('expense', new_ids[1], 'U'), ('expense', new_ids[0], 'D')]
+
+
+def test_untracked_tables_are_not_logged(app_context, seed):
+    start = latest_version()
+    db.session.get(User, seed['user_id']).username = 'farmhand'
+    db.session.execute(update(ChangeLog).values(op='I'))
+    db.session.commit()
+    assert _entries(start) == []
+
+
+def test_full_sync_pages_through_every_row(app_context, seed):
+    since, pages, health_ids = 0, 0, set()
+    while True:
+        page = changes_since(since, 10)
+        pages += 1
+        rows = page['upserts'].get('health_record', {'rows': []})['rows']
+        health_ids.update(row[0] for row in rows)
+        since = page['next']
+        if not page['has_more']:
+            break
+    assert pages > 1
+    assert since == latest_version()
+    assert health_ids == {record.id for record in HealthRecord.query}
+
+
+def test_page_collapses_to_the_last_change_per_row(app_context, seed):
+    start = latest_version()
+    cow = db.session.get(Cow, seed['cow_ids'][0])
+    cow.name = 'Bella II'
+    db.session.commit()
+    cow.status = 'sold'
+    db.session.commit()
+    gone = HealthRecord.query.first()
+    gone_id = gone.id
+    db.session.delete(gone)
+    db.session.commit()
+
+    page = changes_since(start, 100, tables=['cow', 'health_record'])
+    cows = page['upserts']['cow']
+    row = dict(zip(cows['columns'], cows['rows'][0]))
+    assert len(cows['rows']) == 1 and (row['name'], row['status']) == ('Bella II', 'sold')
+    assert page['deletes'] == {'health_record': [gone_id]}
+    assert page['next'] == latest_version() and not page['has_more']
+
+    assert changes_since(page['next'], 100) == {'since': page['next'], 'next': page['next'], 'has_more': False,
+                                                'upserts': {}, 'deletes': {}}
+
+
+def test_unknown_version_is_refused(app_context, seed):
+    with pytest.raises(UnknownVersion):
+        changes_since(latest_version() + 1000, 10)
+
+
+def test_changes_endpoint(app, seed):
+    with app.app_context():
+        token = create_api_token('reader')
+        db.session.commit()
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    body = client.get('/api/changes?tables=cow&limit=2', headers=headers).get_json()
+    assert body['has_more'] and len(body['upserts']['cow']['rows']) == 2
+    assert body['latest'] >= body['next']
+    assert client.get('/api/changes?tables=barn', headers=headers).status_code == 400
+    assert client.get('/api/changes?since=-1', headers=headers).status_code == 400
+    assert client.get(f'/api/changes?since={body["latest"] + 1000}', headers=headers).status_code == 400
+    assert client.get('/api/changes').status_code == 401
+
+
+def test_resaving_an_unchanged_record_logs_nothing(app, client, seed):
+    with app.app_context():
+        record = HealthRecord.query.first()
+        record_id, start = record.id, latest_version()
+        form = {'cow_id': str(record.cow_id), 'date': record.date.isoformat(), 'description': record.description,
+                'treatment': record.treatment} # No veterinarian: the unset field stays None
+    assert client.post(f'/health_records/edit/{record_id}', data=form).status_code == 302
+    with app.app_context():
+        assert _entries(start) == []
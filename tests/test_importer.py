@@ -0,0 +1,116 @@
+# tests/test_importer.py
+import io
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from jobs import JobRunner, record_heartbeat
+from importer import Importer, run_import
+from models import Cow, Customer, DailyMilkTotal, Expense, Job, MilkProduction, Payment, Sale
+
+
+def _csv(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_cows_import_skips_duplicate_tags(app_context, seed):
+    result = run_import('cows', _csv(
+        'Cow ID,Name,Breed,Pregnant,Due Date\n'
+        'C9,Luna,Friesian,yes,2030-01-15\n'
+        'C9,Again,Friesian,,\n'
+        'C1,Taken,Jersey,,\n'
+    ), 'cows.csv')
+    assert (result.processed, result.imported, result.error_count) == (3, 1, 2)
+    assert [line for line, _ in result.errors] == [3, 4]
+    cow = Cow.query.filter_by(cow_id='C9').one()
+    assert cow.is_pregnant and cow.pregnancy_due_date == date(2030, 1, 15) and cow.status == 'active'
+
+
+def test_milk_import_updates_the_rollups_per_chunk(app_context, seed):
+    progress = []
+    result = run_import('milk', _csv(
+        'cow_tag,date,morning,evening\n'
+        'C1,2020-03-01,5,4\n'
+        'C2,2020-03-01,6,\n'
+        'C3,2020-03-02,2.5,2.5\n'
+        'C404,2020-03-02,1,1\n'
+    ), 'milk.csv', chunk_size=2, progress=lambda r: progress.append(r.imported))
+    assert (result.imported, result.error_count, result.aborted) == (3, 1, False)
+    assert progress == [2, 3]
+    assert MilkProduction.query.filter(MilkProduction.date < date(2021, 1, 1)).count() == 3
+    assert db.session.get(DailyMilkTotal, date(2020, 3, 1)).total_daily_quantity() == 15.0
+    assert db.session.get(DailyMilkTotal, date(2020, 3, 2)).record_count == 1
+
+
+def test_sales_and_payments_move_customer_balances(app_context, seed):
+    sales = run_import('sales', _csv(
+        'Customer,Date,Quantity,Price\n'
+        'joe,2020-01-01,3,0.10\n'
+        'New Shop,2020-01-02,2,60\n'
+    ), 'sales.csv', create_customers=True)
+    payments = run_import('payments', _csv('customer_name,date,amount\nJoe,2020-01-03,0.05\n'), 'payments.csv')
+    assert (sales.imported, payments.imported) == (2, 1)
+
+    joe = db.session.get(Customer, seed['customer_ids'][0])
+    assert joe.balance == Decimal('0.25')
+    assert Sale.query.filter_by(customer_id=joe.id, date=date(2020, 1, 1)).one().total_amount == Decimal('0.30')
+    assert Customer.query.filter_by(name='New Shop').one().balance == Decimal('120.00')
+    assert Payment.query.filter_by(date=date(2020, 1, 3)).count() == 1
+
+
+def test_unknown_customer_is_reported_without_create(app_context, seed):
+    result = run_import('sales', _csv('customer,date,quantity,price\nNobody,2020-01-01,1,1\n'), 'sales.csv')
+    assert result.imported == 0
+    assert result.errors == [(2, "Unknown customer 'Nobody'.")]
+
+
+@pytest.mark.parametrize('amount, message', [
+    ('', "'amount' is required."),
+    ('ten', "'amount' must be a number."),
+    ('nan', "'amount' must be a finite number."),
+    ('inf', "'amount' must be a finite number."),
+    ('-5', "'amount' cannot be negative."),
+])
+def test_expense_amounts_are_validated(app_context, seed, amount, message):
+    result = run_import('expenses', _csv(f'date,category,amount\n2020-01-01,Feed,{amount}\n'), 'expenses.csv')
+    assert result.errors == [(2, message)]
+    assert Expense.query.filter_by(date=date(2020, 1, 1)).count() == 0
+
+
+def test_bad_date_is_reported(app_context, seed):
+    result = run_import('expenses', _csv('date,category,amount\n01/02/2020,Feed,5\n'), 'expenses.csv')
+    assert result.errors == [(2, "'date' must be a date in YYYY-MM-DD format.")]
+
+
+def test_unknown_kind_is_refused(app_context):
+    with pytest.raises(ValueError):
+        Importer('calves')
+
+
+def test_uploads_are_imported_by_the_job_runner(app, client, seed):
+    form = {'kind': 'expenses', 'file': (_csv('date,category,amount\n2020-01-01,Feed,5\n2020-01-02,Vet,lots\n'),
+                                         'expenses.csv')}
+    response = client.post('/import', data=form, content_type='multipart/form-data')
+    assert response.status_code == 302 # No runner: refused before the upload is kept
+    upload_dir = os.path.join(app.config['JOB_DIR'], 'uploads')
+    assert not os.path.isdir(upload_dir) or os.listdir(upload_dir) == []
+
+    with app.app_context():
+        record_heartbeat('worker-host:42')
+        db.session.commit()
+    form['file'] = (_csv('date,category,amount\n2020-01-01,Feed,5\n2020-01-02,Vet,lots\n'), 'expenses.csv')
+    response = client.post('/import', data=form, content_type='multipart/form-data')
+    assert response.status_code == 302 and '/jobs/' in response.location
+    with app.app_context():
+        assert Expense.query.filter_by(date=date(2020, 1, 1)).count() == 0 # Nothing imported in the request
+        JobRunner(app).run_forever(once=True)
+        job = Job.query.filter_by(kind='import').one()
+        assert job.status == 'succeeded'
+        with open(job.result_path) as report:
+            assert report.read() == ("expenses.csv: 1 of 2 expenses rows imported, 1 skipped with errors.\n"
+                                     "line 3: 'amount' must be a number.\n")
+        assert Expense.query.filter_by(date=date(2020, 1, 1)).count() == 1
+    assert os.listdir(upload_dir) == [] # The worker removed the upload
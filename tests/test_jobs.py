@@ -0,0 +1,130 @@
+# tests/test_jobs.py
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from extensions import db
+from jobs import (JobRunner, claim_job, enqueue_job, fail_stale_jobs, job_runner_alive, purge_jobs, record_heartbeat,
+                  run_job)
+from models import Job, JobRunnerHeartbeat
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """Test job kinds: 'echo' writes its params to a file, 'broken' raises."""
+    def echo(params, output_dir):
+        path = os.path.join(output_dir, 'echo.txt')
+        with open(path, 'w') as f:
+            f.write(params['text'])
+        return path
+
+    def broken(params, output_dir):
+        raise RuntimeError('disk on fire')
+
+    monkeypatch.setitem(jobs.JOB_HANDLERS, 'echo', echo)
+    monkeypatch.setitem(jobs.JOB_HANDLERS, 'broken', broken)
+
+
+def _job(status, age=timedelta(0), kind='echo'):
+    at = datetime.utcnow() - age
+    job = Job(kind=kind, params='{"text": "hi"}', status=status, created_at=at,
+              started_at=at if status != 'queued' else None,
+              finished_at=at if status in ('succeeded', 'failed') else None)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_claim_takes_the_oldest_queued_job_within_the_cap(app_context, database, handlers):
+    newer = _job('queued')
+    older = _job('queued', age=timedelta(minutes=5))
+    assert claim_job(concurrency=1) == older
+    assert claim_job(concurrency=1) is None # One already running
+    assert claim_job(concurrency=2) == newer
+    assert claim_job(concurrency=5) is None # Queue empty
+    assert {job.status for job in Job.query} == {'running'}
+
+
+def test_run_job_records_success_and_failure(app_context, database, handlers, tmp_path):
+    good = enqueue_job('echo', {'text': 'hello'})
+    bad = enqueue_job('broken', {})
+    for job_id in (claim_job(2), claim_job(2)):
+        run_job(job_id, str(tmp_path))
+
+    good, bad = db.session.get(Job, good.id), db.session.get(Job, bad.id)
+    assert good.status == 'succeeded' and good.finished_at is not None
+    with open(good.result_path) as f:
+        assert f.read() == 'hello'
+    assert bad.status == 'failed' and bad.error == 'RuntimeError: disk on fire'
+
+
+def test_unknown_kind_is_refused(app_context, database):
+    with pytest.raises(ValueError):
+        enqueue_job('nope', {})
+
+
+def test_stale_running_jobs_fail(app_context, database):
+    stale = _job('running', age=timedelta(hours=2))
+    fresh = _job('running', age=timedelta(minutes=1))
+    assert fail_stale_jobs(timeout_seconds=3600) == 1
+    db.session.commit()
+    assert db.session.get(Job, stale).status == 'failed'
+    assert db.session.get(Job, fresh).status == 'running'
+
+
+def test_purge_removes_old_finished_jobs_and_their_files(app_context, database, tmp_path):
+    old = _job('succeeded', age=timedelta(days=10))
+    old_failed = _job('failed', age=timedelta(days=10))
+    recent = _job('succeeded', age=timedelta(days=1))
+    queued = _job('queued', age=timedelta(days=10))
+    for job_id in (old, recent):
+        os.makedirs(jobs.job_dir(str(tmp_path), job_id))
+
+    assert purge_jobs(retention_days=7, job_dir_root=str(tmp_path)) == 2
+    db.session.commit()
+    assert {job.id for job in Job.query} == {recent, queued}
+    assert not os.path.exists(jobs.job_dir(str(tmp_path), old))
+    assert os.path.isdir(jobs.job_dir(str(tmp_path), recent))
+    assert db.session.get(Job, old_failed) is None
+
+
+def test_runner_heartbeat(app, app_context, database, handlers):
+    assert not job_runner_alive(60)
+    record_heartbeat('elsewhere:1')
+    db.session.commit()
+    assert job_runner_alive(60)
+    JobRunnerHeartbeat.query.update({JobRunnerHeartbeat.heartbeat_at: datetime.utcnow() - timedelta(minutes=5)})
+    db.session.commit()
+    assert not job_runner_alive(60)
+
+    job = enqueue_job('echo', {'text': 'from the queue'})
+    JobRunner(app).run_forever(once=True)
+    db.session.expire_all()
+    assert db.session.get(Job, job.id).status == 'succeeded'
+    assert job_runner_alive(60) # The runner checked in
+
+
+def test_jobs_are_refused_without_a_runner(app, client):
+    response = client.post('/admin/backup', headers={'Referer': '/admin/backup'})
+    assert response.status_code == 302 and response.location.endswith('/admin/backup')
+    response = client.post('/admin/backup', headers={'Accept': 'application/json'})
+    assert response.status_code == 503 and 'run-jobs' in response.get_json()['error']
+    assert b'No job runner is running' in client.get('/jobs').data
+    with app.app_context():
+        assert Job.query.count() == 0
+
+        record_heartbeat('worker-host:42')
+        db.session.commit()
+    response = client.post('/admin/backup', headers={'Accept': 'application/json'})
+    assert response.status_code == 202
+    assert b'No job runner is running' not in client.get('/jobs').data
+
+
+def test_missing_result_file_is_not_found(app, client):
+    with app.app_context():
+        job_id = _job('succeeded')
+        db.session.get(Job, job_id).result_path = '/nonexistent/result.zip'
+        db.session.commit()
+    assert client.get(f'/jobs/{job_id}/download').status_code == 404
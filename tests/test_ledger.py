@@ -0,0 +1,79 @@
+# tests/test_ledger.py
+from decimal import Decimal
+
+from extensions import db
+from ledger import adjust_customer_balance, sale_total, to_money
+from models import Customer, Payment, Sale
+from querybudget import count_queries
+
+
+def test_to_money_rounds_half_up_to_cents():
+    assert to_money('10') == Decimal('10.00')
+    assert to_money(0.125) == Decimal('0.13')
+    assert to_money('2.675') == Decimal('2.68') # A float 2.675 would round down
+    assert to_money(-1.005) == Decimal('-1.01')
+
+
+def test_sale_total_is_exact():
+    assert sale_total(3, '0.10') == Decimal('0.30')
+    assert sale_total(2.5, 60) == Decimal('150.00')
+    assert sale_total(1.333, '45.50') == Decimal('60.65')
+
+
+def test_adjust_customer_balance_increments_in_the_database(app_context, seed):
+    customer_id = seed['customer_ids'][0]
+    adjust_customer_balance(customer_id, '120.005')
+    adjust_customer_balance(str(customer_id), Decimal('-50'))
+    db.session.commit()
+    assert db.session.get(Customer, customer_id).balance == Decimal('70.01')
+
+
+def test_adjust_customer_balance_is_relative_to_the_stored_value(app_context, seed):
+    customer_id = seed['customer_ids'][0]
+    stale = db.session.get(Customer, customer_id) # Loaded before the increment
+    adjust_customer_balance(customer_id, 30)
+    db.session.commit()
+    db.session.refresh(stale)
+    assert stale.balance == Decimal('30.00')
+    assert db.session.get(Customer, seed['customer_ids'][1]).balance == Decimal('0.00')
+
+
+def test_zero_adjustment_issues_no_update(app_context, seed):
+    with count_queries() as counter:
+        adjust_customer_balance(seed['customer_ids'][0], '0.001')
+    assert counter['count'] == 0
+
+
+def _balances(app, customer_ids):
+    with app.app_context():
+        return [db.session.get(Customer, customer_id).balance for customer_id in customer_ids]
+
+
+def test_editing_a_sale_onto_another_customer_moves_the_balance(app, client, seed):
+    first, second = seed['customer_ids']
+    with app.app_context():
+        sale = Sale.query.filter_by(customer_id=first).first()
+        sale_id, sale_date = sale.id, sale.date.isoformat()
+    form = {'customer_id': str(second), 'date': sale_date, 'milk_qty': '3', 'price_per_liter': '50.00'}
+    assert client.post(f'/sales/edit/{sale_id}', data=form).status_code == 302
+    assert _balances(app, [first, second]) == [Decimal('-120.00'), Decimal('150.00')]
+
+    form['customer_id'] = 'Joe'
+    assert client.post(f'/sales/edit/{sale_id}', data=form).status_code == 400
+    assert _balances(app, [first, second]) == [Decimal('-120.00'), Decimal('150.00')]
+    with app.app_context():
+        assert db.session.get(Sale, sale_id).customer_id == second
+
+
+def test_editing_a_payment_onto_another_customer_moves_the_balance(app, client, seed):
+    first, second = seed['customer_ids']
+    with app.app_context():
+        payment = Payment.query.filter_by(customer_id=first).first()
+        payment_id, payment_date = payment.id, payment.date.isoformat()
+    form = {'customer_id': str(second), 'date': payment_date, 'amount_received': '40.00', 'description': 'cash'}
+    assert client.post(f'/payments/edit/{payment_id}', data=form).status_code == 302
+    assert _balances(app, [first, second]) == [Decimal('50.00'), Decimal('-40.00')]
+
+    form['customer_id'] = ''
+    assert client.post(f'/payments/edit/{payment_id}', data=form).status_code == 400
+    assert _balances(app, [first, second]) == [Decimal('50.00'), Decimal('-40.00')]
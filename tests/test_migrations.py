@@ -0,0 +1,25 @@
+# tests/test_migrations.py
+from sqlalchemy import create_engine, inspect
+
+from extensions import db
+from migrations import MIGRATIONS, applied_versions
+
+
+def _schema(engine):
+    inspector = inspect(engine)
+    schema = {}
+    for name in db.metadata.tables:
+        schema[name] = (
+            sorted((column['name'], str(column['type']), column['nullable']) for column in inspector.get_columns(name)),
+            sorted((index['name'], tuple(index['column_names'])) for index in inspector.get_indexes(name)),
+            sorted(tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(name)),
+            sorted((tuple(key['constrained_columns']), key['referred_table']) for key in inspector.get_foreign_keys(name)),
+        )
+    return schema
+
+
+def test_migrated_database_matches_the_models(app_context, tmp_path):
+    assert applied_versions() == {version for version, _, _ in MIGRATIONS}
+    reference = create_engine(f'sqlite:///{tmp_path / "reference.db"}')
+    db.metadata.create_all(reference)
+    assert _schema(db.engine) == _schema(reference)
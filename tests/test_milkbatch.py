@@ -0,0 +1,94 @@
+# tests/test_milkbatch.py
+from datetime import date
+
+import pytest
+
+from extensions import db
+from milkbatch import load_batch_rows, save_milk_batch
+from models import DailyMilkTotal, MilkProduction
+from rollups import rebuild_milk_rollups
+
+DAY = date(2020, 6, 1)
+
+
+def _form(cow_ids, morning, evening):
+    form = {}
+    for cow_id in cow_ids:
+        form[f'morning_qty_{cow_id}'] = morning
+        form[f'evening_qty_{cow_id}'] = evening
+    return form
+
+
+def _milk_rows(day=DAY):
+    return sorted((record.cow_id, record.morning_qty_liters, record.evening_qty_liters)
+                  for record in MilkProduction.query.filter_by(date=day))
+
+
+def test_grid_inserts_then_updates(app_context, seed):
+    cow_ids = seed['cow_ids']
+    form = _form(cow_ids[:2], '5', '')
+    assert save_milk_batch(DAY, load_batch_rows(DAY), form) == (2, 0, 0)
+    db.session.commit()
+    assert _milk_rows() == [(cow_ids[0], 5.0, 0.0), (cow_ids[1], 5.0, 0.0)]
+
+    # Evening added later: the blank morning keeps what was logged, the unchanged row is skipped
+    form = {f'evening_qty_{cow_ids[0]}': '4.5', f'morning_qty_{cow_ids[1]}': '5'}
+    rows = load_batch_rows(DAY)
+    assert [row.morning for row in rows if row.cow.id == cow_ids[0]] == ['5']
+    assert save_milk_batch(DAY, rows, form) == (0, 1, 0)
+    db.session.commit()
+    assert _milk_rows() == [(cow_ids[0], 5.0, 4.5), (cow_ids[1], 5.0, 0.0)]
+
+    totals = db.session.get(DailyMilkTotal, DAY)
+    assert (totals.morning_qty_liters, totals.evening_qty_liters, totals.record_count) == (10.0, 4.5, 2)
+    incremental = (totals.morning_qty_liters, totals.evening_qty_liters, totals.record_count)
+    rebuild_milk_rollups()
+    db.session.commit()
+    totals = db.session.get(DailyMilkTotal, DAY)
+    assert (totals.morning_qty_liters, totals.evening_qty_liters, totals.record_count) == incremental
+
+
+@pytest.mark.parametrize('bad', ['inf', '-inf', 'nan', 'NaN', 'lots', '-1'])
+def test_bad_quantities_reject_the_whole_grid(app_context, seed, bad):
+    cow_ids = seed['cow_ids']
+    form = _form(cow_ids[:1], '5', '4')
+    form[f'evening_qty_{cow_ids[1]}'] = bad
+    rows = load_batch_rows(DAY)
+    assert save_milk_batch(DAY, rows, form) == (0, 0, 1)
+    assert [row.error is not None for row in rows] == [cow_id == cow_ids[1] for cow_id in cow_ids]
+    db.session.commit()
+    assert _milk_rows() == []
+    assert db.session.get(DailyMilkTotal, DAY) is None
+
+
+def test_several_records_for_a_day_lock_the_row(app_context, seed):
+    cow_id = seed['cow_ids'][0]
+    db.session.add_all([MilkProduction(cow_id=cow_id, date=DAY, morning_qty_liters=1, evening_qty_liters=1)
+                        for _ in range(2)])
+    db.session.commit()
+    rows = load_batch_rows(DAY)
+    assert save_milk_batch(DAY, rows, {f'morning_qty_{cow_id}': '3'}) == (0, 0, 1)
+    assert save_milk_batch(DAY, rows, {}) == (0, 0, 0) # Left untouched: nothing to report
+
+
+@pytest.mark.parametrize('bad', ['inf', 'nan'])
+def test_routes_refuse_non_finite_quantities(app, client, seed, bad):
+    cow_id = seed['cow_ids'][0]
+    response = client.post('/milk_production/log/batch?date=2020-06-01', data=_form([cow_id], '5', bad))
+    assert response.status_code == 200 and b'Nothing was saved' in response.data
+    response = client.post('/milk_production/log', data={'cow_id': cow_id, 'date': '2020-06-01',
+                                                          'morning_qty': bad, 'evening_qty': '1'})
+    assert response.status_code == 200 and b'finite number' in response.data
+
+    with app.app_context():
+        record = MilkProduction.query.filter_by(cow_id=cow_id).first()
+        record_id, logged = record.id, (record.morning_qty_liters, record.evening_qty_liters)
+    response = client.post(f'/milk_production/edit/{record_id}', data={
+        'cow_id': cow_id, 'date': '2020-06-01', 'morning_qty': '1', 'evening_qty': bad})
+    assert response.status_code == 200 and b'finite number' in response.data
+
+    with app.app_context():
+        assert _milk_rows() == []
+        assert db.session.get(DailyMilkTotal, DAY) is None
+        record = db.session.get(MilkProduction, record_id)
+        assert (record.morning_qty_liters, record.evening_qty_liters) == logged
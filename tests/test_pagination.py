@@ -0,0 +1,60 @@
+# tests/test_pagination.py
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from models import Expense, HealthRecord
+from pagination import decode_cursor, encode_cursor, get_per_page, keyset_paginate
+
+HEALTH_SORT = [HealthRecord.date, HealthRecord.timestamp, HealthRecord.id]
+
+
+def _page(app, query_string):
+    with app.test_request_context(query_string=query_string):
+        page = keyset_paginate(HealthRecord.query, HEALTH_SORT)
+        return [(item.date, item.timestamp, item.id) for item in page.items], page
+
+
+def test_cursor_round_trip():
+    values = [date(2024, 2, 29), Decimal('12.50'), 7]
+    assert decode_cursor(encode_cursor(values), [Expense.date, Expense.amount, Expense.id]) == values
+
+
+@pytest.mark.parametrize('token', ['not base64!', encode_cursor([1]), encode_cursor(['yesterday', 'x', 1])])
+def test_bad_cursors_are_rejected(app, token):
+    with app.test_request_context():
+        with pytest.raises(BadRequest):
+            decode_cursor(token, HEALTH_SORT)
+
+
+def test_forward_pages_cover_every_row_once_newest_first(app, seed):
+    keys, page = _page(app, {'per_page': 4})
+    assert not page.has_prev
+    while page.has_next:
+        more, page = _page(app, {'per_page': 4, 'after': page.next_cursor})
+        keys += more
+    assert len(keys) == 9
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_before_cursor_returns_the_previous_page(app, seed):
+    first, page = _page(app, {'per_page': 4})
+    second, page = _page(app, {'per_page': 4, 'after': page.next_cursor})
+    assert page.has_prev
+    back, page = _page(app, {'per_page': 4, 'before': page.prev_cursor})
+    assert back == first
+    assert not page.has_prev and page.has_next
+
+
+def test_empty_query_has_no_cursors(app, database):
+    keys, page = _page(app, {})
+    assert keys == [] and not page.has_next and not page.has_prev
+
+
+@pytest.mark.parametrize('requested, expected', [(None, 50), (0, 1), (20, 20), (10000, 500)])
+def test_per_page_is_clamped(app, requested, expected):
+    query_string = {} if requested is None else {'per_page': requested}
+    with app.test_request_context(query_string=query_string):
+        assert get_per_page() == expected
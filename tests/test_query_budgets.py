@@ -0,0 +1,91 @@
+# tests/test_query_budgets.py
+import sys
+
+import pytest
+from sqlalchemy.orm import lazyload
+
+from querybudget import QueryBudgetExceeded, count_queries
+from syncapi import create_api_token
+
+# Every list and export view with a @query_budget, by endpoint
+BUDGETED_URLS = {
+    'index': '/',
+    'view_cows': '/cows',
+    'cow_analytics': '/cows/{cow_id}/analytics',
+    'herd_analytics': '/analytics/herd',
+    'milk_series_api': '/api/milk/series',
+    'milk_history': '/milk_production/history',
+    'view_health_records': '/health_records',
+    'view_vaccinations': '/vaccinations',
+    'view_customers': '/customers',
+    'view_sales': '/sales',
+    'view_payments': '/payments',
+    'view_expenses': '/expenses',
+    'profit_loss': '/profit_loss',
+    'amounts_receivable': '/amounts_receivable',
+    'receivables_aging_report': '/receivables/aging',
+    'export_milk_production': '/export/milk_production',
+    'export_health_records': '/export/health_records',
+    'export_sales': '/export/sales',
+    'export_payments': '/export/payments',
+    'export_expenses': '/export/expenses',
+    'export_vaccinations': '/export/vaccinations',
+    'view_jobs': '/jobs',
+    'search': '/search?q=cough',
+    'api_sync_reference': '/api/sync/reference',
+}
+CSV_EXPORTS = [endpoint for endpoint in BUDGETED_URLS if endpoint.startswith('export_')]
+
+
+@pytest.fixture
+def budget_app(app, monkeypatch):
+    # Worst case: no cached user or dashboard, so the budget covers every lookup
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_ENABLED', True)
+    for name in ('USER_CACHE_TTL', 'DASHBOARD_CACHE_TTL', 'ANALYTICS_CACHE_TTL'):
+        monkeypatch.setitem(app.config, name, 0)
+    return app
+
+
+def _get_within_budget(app, client, endpoint, url, **kwargs):
+    with count_queries() as counter:
+        response = client.get(url, **kwargs)
+        response.get_data() # Streamed exports run their queries while the body is read
+    assert response.status_code == 200, (url, response.status_code)
+    budget = app.view_functions[endpoint].query_budget
+    assert counter['count'] <= budget, f'{url} issued {counter["count"]} SQL statements (budget {budget})'
+    return response
+
+
+def test_every_budgeted_route_is_covered(app):
+    budgeted = {endpoint for endpoint, view in app.view_functions.items()
+                if getattr(view, 'query_budget', None) is not None}
+    assert budgeted == set(BUDGETED_URLS)
+
+
+@pytest.mark.parametrize('endpoint', sorted(BUDGETED_URLS))
+def test_route_stays_within_budget(budget_app, client, seed, database, endpoint):
+    headers = {}
+    if endpoint == 'api_sync_reference':
+        with budget_app.app_context():
+            headers['Authorization'] = f'Bearer {create_api_token("test tablet")}'
+            database.session.commit()
+    url = BUDGETED_URLS[endpoint].format(cow_id=seed['cow_ids'][0])
+    _get_within_budget(budget_app, client, endpoint, url, headers=headers)
+
+
+@pytest.mark.parametrize('endpoint', CSV_EXPORTS)
+def test_csv_export_stays_within_budget(budget_app, client, endpoint):
+    response = _get_within_budget(budget_app, client, endpoint, BUDGETED_URLS[endpoint] + '?format=csv')
+    assert response.mimetype == 'text/csv'
+
+
+def test_query_count_header(budget_app, client):
+    response = client.get('/health_records')
+    assert 0 < int(response.headers['X-Query-Count']) <= budget_app.view_functions['view_health_records'].query_budget
+
+
+def test_missing_eager_load_trips_the_budget(budget_app, client, monkeypatch):
+    # Without joinedload every distinct cow on the page is loaded by its own query
+    monkeypatch.setattr(sys.modules['app'], 'joinedload', lazyload)
+    with pytest.raises(QueryBudgetExceeded, match='view_health_records'):
+        client.get('/health_records')
@@ -0,0 +1,30 @@
+# tests/test_queryplans.py
+from datetime import date, timedelta
+
+from dashboard import build_dashboard_snapshot
+from extensions import db
+from models import Vaccination
+from queryplans import explain, full_scan_lines, main_route_queries
+
+WINDOW = 30
+
+
+def test_every_main_route_query_has_a_plan(app_context, seed):
+    for label, query in main_route_queries(WINDOW):
+        plan = explain(query)
+        assert plan, label
+        assert isinstance(full_scan_lines(plan), list)
+
+
+def test_upcoming_vaccinations_query_matches_the_dashboard(app_context, seed):
+    today = date.today()
+    cow_id = seed['cow_ids'][0]
+    for name, days in (('Inside the window', 5), ('Beyond the window', WINDOW + 5)):
+        db.session.add(Vaccination(cow_id=cow_id, vaccine_name=name, vaccination_date=today,
+                                   next_due_date=today + timedelta(days=days), status='Scheduled'))
+    db.session.commit()
+
+    query = dict(main_route_queries(WINDOW))['dashboard: upcoming vaccinations']
+    listed = build_dashboard_snapshot(today, WINDOW)['upcoming_vaccinations']
+    assert sorted(record.vaccine_name for record in query) == sorted(row.vaccine_name for row in listed)
+    assert 'Inside the window' in {row.vaccine_name for row in listed}
@@ -0,0 +1,79 @@
+# tests/test_reports.py
+from datetime import date, timedelta
+from decimal import Decimal
+
+from extensions import db
+from models import Customer, Payment, Sale
+from reports import receivables_aging, receivables_aging_totals, sync_sale_paid_flags
+
+TODAY = date(2020, 6, 30)
+
+
+def _customer(name, sales, payments):
+    """sales: [(days ago, amount)]; payments: [amount]."""
+    customer = Customer(name=name)
+    db.session.add(customer)
+    db.session.flush()
+    for days_ago, amount in sales:
+        db.session.add(Sale(customer_id=customer.id, date=TODAY - timedelta(days=days_ago), milk_quantity_liters=1,
+                            price_per_liter=amount, total_amount=amount, is_paid=False))
+    for amount in payments:
+        db.session.add(Payment(customer_id=customer.id, date=TODAY, amount_received=amount))
+    return customer
+
+
+def _ledger():
+    _customer('Partly paid', [(100, 100), (70, 50), (40, 30), (5, 20)], [120]) # FIFO: the first sale and 20 of the second
+    _customer('Never paid', [(95, 15)], [])
+    _customer('Settled', [(10, 10)], [10])
+    _customer('In credit', [(50, 5)], [25])
+    db.session.commit()
+
+
+def test_aging_allocates_payments_oldest_first(app_context, database):
+    _ledger()
+    query, _ = receivables_aging(TODAY)
+    rows = {row.name: row for row in query}
+    assert set(rows) == {'Partly paid', 'Never paid'}
+
+    partly = rows['Partly paid']
+    assert (partly.current, partly.days_31_60, partly.days_61_90, partly.days_90_plus, partly.total) == (
+        20, 30, 30, 0, 80)
+    assert (partly.oldest_unpaid, partly.unpaid_sales) == (TODAY - timedelta(days=70), 3)
+    never = rows['Never paid']
+    assert (never.days_90_plus, never.total, never.unpaid_sales) == (15, 15, 1)
+
+    totals = receivables_aging_totals(TODAY)
+    assert (totals.current, totals.days_31_60, totals.days_61_90, totals.days_90_plus, totals.total) == (
+        20, 30, 30, 15, 95)
+    assert isinstance(totals.total, Decimal)
+
+
+def test_aging_pages_largest_debt_first(app, client, database):
+    with app.app_context():
+        _ledger()
+    body = client.get('/receivables/aging').get_data(as_text=True)
+    assert body.index('Partly paid') < body.index('Never paid')
+    assert 'Settled' not in body and 'In credit' not in body
+
+
+def _paid_flags():
+    return {(sale.customer.name, sale.total_amount): sale.is_paid for sale in Sale.query}
+
+
+def test_paid_flags_follow_the_allocation(app_context, database):
+    _ledger()
+    assert sync_sale_paid_flags() == (3, 0)
+    db.session.commit()
+    flags = _paid_flags()
+    assert [flags[('Partly paid', amount)] for amount in (100, 50, 30, 20)] == [True, False, False, False]
+    assert flags[('Settled', 10)] and flags[('In credit', 5)] and not flags[('Never paid', 15)]
+    assert sync_sale_paid_flags() == (0, 0)
+
+    # A payment deleted: the sale it covered is open again
+    Payment.query.filter_by(amount_received=10).delete()
+    db.session.commit()
+    assert sync_sale_paid_flags() == (0, 1)
+    db.session.commit()
+    db.session.expire_all()
+    assert not _paid_flags()[('Settled', 10)]
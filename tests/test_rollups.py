@@ -0,0 +1,90 @@
+# tests/test_rollups.py
+from datetime import date, timedelta
+
+from extensions import db
+from models import CowDailyMilkTotal, DailyMilkTotal, MilkProduction
+from rollups import (cow_milk_total, daily_herd_totals, herd_milk_total, rebuild_milk_rollups, record_milk_added,
+                     record_milk_removed, remove_cow_from_rollups)
+
+TODAY = date.today()
+YESTERDAY = TODAY - timedelta(days=1)
+
+
+def _rollup_rows():
+    herd = sorted((row.date, row.morning_qty_liters, row.evening_qty_liters, row.record_count)
+                  for row in DailyMilkTotal.query)
+    per_cow = sorted((row.cow_id, row.date, row.morning_qty_liters, row.evening_qty_liters, row.record_count)
+                     for row in CowDailyMilkTotal.query)
+    return herd, per_cow
+
+
+def test_rebuild_sums_each_day_and_cow(app_context, seed):
+    rebuild_milk_rollups()
+    db.session.commit()
+    first_cow = seed['cow_ids'][0]
+    assert db.session.get(DailyMilkTotal, TODAY).record_count == 3
+    assert db.session.get(CowDailyMilkTotal, (first_cow, TODAY)).total_daily_quantity() == 9.0
+    assert herd_milk_total(YESTERDAY, TODAY) == 54.0
+    assert cow_milk_total(first_cow, YESTERDAY, TODAY) == 18.0
+    assert [row.date for row in daily_herd_totals(YESTERDAY, TODAY)] == [YESTERDAY, TODAY]
+
+
+def test_incremental_updates_match_a_rebuild(app_context, seed):
+    rebuild_milk_rollups()
+    first_cow, second_cow = seed['cow_ids'][:2]
+    added = MilkProduction(cow_id=first_cow, date=TODAY, morning_qty_liters=2.5, evening_qty_liters=None)
+    db.session.add(added)
+    record_milk_added(first_cow, TODAY, 2.5, None)
+    removed = MilkProduction.query.filter_by(cow_id=second_cow, date=YESTERDAY).one()
+    record_milk_removed(second_cow, YESTERDAY, removed.morning_qty_liters, removed.evening_qty_liters)
+    db.session.delete(removed)
+    db.session.commit()
+    incremental = _rollup_rows()
+
+    rebuild_milk_rollups()
+    db.session.commit()
+    assert _rollup_rows() == incremental
+
+
+def test_removing_a_days_last_record_drops_its_rows(app_context, seed):
+    cow_id = seed['cow_ids'][0]
+    day = TODAY - timedelta(days=30)
+    record_milk_added(cow_id, day, 3.0, 1.0)
+    db.session.commit()
+    assert db.session.get(DailyMilkTotal, day).total_daily_quantity() == 4.0
+
+    record_milk_removed(cow_id, day, 3.0, 1.0)
+    db.session.commit()
+    assert db.session.get(DailyMilkTotal, day) is None
+    assert db.session.get(CowDailyMilkTotal, (cow_id, day)) is None
+
+
+def test_remove_cow_subtracts_its_history(app_context, seed):
+    rebuild_milk_rollups()
+    cow_id = seed['cow_ids'][0]
+    remove_cow_from_rollups(cow_id)
+    db.session.commit()
+    assert CowDailyMilkTotal.query.filter_by(cow_id=cow_id).count() == 0
+    assert db.session.get(DailyMilkTotal, TODAY).record_count == 2
+    assert herd_milk_total(TODAY, TODAY) == 18.0
+
+
+def test_editing_a_record_onto_another_cow_moves_its_rollups(app, client, seed):
+    first_cow, second_cow = seed['cow_ids'][:2]
+    with app.app_context():
+        rebuild_milk_rollups()
+        db.session.commit()
+        record_id = MilkProduction.query.filter_by(cow_id=first_cow, date=TODAY).one().id
+    response = client.post(f'/milk_production/edit/{record_id}', data={
+        'cow_id': str(second_cow), 'date': TODAY.isoformat(), 'morning_qty': '7', 'evening_qty': '1'})
+    assert response.status_code == 302
+    with app.app_context():
+        incremental = _rollup_rows()
+        assert db.session.get(CowDailyMilkTotal, (first_cow, TODAY)) is None
+        assert db.session.get(CowDailyMilkTotal, (second_cow, TODAY)).record_count == 2
+        rebuild_milk_rollups()
+        db.session.commit()
+        assert _rollup_rows() == incremental
+
+    assert client.post(f'/milk_production/edit/{record_id}', data={
+        'cow_id': 'C1', 'date': TODAY.isoformat(), 'morning_qty': '7', 'evening_qty': '1'}).status_code == 400
@@ -0,0 +1,71 @@
+# tests/test_search.py
+from datetime import date, timedelta
+
+import pytest
+
+from extensions import db
+from models import Expense, HealthRecord
+from search import search_records, search_terms
+
+
+def _kinds(query_text, **filters):
+    query, _ = search_records(query_text, **filters)
+    counts = {}
+    for row in query:
+        counts[row.kind] = counts.get(row.kind, 0) + 1
+    return counts
+
+
+def test_search_terms_drop_operators():
+    assert search_terms('cough" OR -rest* NEAR(') == ['cough', 'OR', 'rest', 'NEAR']
+    assert search_terms('') == [] and search_terms(None) == []
+
+
+def test_every_term_must_match_any_source(app_context, seed):
+    assert _kinds('cough') == {'health': 9}
+    assert _kinds('cough rest') == {'health': 9} # Description and treatment are one document
+    assert _kinds('cough booster') == {}
+    assert _kinds('booster') == {'vaccination': 9}
+    assert _kinds('cash') == {'payment': 6}
+    assert _kinds('coughing bale') == {} # Stemmed, but still every term
+    assert _kinds('coughing') == {'health': 9}
+    assert _kinds('bale') == {'expense': 3}
+
+
+@pytest.mark.parametrize('query_text', ['"', 'cough AND', 'NEAR(cough', '*', 'cough OR'])
+def test_search_syntax_is_never_parsed(app_context, seed, query_text):
+    query, _ = search_records(query_text)
+    assert query.count() in (0, 9)
+
+
+def test_filters(app_context, seed):
+    cow_id = seed['cow_ids'][0]
+    assert _kinds('cough', cow_id=cow_id) == {'health': 3}
+    assert _kinds('cash', cow_id=cow_id) == {} # Payments belong to no cow
+    today = date.today()
+    assert _kinds('cough', start_date=today - timedelta(days=1)) == {'health': 6}
+    assert _kinds('cough', end_date=today - timedelta(days=1)) == {'health': 6}
+    assert _kinds('cough booster cash', kinds=['payment']) == {}
+    assert _kinds('cash', kinds=['health', 'expense']) == {}
+    assert _kinds('', kinds=['health']) == {}
+
+
+def test_index_follows_updates_and_deletes(app_context, seed):
+    record = HealthRecord.query.first()
+    record.description = 'limping hoof'
+    db.session.add(Expense(date=date.today(), category='Vet', amount=5, description='hoof trimming'))
+    db.session.commit()
+    assert _kinds('hoof') == {'health': 1, 'expense': 1}
+    assert _kinds('cough') == {'health': 8}
+
+    db.session.delete(record)
+    db.session.commit()
+    assert _kinds('hoof') == {'expense': 1}
+
+
+def test_search_page(client, seed):
+    body = client.get('/search?q=hay').get_data(as_text=True)
+    assert body.count('hay bales') == 3
+    body = client.get('/search?q=cough&kind=payment').get_data(as_text=True)
+    assert 'cough check' not in body
+    assert 'Invalid date format' in client.get('/search?q=cough&start_date=yesterday').get_data(as_text=True)
@@ -0,0 +1,104 @@
+# tests/test_syncapi.py
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+from extensions import db
+from models import ApiToken, Customer, DailyMilkTotal, MilkProduction, Sale, SyncRecord, Vaccination
+from syncapi import create_api_token
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def token(app, seed):
+    with app.app_context():
+        value = create_api_token('milking shed tablet', seed['user_id'])
+        db.session.commit()
+    return value
+
+
+@pytest.fixture
+def api(app, token):
+    client = app.test_client()
+
+    def post(payload, auth=token):
+        return client.post('/api/sync', json=payload, headers={'Authorization': f'Bearer {auth}'})
+    return post
+
+
+def _batch(seed):
+    customer_id = seed['customer_ids'][0]
+    return {
+        'milk': [{'key': 'm-1', 'cow_id': 'C1', 'date': '2020-05-01', 'morning_qty': 6, 'evening_qty': '4.5'}],
+        'health': [{'key': 'h-1', 'cow_id': 'C2', 'date': '2020-05-01', 'description': 'Limping'}],
+        'vaccinations': [{'key': 'v-1', 'cow_id': 'C3', 'vaccine_name': 'FMD', 'vaccination_date': '2020-05-01',
+                          'next_due_date': (TODAY + timedelta(days=365)).isoformat()}],
+        'sales': [{'key': 's-1', 'customer_id': customer_id, 'date': '2020-05-01', 'milk_qty': 3,
+                   'price_per_liter': '0.10'}],
+        'payments': [{'key': 'p-1', 'customer_id': str(customer_id), 'date': '2020-05-02', 'amount': '0.05'}],
+    }
+
+
+def test_token_is_required(app, api, seed):
+    assert api({}, auth='wrong').status_code == 401
+    assert app.test_client().post('/api/sync', json={}).status_code == 401
+
+    with app.app_context():
+        ApiToken.query.update({ApiToken.revoked: True})
+        db.session.commit()
+    assert api({}).status_code == 401
+
+
+def test_batch_is_written_once(app, api, seed):
+    response = api(_batch(seed))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['created'] == {'milk': 1, 'health': 1, 'vaccinations': 1, 'sales': 1, 'payments': 1}
+    assert body['duplicates'] == 0
+
+    resent = api(_batch(seed)).get_json() # e.g. after the first response was lost
+    assert resent['created'] == {} and resent['duplicates'] == 5
+    assert sorted(result['id'] for result in resent['results']) == sorted(result['id'] for result in body['results'])
+
+    with app.app_context():
+        assert SyncRecord.query.count() == 5
+        assert MilkProduction.query.filter_by(date=date(2020, 5, 1)).count() == 1
+        assert db.session.get(DailyMilkTotal, date(2020, 5, 1)).total_daily_quantity() == 10.5
+        assert Sale.query.filter_by(date=date(2020, 5, 1)).one().total_amount == Decimal('0.30')
+        assert db.session.get(Customer, seed['customer_ids'][0]).balance == Decimal('0.25')
+        assert Vaccination.query.filter_by(vaccination_date=date(2020, 5, 1)).one().status == 'Scheduled'
+        assert ApiToken.query.one().last_used_at is not None
+
+
+@pytest.mark.parametrize('change, error', [
+    (lambda batch: batch['milk'][0].update(cow_id='C404'), "Unknown Cow ID 'C404'."),
+    (lambda batch: batch['sales'][0].update(customer_id=9999), 'Unknown customer 9999.'),
+    (lambda batch: batch['payments'][0].update(amount='Infinity'), "'amount' must be a finite number."),
+    (lambda batch: batch['milk'][0].update(morning_qty='NaN'), "'morning_qty' must be a finite number."),
+    (lambda batch: batch['health'][0].update(date='May 1st'), "'date' must be a date in YYYY-MM-DD format."),
+    (lambda batch: batch['health'][0].update(key='m-1'), 'Key repeated within the batch.'),
+])
+def test_one_bad_record_rejects_the_whole_batch(app, api, seed, change, error):
+    batch = _batch(seed)
+    change(batch)
+    response = api(batch)
+    assert response.status_code == 422
+    assert [found['error'] for found in response.get_json()['errors']] == [error]
+    with app.app_context():
+        assert SyncRecord.query.count() == 0
+        assert MilkProduction.query.filter_by(date=date(2020, 5, 1)).count() == 0
+        assert db.session.get(Customer, seed['customer_ids'][0]).balance == Decimal('0.00')
+
+
+def test_malformed_batches_are_refused(api, seed):
+    assert api(['not', 'an', 'object']).status_code == 400
+    assert api({'calves': []}).status_code == 422
+    assert api({'milk': {'key': 'm-1'}}).status_code == 422
+    assert api({'milk': [{'cow_id': 'C1', 'date': '2020-05-01'}]}).status_code == 422
+
+
+def test_batch_size_is_capped(app, api, seed, monkeypatch):
+    monkeypatch.setitem(app.config, 'API_SYNC_MAX_RECORDS', 4)
+    assert api(_batch(seed)).status_code == 413
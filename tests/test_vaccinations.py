@@ -0,0 +1,82 @@
+# tests/test_vaccinations.py
+from datetime import date, timedelta
+
+import pytest
+
+from dashboard import build_dashboard_snapshot
+from extensions import db
+from models import Cow, Vaccination
+from vaccinations import refresh_vaccination_statuses, vaccination_status
+
+TODAY = date(2020, 6, 15)
+WINDOW = 30
+
+
+def _days(n):
+    return TODAY + timedelta(days=n)
+
+
+@pytest.mark.parametrize('next_due, status', [
+    (None, 'Completed'),
+    (_days(-1), 'Overdue'),
+    (TODAY, 'Due'),
+    (_days(WINDOW), 'Due'),
+    (_days(WINDOW + 1), 'Scheduled'),
+])
+def test_status_for_a_new_record(next_due, status):
+    assert vaccination_status(next_due, TODAY, WINDOW) == status
+
+
+def _vaccinate(cow, name, given, next_due, status):
+    record = Vaccination(cow_id=cow.id, vaccine_name=name, vaccination_date=given, next_due_date=next_due,
+                         status=status)
+    db.session.add(record)
+    return record
+
+
+def _statuses():
+    return {record.vaccine_name: record.status for record in Vaccination.query}
+
+
+def test_refresh_moves_only_the_rows_that_changed(app_context, database):
+    cow = Cow(cow_id='C1', name='Bella')
+    db.session.add(cow)
+    db.session.flush()
+    _vaccinate(cow, 'Overdue now', _days(-60), _days(-1), 'Due')
+    _vaccinate(cow, 'Due now', _days(-60), _days(5), 'Scheduled')
+    _vaccinate(cow, 'Still due', _days(-60), _days(10), 'Due')
+    _vaccinate(cow, 'Far out', _days(-1), _days(WINDOW + 1), None)
+    _vaccinate(cow, 'Given by hand', _days(-60), _days(-5), 'Completed')
+    _vaccinate(cow, 'Single dose', _days(-60), None, 'Due')
+    _vaccinate(cow, 'FMD', _days(-200), _days(-20), 'Overdue')
+    _vaccinate(cow, 'FMD', _days(-10), _days(170), 'Scheduled') # The later dose completes the first
+    db.session.commit()
+
+    updated = refresh_vaccination_statuses(TODAY, WINDOW)
+    db.session.commit()
+    assert updated == {'Completed': 2, 'Overdue': 1, 'Due': 1, 'Scheduled': 1}
+    db.session.expire_all()
+    assert _statuses() == {'Overdue now': 'Overdue', 'Due now': 'Due', 'Still due': 'Due', 'Far out': 'Scheduled',
+                           'Given by hand': 'Completed', 'Single dose': 'Completed', 'FMD': 'Scheduled'}
+    assert Vaccination.query.filter_by(vaccine_name='FMD', status='Completed').count() == 1
+
+    # Run again: nothing left to write. Six days on, the window reaches one more dose
+    assert refresh_vaccination_statuses(TODAY, WINDOW) == {'Completed': 0, 'Overdue': 0, 'Due': 0, 'Scheduled': 0}
+    assert refresh_vaccination_statuses(_days(6), WINDOW)['Due'] == 1
+    db.session.rollback()
+
+
+def test_dashboard_lists_due_and_late_refreshed_scheduled_doses(app_context, database):
+    cow = Cow(cow_id='C1', name='Bella')
+    db.session.add(cow)
+    db.session.flush()
+    _vaccinate(cow, 'Due', _days(-60), _days(3), 'Due')
+    _vaccinate(cow, 'Not refreshed yet', _days(-60), _days(2), 'Scheduled') # Status from before the window
+    _vaccinate(cow, 'Later', _days(-60), _days(WINDOW + 5), 'Scheduled')
+    _vaccinate(cow, 'Overdue', _days(-60), _days(-3), 'Overdue')
+    _vaccinate(cow, 'Done', _days(-60), _days(1), 'Completed')
+    db.session.commit()
+
+    snapshot = build_dashboard_snapshot(TODAY, WINDOW)
+    assert [(row.vaccine_name, row.next_due_date) for row in snapshot['upcoming_vaccinations']] == [
+        ('Not refreshed yet', _days(2)), ('Due', _days(3))]
@@ -0,0 +1,94 @@
+# vaccinations.py
+import threading
+from datetime import date, timedelta
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import aliased
+
+from extensions import db
+from models import Vaccination
+
+# 'Scheduled': next dose further out than the due window. 'Completed' is also set by hand.
+VACCINATION_STATUSES = ('Due', 'Overdue', 'Scheduled', 'Completed')
+
+
+def vaccination_status(next_due_date, today, due_window_days):
+    """Status for a new record, matching what refresh_vaccination_statuses() would set."""
+    if next_due_date is None:
+        return 'Completed'
+    if next_due_date < today:
+        return 'Overdue'
+    if next_due_date <= today + timedelta(days=due_window_days):
+        return 'Due'
+    return 'Scheduled'
+
+
+def refresh_vaccination_statuses(today, due_window_days):
+    """
+    Recomputes every vaccination's status with a handful of set-based UPDATEs,
+    each touching only the rows whose status actually changes. Returns
+    {status: rows updated}. The caller commits.
+    """
+    window_end = today + timedelta(days=due_window_days)
+    open_record = or_(Vaccination.status.is_(None), Vaccination.status != 'Completed')
+    later_dose = aliased(Vaccination)
+    updated = {}
+
+    # A later dose of the same vaccine for the same cow completes the earlier record
+    updated['Completed'] = Vaccination.query.filter(open_record, or_(
+        Vaccination.next_due_date.is_(None),
+        exists().where(and_(later_dose.cow_id == Vaccination.cow_id,
+                            later_dose.vaccine_name == Vaccination.vaccine_name,
+                            later_dose.vaccination_date > Vaccination.vaccination_date)),
+    )).update({Vaccination.status: 'Completed'}, synchronize_session=False)
+
+    for status, in_range in (
+        ('Overdue', Vaccination.next_due_date < today),
+        ('Due', and_(Vaccination.next_due_date >= today, Vaccination.next_due_date <= window_end)),
+        ('Scheduled', Vaccination.next_due_date > window_end),
+    ):
+        updated[status] = Vaccination.query.filter(
+            in_range, open_record, or_(Vaccination.status.is_(None), Vaccination.status != status)
+        ).update({Vaccination.status: status}, synchronize_session=False)
+    return updated
+
+
+def init_status_timer(app):
+    """
+    With VACCINATION_STATUS_INTERVAL > 0 (the default: daily), each worker
+    refreshes statuses on a daemon timer thread, started on its first request
+    (so CLI commands and the preloading gunicorn master never run it). The
+    UPDATEs are idempotent, so several workers doing this is harmless. With 0,
+    schedule `flask refresh-vaccination-statuses` (e.g. daily via cron).
+    """
+    interval_seconds = app.config['VACCINATION_STATUS_INTERVAL']
+    if interval_seconds <= 0:
+        return
+    started = []
+    lock = threading.Lock()
+
+    def _run():
+        with app.app_context():
+            try:
+                refresh_vaccination_statuses(date.today(), app.config['VACCINATION_DUE_WINDOW_DAYS'])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Vaccination status refresh failed')
+            finally:
+                db.session.remove()
+        _schedule(interval_seconds)
+
+    def _schedule(delay):
+        timer = threading.Timer(delay, _run)
+        timer.daemon = True
+        timer.start()
+
+    @app.before_request
+    def _start_status_timer():
+        if started:
+            return
+        with lock:
+            if not started:
+                started.append(True)
+                _schedule(0)